@@ -0,0 +1,225 @@
+"""Incrementally build the VOC-style KITTI dataset used by tf-faster-rcnn.
+
+    python build_dataset.py --labels E:/KITTI/labels \
+        --voc tf-faster-rcnn1/data/VOCdevkit2007/VOC2007 \
+        --cache tf-faster-rcnn1/data/cache
+
+Replaces running modify_annotations_txt.py, txt_to_xml.py and
+create_train_test_txt.py over the whole dataset. The raw KITTI labels are
+never rewritten: the class table is applied while converting. A manifest
+(manifest.py) records the content hash of every label and image and what
+each derived artifact was built from, so a rebuild only regenerates:
+
+- the XML, size-index and gt roidb entries of images whose label or image
+  changed,
+- the split lists when images were added or removed (existing images keep
+  their split),
+- the <prefix>_<split>_gt_roidb.pkl caches whose images changed, and the
+  voc_eval annotations cache when any XML changed,
+
+instead of clearing the whole data/cache directory.
+"""
+import argparse
+import json
+import math
+import os
+import pickle
+import random
+
+from kitti_index import CLASS_MAP
+from manifest import Manifest
+import txt_to_xml
+
+SPLITS = ('trainval', 'train', 'val', 'test')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build the KITTI VOC dataset')
+    parser.add_argument('--labels', required=True, help='raw KITTI label dir')
+    parser.add_argument('--voc', required=True,
+                        help='VOC2007 dir holding JPEGImages, Annotations '
+                             'and ImageSets')
+    parser.add_argument('--cache', required=True,
+                        help='tf-faster-rcnn data/cache dir')
+    parser.add_argument('--prefix', default='voc_2007',
+                        help='imdb name prefix of the gt roidb caches')
+    parser.add_argument('--categories', nargs='+',
+                        default=['Car', 'Pedestrian'])
+    parser.add_argument('--trainval', type=float, default=9 / 10.0)
+    parser.add_argument('--train', type=float, default=8 / 9.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--ext', default='.jpg', help='image extension')
+    return parser.parse_args()
+
+
+def load_pickle(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def dump_pickle(obj, path):
+    with open(path, 'wb') as f:
+        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+
+
+def read_splits(main_dir):
+    splits = {}
+    for split in SPLITS:
+        path = os.path.join(main_dir, split + '.txt')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            splits[split] = [x.strip() for x in f if x.strip()]
+    return splits
+
+
+def update_splits(splits, names, trainval_frac, train_frac, rng):
+    """Drop removed images from splits and assign the new ones at random."""
+    if splits is None:
+        splits = {split: [] for split in SPLITS}
+        assigned = set()
+    else:
+        assigned = set(splits['trainval']) | set(splits['test'])
+    name_set = set(names)
+    splits = {split: [n for n in members if n in name_set]
+              for split, members in splits.items()}
+    new = sorted(name_set - assigned)
+    rng.shuffle(new)
+    num_trainval = int(math.floor(len(new) * trainval_frac))
+    num_train = int(math.floor(num_trainval * train_frac))
+    splits['train'] += new[:num_train]
+    splits['val'] += new[num_train:num_trainval]
+    splits['trainval'] += new[:num_trainval]
+    splits['test'] += new[num_trainval:]
+    return {split: sorted(members) for split, members in splits.items()}
+
+
+def write_splits(main_dir, splits, categories, classes, entries):
+    if not os.path.isdir(main_dir):
+        os.makedirs(main_dir)
+    for split, members in splits.items():
+        with open(os.path.join(main_dir, split + '.txt'), 'w') as f:
+            f.write(''.join(n + '\n' for n in members))
+        for category in categories:
+            cls = classes.index(category.lower())
+            path = os.path.join(main_dir, category + '_' + split + '.txt')
+            with open(path, 'w') as f:
+                for n in members:
+                    present = (entries[n]['gt_classes'] == cls).any()
+                    f.write('{} {}\n'.format(n, ' 1' if present else '-1'))
+
+
+def build(args):
+    classes = ('__background__',) + tuple(c.lower() for c in args.categories)
+    images_dir = os.path.join(args.voc, 'JPEGImages')
+    annotations_dir = os.path.join(args.voc, 'Annotations')
+    main_dir = os.path.join(args.voc, 'ImageSets', 'Main')
+    sizes_file = os.path.join(args.voc, 'sizes.json')
+    entries_file = os.path.join(args.cache, args.prefix + '_gt_entries.pkl')
+    for d in (annotations_dir, args.cache):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+    manifest = Manifest(os.path.join(args.voc, 'manifest.json'))
+    sizes = {}
+    if os.path.exists(sizes_file):
+        with open(sizes_file) as f:
+            sizes = json.load(f)
+    entries = load_pickle(entries_file, {})
+
+    # Hash the sources, only files whose size or mtime changed are read
+    names = txt_to_xml.list_labels(args.labels)
+    label_hash = {}
+    image_hash = {}
+    for n in names:
+        label_hash[n] = manifest.source_hash(
+            os.path.join(args.labels, n + '.txt'))
+        image_hash[n] = manifest.source_hash(
+            os.path.join(images_dir, n + args.ext))
+
+    # Per-image artifacts, also rebuilt when the class setup changes
+    config = ','.join(classes) + ';' + json.dumps(CLASS_MAP, sort_keys=True)
+    stale = [n for n in names
+             if manifest.is_stale('xml/' + n,
+                                  {'label': label_hash[n], 'image': image_hash[n],
+                                   'config': config},
+                                  os.path.join(annotations_dir, n + '.xml'))
+             or manifest.is_stale('size/' + n, {'image': image_hash[n]})
+             or n not in sizes
+             or manifest.is_stale('entry/' + n,
+                                  {'label': label_hash[n], 'config': config})
+             or n not in entries]
+    print('{:d} of {:d} images changed'.format(len(stale), len(names)))
+    if stale:
+        new_sizes, new_entries = txt_to_xml.convert(
+            args.labels, images_dir, annotations_dir, classes=classes,
+            names=stale, workers=args.workers, image_ext=args.ext,
+            class_map=CLASS_MAP, entries=True)
+        for n, size, entry in zip(stale, new_sizes, new_entries):
+            sizes[n] = size
+            entries[n] = entry
+            manifest.record('xml/' + n, {'label': label_hash[n],
+                                         'image': image_hash[n],
+                                         'config': config})
+            manifest.record('size/' + n, {'image': image_hash[n]})
+            manifest.record('entry/' + n, {'label': label_hash[n],
+                                           'config': config})
+
+    # Drop the artifacts of removed images
+    name_set = set(names)
+    removed = [a.split('/', 1)[1] for a in manifest.artifact_names('entry/')
+               if a.split('/', 1)[1] not in name_set]
+    for n in removed:
+        xml_path = os.path.join(annotations_dir, n + '.xml')
+        if os.path.exists(xml_path):
+            os.remove(xml_path)
+        sizes.pop(n, None)
+        entries.pop(n, None)
+        for kind in ('xml/', 'size/', 'entry/'):
+            manifest.forget(kind + n)
+    if removed:
+        print('removed {:d} images'.format(len(removed)))
+
+    if stale or removed:
+        with open(sizes_file, 'w') as f:
+            json.dump(sizes, f)
+        dump_pickle(entries, entries_file)
+
+    # Split lists, rewritten when images or their labels changed
+    splits = read_splits(main_dir)
+    if splits is None or stale or removed:
+        splits = update_splits(splits, names, args.trainval, args.train,
+                               random.Random(args.seed))
+        write_splits(main_dir, splits, args.categories, classes, entries)
+
+    # gt roidb caches, one per split
+    for split, members in splits.items():
+        inputs = {n: label_hash[n] for n in members}
+        inputs['__members__'] = ','.join(members)
+        inputs['__config__'] = config
+        cache_file = os.path.join(args.cache, '{}_{}_gt_roidb.pkl'.format(
+            args.prefix, split))
+        if manifest.is_stale('gt_roidb/' + split, inputs, cache_file):
+            dump_pickle([entries[n] for n in members], cache_file)
+            manifest.record('gt_roidb/' + split, inputs)
+            print('wrote gt roidb to {}'.format(cache_file))
+
+    # voc_eval caches the parsed XML of the test images under one fixed name
+    annots_file = os.path.join(os.path.dirname(os.path.normpath(args.voc)),
+                               'annotations_cache', 'imagesetfile_annots.pkl')
+    inputs = {n: label_hash[n] for n in names}
+    inputs['__config__'] = config
+    if manifest.is_stale('annotations_cache', inputs):
+        if os.path.exists(annots_file):
+            os.remove(annots_file)
+            print('invalidated {}'.format(annots_file))
+        manifest.record('annotations_cache', inputs)
+
+    manifest.save()
+
+
+if __name__ == '__main__':
+    build(parse_args())
@@ -1,70 +1,41 @@
-import pdb  
-import glob  
-import os  
-import random  
-import math  
-  
-def get_sample_value(txt_name, category_name):  
-    label_path = 'E:/KITTI/labels'  
-    txt_path = label_path + txt_name+'.txt'  
-    try:  
-        with open(txt_path) as r_tdf:  
-            if category_name in r_tdf.read():  
-                return ' 1'  
-            else:  
-                return '-1'  
-    except IOError as ioerr:  
-        print('File error:'+str(ioerr))  
-  
-txt_list_path = glob.glob('E:/KITTI/labels/*.txt')  
-txt_list = []  
-  
-for item in txt_list_path:  
-    temp1,temp2 = os.path.splitext(os.path.basename(item))  
-    txt_list.append(temp1)  
-txt_list.sort()  
-print(txt_list, end = '\n\n')  
-  
-# 有博客建议train:val:test=8:1:1，先尝试用一下  
-num_trainval = random.sample(txt_list, math.floor(len(txt_list)*9/10.0)) # 可修改百分比  
-num_trainval.sort()  
-print(num_trainval, end = '\n\n')  
-  
-num_train = random.sample(num_trainval,math.floor(len(num_trainval)*8/9.0)) # 可修改百分比  
-num_train.sort()  
-print(num_train, end = '\n\n')  
-  
-num_val = list(set(num_trainval).difference(set(num_train)))  
-num_val.sort()  
-print(num_val, end = '\n\n')  
-  
-num_test = list(set(txt_list).difference(set(num_trainval)))  
-num_test.sort()  
-print(num_test, end = '\n\n')  
-  
-pdb.set_trace()  
-  
-Main_path = 'E:/KITTI/ImageSets/Main'  
-train_test_name = ['trainval','train','val','test']  
-category_name = ['Car','Pedestrian']#修改类别  
-  
-# 循环写trainvl train val test  
-for item_train_test_name in train_test_name:  
-    list_name = 'num_'  
-    list_name += item_train_test_name  
-    train_test_txt_name = Main_path + item_train_test_name + '.txt'   
-    try:  
-        # 写单个文件  
-        with open(train_test_txt_name, 'w') as w_tdf:  
-            # 一行一行写  
-            for item in eval(list_name):  
-                w_tdf.write(item+'\n')  
-        # 循环写Car Pedestrian Cyclist  
-        for item_category_name in category_name:  
-            category_txt_name = Main_path + item_category_name + '_' + item_train_test_name + '.txt'  
-            with open(category_txt_name, 'w') as w_tdf:  
-                # 一行一行写  
-                for item in eval(list_name):  
-                    w_tdf.write(item+' '+ get_sample_value(item, item_category_name)+'\n')  
-    except IOError as ioerr:  
-        print('File error:'+str(ioerr))  
\ No newline at end of file
+"""Write the ImageSets/Main split files of the converted KITTI dataset.
+
+The trainval/train/val/test lists and the per-category <cat>_<split>.txt
+lists are all written from one kitti_index.LabelIndex, so each label file is
+read at most once (and not at all when the saved index is given).
+"""
+import argparse
+import os
+
+from kitti_index import LabelIndex
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Create the KITTI splits')
+    parser.add_argument('--labels', default='E:/KITTI/labels',
+                        help='KITTI label txt dir')
+    parser.add_argument('--index', default=None,
+                        help='label index saved by modify_annotations_txt.py, '
+                             'used instead of re-reading the labels')
+    parser.add_argument('--main', default='E:/KITTI/ImageSets/Main',
+                        help='output ImageSets/Main dir')
+    parser.add_argument('--categories', nargs='+',
+                        default=['Car', 'Pedestrian'])  # 修改类别
+    # 有博客建议train:val:test=8:1:1，先尝试用一下
+    parser.add_argument('--trainval', type=float, default=9 / 10.0)
+    parser.add_argument('--train', type=float, default=8 / 9.0)
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.index is not None and os.path.exists(args.index):
+        index = LabelIndex.load(args.index)
+    else:
+        index = LabelIndex.build(args.labels)
+
+    splits = index.split(args.trainval, args.train, args.seed)
+    for name in ('trainval', 'train', 'val', 'test'):
+        print('{}: {:d} images'.format(name, len(splits[name])))
+    index.write_splits(args.main, splits, args.categories)
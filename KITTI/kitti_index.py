@@ -0,0 +1,184 @@
+"""In-memory index of all KITTI label files.
+
+One pass over the labels directory parses every object into flat arrays
+(image, class, box, truncation, occlusion), grouped by image through an
+offsets array so that the objects of image i are rows
+offsets[i]:offsets[i + 1]. The class remapping, the category statistics and
+the ImageSets/Main split files are all computed from these arrays instead of
+re-reading the label files, and the index can be saved to .npz and reused by
+the dataset loader.
+"""
+import math
+import os
+import random
+
+import numpy as np
+
+# 合并汽车类和行人类，忽略DontCare和Misc类
+CLASS_MAP = {'Car': 'car', 'Van': 'car', 'Truck': 'car', 'Tram': 'car',
+             'Pedestrian': 'pedestrian', 'Person_sitting': 'pedestrian',
+             'Cyclist': 'pedestrian',
+             'DontCare': None, 'Misc': None}
+
+
+class LabelIndex(object):
+    """Flat arrays holding every object of a set of KITTI label files."""
+
+    def __init__(self, names, offsets, classes, boxes, truncation, occlusion,
+                 alpha, extra):
+        self.names = list(names)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.classes = np.asarray(classes)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape((-1, 4))
+        self.truncation = np.asarray(truncation, dtype=np.float32)
+        self.occlusion = np.asarray(occlusion, dtype=np.int8)
+        self.alpha = np.asarray(alpha, dtype=np.float32)
+        # the fields after the box (3D dimensions, location, rotation, ...)
+        self.extra = np.asarray(extra)
+        self._name_to_ind = dict(zip(self.names, range(len(self.names))))
+
+    @classmethod
+    def build(cls, labels_dir, names=None):
+        """Parse the label files of names (default: all) in one pass."""
+        if names is None:
+            names = sorted(os.path.splitext(e.name)[0]
+                           for e in os.scandir(labels_dir)
+                           if e.name.endswith('.txt'))
+        counts = np.zeros((len(names),), dtype=np.int64)
+        fields = []
+        for i, name in enumerate(names):
+            with open(os.path.join(labels_dir, name + '.txt')) as f:
+                lines = [line.split() for line in f.read().splitlines()]
+            lines = [line for line in lines if line]
+            counts[i] = len(lines)
+            fields.extend(lines)
+        offsets = np.zeros((len(names) + 1,), dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        classes = np.array([f[0] for f in fields], dtype=np.str_)
+        numbers = np.array([f[1:8] for f in fields],
+                           dtype=np.float32).reshape((-1, 7))
+        extra = np.array([' '.join(f[8:]) for f in fields], dtype=np.str_)
+        return cls(names, offsets, classes, numbers[:, 3:7], numbers[:, 0],
+                   numbers[:, 1], numbers[:, 2], extra)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['names'], data['offsets'], data['classes'],
+                   data['boxes'], data['truncation'], data['occlusion'],
+                   data['alpha'], data['extra'])
+
+    def save(self, path):
+        np.savez(path, names=np.array(self.names, dtype=np.str_),
+                 offsets=self.offsets, classes=self.classes, boxes=self.boxes,
+                 truncation=self.truncation, occlusion=self.occlusion,
+                 alpha=self.alpha, extra=self.extra)
+
+    @property
+    def num_images(self):
+        return len(self.names)
+
+    @property
+    def image_ids(self):
+        """Image index of every object."""
+        return np.repeat(np.arange(self.num_images), np.diff(self.offsets))
+
+    def category_counts(self):
+        """Return {class: number of objects}."""
+        values, counts = np.unique(self.classes, return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
+
+    def select(self, keep):
+        """Return a new index with only the objects where keep is True."""
+        counts = np.bincount(self.image_ids[keep], minlength=self.num_images)
+        offsets = np.zeros((self.num_images + 1,), dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return LabelIndex(self.names, offsets, self.classes[keep],
+                          self.boxes[keep], self.truncation[keep],
+                          self.occlusion[keep], self.alpha[keep],
+                          self.extra[keep])
+
+    def remap(self, table=CLASS_MAP):
+        """Rename the classes through table, dropping those mapped to None.
+
+        The table is applied once per distinct class name, classes not in
+        the table are kept unchanged.
+        """
+        values, inverse = np.unique(self.classes, return_inverse=True)
+        mapped = [table.get(v, v) for v in values.tolist()]
+        keep_value = np.array([m is not None for m in mapped], dtype=bool)
+        new_values = np.array([m if m is not None else '' for m in mapped],
+                              dtype=np.str_)
+        keep = keep_value[inverse]
+        index = self.select(keep)
+        index.classes = new_values[inverse[keep]]
+        return index
+
+    def objects(self, name):
+        """Return the objects of an image as txt_to_xml.parse_label_file does."""
+        i = self._name_to_ind[name]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return [{'name': str(self.classes[j]),
+                 'truncated': float(self.truncation[j]),
+                 'occluded': int(self.occlusion[j]),
+                 'alpha': float(self.alpha[j]),
+                 'bbox': self.boxes[j].tolist()}
+                for j in range(start, end)]
+
+    def gt_roidb(self, classes, names=None):
+        """Return the gt roidb entries of names (default: all images), the
+        same entries txt_to_xml writes to the roidb cache."""
+        from txt_to_xml import roidb_entry
+        classes = tuple(c.lower() for c in classes)
+        if names is None:
+            names = self.names
+        return [roidb_entry(self.objects(name), classes) for name in names]
+
+    def presence(self, category):
+        """Boolean per image: whether it holds an object of category."""
+        present = np.zeros((self.num_images,), dtype=bool)
+        mask = np.char.lower(self.classes) == category.lower()
+        present[self.image_ids[mask]] = True
+        return present
+
+    def write_label_files(self, labels_dir):
+        """Write the (remapped) objects back as KITTI label files."""
+        for i, name in enumerate(self.names):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            with open(os.path.join(labels_dir, name + '.txt'), 'w') as f:
+                for j in range(start, end):
+                    line = '{} {:.2f} {:d} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f}'.format(
+                        self.classes[j], self.truncation[j],
+                        int(self.occlusion[j]), self.alpha[j],
+                        *self.boxes[j].tolist())
+                    if self.extra[j]:
+                        line += ' ' + self.extra[j]
+                    f.write(line + '\n')
+
+    def split(self, trainval_frac=0.9, train_frac=8 / 9.0, seed=None):
+        """Randomly split the image names into trainval/train/val/test."""
+        rng = random.Random(seed)
+        names = sorted(self.names)
+        trainval = sorted(rng.sample(names, math.floor(len(names) * trainval_frac)))
+        train = sorted(rng.sample(trainval, math.floor(len(trainval) * train_frac)))
+        val = sorted(set(trainval).difference(train))
+        test = sorted(set(names).difference(trainval))
+        return {'trainval': trainval, 'train': train, 'val': val, 'test': test}
+
+    def write_splits(self, main_dir, splits, categories):
+        """Write ImageSets/Main/<split>.txt and <category>_<split>.txt."""
+        if not os.path.isdir(main_dir):
+            os.makedirs(main_dir)
+        presence = {c: self.presence(c) for c in categories}
+        for split_name, names in splits.items():
+            with open(os.path.join(main_dir, split_name + '.txt'), 'w') as f:
+                f.write(''.join(name + '\n' for name in names))
+            inds = np.array([self._name_to_ind[n] for n in names],
+                            dtype=np.int64)
+            for category in categories:
+                flags = np.where(presence[category][inds], ' 1', '-1')
+                path = os.path.join(main_dir, category + '_' + split_name + '.txt')
+                with open(path, 'w') as f:
+                    f.write(''.join('{} {}\n'.format(n, flag)
+                                    for n, flag in zip(names, flags)))
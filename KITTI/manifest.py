@@ -0,0 +1,85 @@
+"""Content-hash manifest for incremental dataset builds.
+
+The manifest is a JSON file recording the sha1 of every source file (label
+txt, image) and, for every derived artifact (XML, size-index entry, roidb
+cache, ...), a digest of the source hashes it was built from. An artifact
+only needs rebuilding when it is missing or that digest changed.
+
+Source hashes are cached together with the file size and mtime, so that an
+unchanged file is not read again on the next build.
+"""
+import hashlib
+import json
+import os
+
+
+def file_hash(path, blocksize=1 << 20):
+    """Return the sha1 hex digest of the content of path."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def inputs_digest(inputs):
+    """Return one digest for a {name: hash} dict of inputs."""
+    h = hashlib.sha1()
+    for key in sorted(inputs):
+        h.update('{}:{}\n'.format(key, inputs[key]).encode('utf-8'))
+    return h.hexdigest()
+
+
+class Manifest(object):
+    """Source hashes and artifact input digests of one dataset build."""
+
+    def __init__(self, path):
+        self.path = path
+        self.sources = {}
+        self.artifacts = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.sources = data.get('sources', {})
+            self.artifacts = data.get('artifacts', {})
+
+    def source_hash(self, path):
+        """Return the content hash of a source file, rehashing it only if its
+        size or mtime changed since it was last recorded."""
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        record = self.sources.get(key)
+        if (record is not None and record['size'] == st.st_size and
+                record['mtime'] == st.st_mtime):
+            return record['sha1']
+        digest = file_hash(path)
+        self.sources[key] = {'size': st.st_size, 'mtime': st.st_mtime,
+                             'sha1': digest}
+        return digest
+
+    def is_stale(self, artifact, inputs, path=None):
+        """Whether artifact has to be rebuilt from inputs ({name: hash}).
+
+        path is the file holding the artifact, if any; a missing file makes
+        the artifact stale as well.
+        """
+        if path is not None and not os.path.exists(path):
+            return True
+        return self.artifacts.get(artifact) != inputs_digest(inputs)
+
+    def record(self, artifact, inputs):
+        """Record that artifact was built from inputs."""
+        self.artifacts[artifact] = inputs_digest(inputs)
+
+    def forget(self, artifact):
+        self.artifacts.pop(artifact, None)
+
+    def artifact_names(self, prefix):
+        return [a for a in self.artifacts if a.startswith(prefix)]
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'sources': self.sources, 'artifacts': self.artifacts},
+                      f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
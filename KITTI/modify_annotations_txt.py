@@ -1,51 +1,41 @@
-import glob  
-  
-txt_list = glob.glob('E:/KITTI/labels/*.txt') # 存储Labels文件夹所有txt文件路径  
-def show_category(txt_list):  
-    category_list= []  
-    for item in txt_list:  
-        try:  
-            with open(item) as tdf:  
-                for each_line in tdf:  
-                    labeldata = each_line.strip().split(' ') # 去掉前后多余的字符并把其分开  
-                    category_list.append(labeldata[0]) # 只要第一个字段，即类别  
-        except IOError as ioerr:  
-            print('File error:'+str(ioerr))  
-    print(set(category_list)) # 输出集合  
-  
-def merge(line):  
-    each_line=''  
-    for i in range(len(line)):  
-        if i!= (len(line)-1):  
-            each_line=each_line+line[i]+' '  
-        else:  
-            each_line=each_line+line[i] # 最后一条字段后面不加空格  
-    each_line=each_line+'\n'  
-    return (each_line)  
-  
-print('before modify categories are:\n')  
-show_category(txt_list)  
-  
-for item in txt_list:  
-    new_txt=[]  
-    try:  
-        with open(item, 'r') as r_tdf:  
-            for each_line in r_tdf:  
-                labeldata = each_line.strip().split(' ')  
-                if labeldata[0] in ['Truck','Van','Tram','Car']: # 合并汽车类  
-                    labeldata[0] = labeldata[0].replace(labeldata[0],'car')  
-                if labeldata[0] in ['Person_sitting','Cyclist','Pedestrian']: # 合并行人类  
-                    labeldata[0] = labeldata[0].replace(labeldata[0],'pedestrian')  
-                if labeldata[0] == 'DontCare': # 忽略Dontcare类  
-                    continue  
-                if labeldata[0] == 'Misc': # 忽略Misc类  
-                    continue  
-                new_txt.append(merge(labeldata)) # 重新写入新的txt文件  
-        with open(item,'w+') as w_tdf: # w+是打开原文件将内容删除，另写新内容进去  
-            for temp in new_txt:  
-                w_tdf.write(temp)  
-    except IOError as ioerr:  
-        print('File error:'+str(ioerr))  
-  
-print('\nafter modify categories are:\n')  
-show_category(txt_list)  
\ No newline at end of file
+"""Merge the KITTI classes into car/pedestrian and drop DontCare/Misc.
+
+All label files are parsed once into a kitti_index.LabelIndex, the class
+table is applied to the index and the label files are rewritten from it.
+The remapped index is also saved next to the labels for the later steps.
+"""
+import argparse
+import os
+
+from kitti_index import LabelIndex, CLASS_MAP
+
+
+def show_category(index):
+    print(index.category_counts())  # 输出每个类别的数量
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Remap the KITTI classes')
+    parser.add_argument('--labels', default='E:/KITTI/labels',
+                        help='KITTI label txt dir, rewritten in place')
+    parser.add_argument('--index', default=None,
+                        help='where to save the remapped label index '
+                             '(default: <labels>/../label_index.npz)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    index_file = args.index or os.path.join(os.path.dirname(
+        os.path.abspath(args.labels)), 'label_index.npz')
+
+    index = LabelIndex.build(args.labels)
+    print('before modify categories are:\n')
+    show_category(index)
+
+    index = index.remap(CLASS_MAP)
+    index.write_label_files(args.labels)
+    index.save(index_file)
+
+    print('\nafter modify categories are:\n')
+    show_category(index)
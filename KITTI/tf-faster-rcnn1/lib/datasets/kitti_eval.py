@@ -0,0 +1,191 @@
+# --------------------------------------------------------
+# Tensorflow Faster R-CNN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""2D detection AP following the KITTI object benchmark protocol.
+
+The ground truth is read from the raw KITTI label files, since the VOC
+annotations do not keep the occlusion level. Every object is rated Easy,
+Moderate or Hard from its box height, truncation and occlusion:
+
+  - objects of the class too hard for a difficulty level, and objects of
+    the neighbouring class (Van for Car, Person_sitting for Pedestrian), are
+    ignored: detecting them is neither a true nor a false positive,
+  - false positives inside DontCare regions or lower than the minimum
+    height are ignored,
+  - a detection is a true positive above a per-class IoU (0.7 for Car, 0.5
+    for Pedestrian), and AP is the precision averaged over 40 recall
+    positions.
+
+Detections are matched in score order to their best overlapping ground truth
+as in voc_eval, for all images at once. The results are close to the
+official devkit, which matches ground truth in label order, but may differ
+slightly.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import numpy as np
+
+DIFFICULTIES = ('easy', 'moderate', 'hard')
+MIN_HEIGHT = (40, 25, 25)
+MAX_OCCLUSION = (0, 1, 2)
+MAX_TRUNCATION = (0.15, 0.3, 0.5)
+
+MIN_OVERLAP = {'Car': 0.7, 'Van': 0.7, 'Truck': 0.7,
+               'Pedestrian': 0.5, 'Person_sitting': 0.5, 'Cyclist': 0.5}
+NEIGHBOR_CLASSES = {'Car': ('Van',), 'Pedestrian': ('Person_sitting',)}
+
+NUM_RECALL_POSITIONS = 40
+
+
+class KittiLabels(object):
+  """The objects of a set of raw KITTI label files as flat arrays, the
+  objects of image i (in image_index order) being those with images == i."""
+
+  def __init__(self, images, types, truncation, occlusion, boxes):
+    self.images = np.asarray(images, dtype=np.int64)
+    self.types = np.asarray(types, dtype=np.str_)
+    self.truncation = np.asarray(truncation, dtype=np.float32)
+    self.occlusion = np.asarray(occlusion, dtype=np.int64)
+    self.boxes = np.asarray(boxes, dtype=np.float64).reshape((-1, 4))
+
+  @classmethod
+  def load(cls, label_dir, image_index):
+    images, fields = [], []
+    for i, index in enumerate(image_index):
+      with open(os.path.join(label_dir, index + '.txt')) as f:
+        lines = [line.split() for line in f]
+      lines = [line for line in lines if line]
+      images.extend([i] * len(lines))
+      fields.extend(lines)
+    numbers = np.array([f[1:8] for f in fields],
+                       dtype=np.float64).reshape((-1, 7))
+    return cls(images, [f[0] for f in fields], numbers[:, 0], numbers[:, 1],
+               numbers[:, 3:7])
+
+  def subset(self, mask):
+    return KittiLabels(self.images[mask], self.types[mask],
+                       self.truncation[mask], self.occlusion[mask],
+                       self.boxes[mask])
+
+
+def _image_pairs(det_images, box_images):
+  """All (det, box) index pairs of the same image, for boxes sorted by
+  image."""
+  num_images = max(det_images.max(initial=-1), box_images.max(initial=-1)) + 1
+  counts = np.bincount(box_images, minlength=num_images)
+  starts = np.zeros((num_images + 1,), dtype=np.int64)
+  np.cumsum(counts, out=starts[1:])
+  per_det = counts[det_images]
+  pair_det = np.repeat(np.arange(det_images.size), per_det)
+  # position of every pair within the boxes of its det
+  first = np.repeat(np.cumsum(per_det) - per_det, per_det)
+  pair_box = starts[det_images][pair_det] + np.arange(pair_det.size) - first
+  return pair_det, pair_box
+
+
+def _intersection(a, b):
+  iw = np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+  ih = np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+  return np.maximum(iw, 0) * np.maximum(ih, 0)
+
+
+def _area(a):
+  return (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+
+
+def kitti_ap(rec, prec, num_positions=NUM_RECALL_POSITIONS):
+  """Precision interpolated at num_positions equally spaced recall
+  positions (excluding 0), averaged."""
+  if rec.size == 0:
+    return 0.
+  # make precision monotonically decreasing
+  mprec = np.maximum.accumulate(prec[::-1])[::-1]
+  positions = np.arange(1, num_positions + 1) / float(num_positions)
+  inds = np.searchsorted(rec, positions, side='left')
+  p = np.zeros((num_positions,))
+  valid = inds < rec.size
+  p[valid] = mprec[inds[valid]]
+  return p.mean()
+
+
+def kitti_eval(det_images, det_scores, det_boxes, labels, classname,
+               min_overlap=None):
+  """Evaluate the detections of one class at the three difficulty levels.
+
+  det_images: (D,) image index (into labels) of every detection
+  det_scores: (D,) detection scores
+  det_boxes: (D, 4) detection boxes (x1, y1, x2, y2) in KITTI pixels
+  labels: KittiLabels of the evaluated images
+  classname: KITTI object type, e.g. 'Car'
+
+  Returns a dict mapping each difficulty to (rec, prec, ap).
+  """
+  if min_overlap is None:
+    min_overlap = MIN_OVERLAP[classname]
+  det_images = np.asarray(det_images, dtype=np.int64)
+  det_scores = np.asarray(det_scores, dtype=np.float64)
+  det_boxes = np.asarray(det_boxes, dtype=np.float64).reshape((-1, 4))
+  order = np.argsort(-det_scores, kind='stable')
+  det_images, det_scores, det_boxes = \
+    det_images[order], det_scores[order], det_boxes[order]
+
+  # Ground truth a detection can match: the class and its neighbours
+  candidate_types = (classname,) + NEIGHBOR_CLASSES.get(classname, ())
+  gt = labels.subset(np.in1d(labels.types, candidate_types))
+  gt = gt.subset(np.argsort(gt.images, kind='stable'))
+  dontcare = labels.subset(labels.types == 'DontCare')
+  dontcare = dontcare.subset(np.argsort(dontcare.images, kind='stable'))
+
+  # Best ground truth of every detection, ties to the first one
+  pair_det, pair_gt = _image_pairs(det_images, gt.images)
+  inter = _intersection(det_boxes[pair_det], gt.boxes[pair_gt])
+  iou = inter / (_area(det_boxes)[pair_det] + _area(gt.boxes)[pair_gt] - inter)
+  best = np.lexsort((pair_gt, -iou, pair_det))
+  best = best[np.unique(pair_det[best], return_index=True)[1]]
+  det_gt = np.full((det_images.size,), -1, dtype=np.int64)
+  det_iou = np.zeros((det_images.size,))
+  det_gt[pair_det[best]] = pair_gt[best]
+  det_iou[pair_det[best]] = iou[best]
+  matched = det_iou > min_overlap
+
+  # Detections covered by a DontCare region (intersection over det area)
+  pair_det, pair_dc = _image_pairs(det_images, dontcare.images)
+  covered = _intersection(det_boxes[pair_det], dontcare.boxes[pair_dc]) / \
+            np.maximum(_area(det_boxes)[pair_det], np.finfo(np.float64).eps)
+  in_dontcare = np.zeros((det_images.size,), dtype=bool)
+  in_dontcare[pair_det[covered > min_overlap]] = True
+
+  gt_height = gt.boxes[:, 3] - gt.boxes[:, 1]
+  det_height = det_boxes[:, 3] - det_boxes[:, 1]
+  results = {}
+  for level, difficulty in enumerate(DIFFICULTIES):
+    too_hard = ((gt.occlusion > MAX_OCCLUSION[level]) |
+                (gt.truncation > MAX_TRUNCATION[level]) |
+                (gt_height <= MIN_HEIGHT[level]))
+    gt_valid = (gt.types == classname) & ~too_hard
+    npos = int(gt_valid.sum())
+
+    # The first (highest scoring) detection matching a valid gt box is a
+    # true positive, the following ones are duplicates
+    hit = matched.copy()
+    hit[matched] = gt_valid[det_gt[matched]]
+    tp = np.zeros((det_images.size,), dtype=bool)
+    hit_inds = np.where(hit)[0]
+    tp[hit_inds[np.unique(det_gt[hit_inds], return_index=True)[1]]] = True
+    # Detections of ignored gt boxes count neither way, and false positives
+    # in DontCare regions or lower than the minimum height are dropped
+    fp = ~tp & ~(matched & ~hit)
+    fp &= ~in_dontcare & (det_height >= MIN_HEIGHT[level])
+    keep = tp | fp
+
+    tp = np.cumsum(tp[keep])
+    fp = np.cumsum(fp[keep])
+    rec = tp / float(max(npos, 1))
+    prec = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
+    results[difficulty] = (rec, prec, kitti_ap(rec, prec) if npos > 0 else 0.)
+  return results
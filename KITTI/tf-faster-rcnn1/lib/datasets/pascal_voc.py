@@ -10,6 +10,7 @@ from __future__ import print_function
 
 import os
 from datasets.imdb import imdb
+from datasets.proposal_store import ProposalStore, LazyRoidb
 import datasets.ds_utils as ds_utils
 import xml.etree.ElementTree as ET
 import numpy as np
@@ -20,6 +21,7 @@ import pickle
 import subprocess
 import uuid
 from .voc_eval import voc_eval
+from .kitti_eval import KittiLabels, kitti_eval, DIFFICULTIES
 from model.config import cfg
 
 
@@ -49,7 +51,9 @@ class pascal_voc(imdb):
                    'use_salt': True,
                    'use_diff': use_diff,
                    'matlab_eval': False,
-                   'rpn_file': None}
+                   'rpn_file': None,
+                   'rpn_workers': None,
+                   'kitti_labels': None}
 
     assert os.path.exists(self._devkit_path), \
       'VOCdevkit path does not exist: {}'.format(self._devkit_path)
@@ -124,8 +128,7 @@ class pascal_voc(imdb):
   def rpn_roidb(self):
     if int(self._year) == 2007 or self._image_set != 'test':
       gt_roidb = self.gt_roidb()
-      rpn_roidb = self._load_rpn_roidb(gt_roidb)
-      roidb = imdb.merge_roidbs(gt_roidb, rpn_roidb)
+      roidb = self._load_rpn_roidb(gt_roidb)
     else:
       roidb = self._load_rpn_roidb(None)
 
@@ -133,13 +136,28 @@ class pascal_voc(imdb):
 
 #加载预选框的文件
   def _load_rpn_roidb(self, gt_roidb):
+    """
+    Return a roidb merging gt_roidb with the proposals in rpn_file.
+
+    rpn_file is either the prefix of a proposal store or a pickled list of
+    proposal arrays, which is converted to a store in the cache, again
+    whenever the pickle changes.
+    Entries are built lazily, one image at a time.
+    """
     filename = self.config['rpn_file']
     print('loading {}'.format(filename))
-    assert os.path.exists(filename), \
-      'rpn data not found at: {}'.format(filename)
-    with open(filename, 'rb') as f:
-      box_list = pickle.load(f)
-    return self.create_roidb_from_box_list(box_list, gt_roidb)
+    if ProposalStore.exists(filename):
+      store = ProposalStore(filename)
+    else:
+      assert os.path.exists(filename), \
+        'rpn data not found at: {}'.format(filename)
+      prefix = os.path.join(self.cache_path, self.name + '_' +
+                            os.path.splitext(os.path.basename(filename))[0])
+      store = ProposalStore.from_pickle(filename, prefix)
+    assert len(store) == self.num_images, \
+      'Number of boxes must match number of ground-truth images'
+    return LazyRoidb(store, self.num_classes, gt_roidb,
+                     num_workers=self.config['rpn_workers'])
 
 #这个函数是读取gt的具体实现
   def _load_pascal_annotation(self, index):
@@ -280,6 +298,32 @@ class pascal_voc(imdb):
     print('-- Thanks, The Management')
     print('--------------------------------------------------------------')
 
+#按KITTI的Easy/Moderate/Hard标准评估，需要原始的KITTI标注文件
+  def _do_kitti_eval(self, all_boxes, output_dir='output'):
+    labels = KittiLabels.load(self.config['kitti_labels'], self.image_index)
+    if not os.path.isdir(output_dir):
+      os.mkdir(output_dir)
+    aps = {}
+    for cls_ind, cls in enumerate(self.classes):
+      if cls == '__background__':
+        continue
+      dets = [(im_ind, d) for im_ind, d in enumerate(all_boxes[cls_ind])
+              if len(d) > 0]
+      det_images = np.concatenate(
+        [np.full((d.shape[0],), im_ind, dtype=np.int64) for im_ind, d in dets]
+        or [np.zeros((0,), dtype=np.int64)])
+      det_boxes = np.vstack([d for _, d in dets] or [np.zeros((0, 5))])
+      # same 1-based shift as the VOC results files
+      results = kitti_eval(det_images, det_boxes[:, -1], det_boxes[:, :4] + 1,
+                           labels, cls)
+      aps[cls] = [results[d][2] for d in DIFFICULTIES]
+      with open(os.path.join(output_dir, cls + '_kitti_pr.pkl'), 'wb') as f:
+        pickle.dump(results, f)
+    print('KITTI AP (40 recall positions)')
+    print('{:<12s}'.format('') + ''.join('{:>10s}'.format(d) for d in DIFFICULTIES))
+    for cls, ap in aps.items():
+      print('{:<12s}'.format(cls) + ''.join('{:10.4f}'.format(a) for a in ap))
+
   def _do_matlab_eval(self, output_dir='output'):
     print('-----------------------------------------------------')
     print('Computing results with the official MATLAB eval code.')
@@ -299,6 +343,8 @@ class pascal_voc(imdb):
   def evaluate_detections(self, all_boxes, output_dir):
     self._write_voc_results_file(all_boxes)
     self._do_python_eval(output_dir)
+    if self.config['kitti_labels'] is not None:
+      self._do_kitti_eval(all_boxes, output_dir)
     if self.config['matlab_eval']:
       self._do_matlab_eval(output_dir)
     if self.config['cleanup']:
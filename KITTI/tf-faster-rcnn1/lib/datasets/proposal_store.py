@@ -0,0 +1,217 @@
+# --------------------------------------------------------
+# Tensorflow Faster R-CNN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""Memory-mapped storage of precomputed region proposals.
+
+All proposals of a dataset are kept in one (N, 4) float32 array with a
+(num_images + 1,) offsets array, so that the boxes of image i are
+boxes[offsets[i]:offsets[i + 1]]. Both arrays are stored as .npy files and
+memory-mapped, instead of unpickling one monolithic list of arrays.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import pickle
+import multiprocessing
+import numpy as np
+import scipy.sparse
+from utils.cython_bbox import bbox_overlaps
+
+
+class ProposalStore(object):
+  """Per-image proposal boxes backed by memory-mapped .npy files."""
+
+  def __init__(self, prefix, mmap_mode='r'):
+    self._prefix = prefix
+    self._boxes = np.load(prefix + '_boxes.npy', mmap_mode=mmap_mode)
+    self._offsets = np.load(prefix + '_offsets.npy')
+
+  @staticmethod
+  def exists(prefix):
+    return (os.path.exists(prefix + '_boxes.npy') and
+            os.path.exists(prefix + '_offsets.npy'))
+
+  @staticmethod
+  def write(prefix, box_list):
+    """Write a list of (n_i, 4+) proposal arrays as a store at prefix."""
+    counts = np.array([boxes.shape[0] for boxes in box_list], dtype=np.int64)
+    offsets = np.zeros((len(box_list) + 1,), dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    boxes = np.lib.format.open_memmap(prefix + '_boxes.npy', mode='w+',
+                                      dtype=np.float32,
+                                      shape=(int(offsets[-1]), 4))
+    for i, b in enumerate(box_list):
+      boxes[offsets[i]:offsets[i + 1], :] = b[:, :4]
+    boxes.flush()
+    del boxes
+    np.save(prefix + '_offsets.npy', offsets)
+    return ProposalStore(prefix)
+
+  @staticmethod
+  def _source(filename):
+    """What identifies a version of the pickle a store was converted from."""
+    stat = os.stat(filename)
+    return {'path': os.path.abspath(filename), 'size': stat.st_size,
+            'mtime': stat.st_mtime}
+
+  @staticmethod
+  def from_pickle(filename, prefix):
+    """Convert a pickled list of proposal arrays into a store.
+
+    The path, size and modification time of the pickle are recorded next to
+    the store, which is converted again when they change.
+    """
+    source = ProposalStore._source(filename)
+    source_file = prefix + '_source.json'
+    recorded = None
+    if ProposalStore.exists(prefix) and os.path.exists(source_file):
+      with open(source_file) as f:
+        recorded = json.load(f)
+    if recorded != source:
+      print('converting {} to a proposal store at {}'.format(filename, prefix))
+      # Written last, so that an interrupted conversion is redone
+      if os.path.exists(source_file):
+        os.remove(source_file)
+      with open(filename, 'rb') as f:
+        box_list = pickle.load(f)
+      ProposalStore.write(prefix, box_list)
+      with open(source_file, 'w') as f:
+        json.dump(source, f)
+    return ProposalStore(prefix)
+
+  @property
+  def prefix(self):
+    return self._prefix
+
+  @property
+  def offsets(self):
+    return self._offsets
+
+  @property
+  def num_boxes(self):
+    return int(self._offsets[-1])
+
+  def __len__(self):
+    return len(self._offsets) - 1
+
+  def __getitem__(self, i):
+    return self._boxes[self._offsets[i]:self._offsets[i + 1], :]
+
+
+_worker_store = None
+
+
+def _init_worker(prefix):
+  global _worker_store
+  _worker_store = ProposalStore(prefix)
+
+
+def _image_overlaps(args):
+  """Best gt overlap and its class for every proposal of one image."""
+  i, gt_boxes, gt_classes = args
+  boxes = _worker_store[i]
+  gt_overlaps = bbox_overlaps(
+    np.ascontiguousarray(boxes, dtype=np.float64),
+    np.ascontiguousarray(gt_boxes, dtype=np.float64))
+  argmaxes = gt_overlaps.argmax(axis=1)
+  maxes = gt_overlaps.max(axis=1)
+  return i, maxes.astype(np.float32), gt_classes[argmaxes].astype(np.int32)
+
+
+def compute_gt_overlaps(store, gt_roidb, num_workers=None):
+  """Annotate every proposal in store with its best ground-truth overlap.
+
+  The overlaps are computed by a process pool, each worker memory-mapping
+  the store. Returns two arrays aligned with the store boxes: the max
+  overlap and the class of the ground-truth box achieving it.
+  """
+  max_overlaps = np.zeros((store.num_boxes,), dtype=np.float32)
+  max_classes = np.zeros((store.num_boxes,), dtype=np.int32)
+  if gt_roidb is None:
+    return max_overlaps, max_classes
+
+  tasks = [(i, gt_roidb[i]['boxes'], gt_roidb[i]['gt_classes'])
+           for i in range(len(store))
+           if gt_roidb[i]['boxes'].size > 0 and store.offsets[i + 1] > store.offsets[i]]
+  offsets = store.offsets
+  if num_workers is None:
+    num_workers = multiprocessing.cpu_count()
+  pool = multiprocessing.Pool(num_workers, _init_worker, (store.prefix,))
+  try:
+    for i, maxes, classes in pool.imap_unordered(_image_overlaps, tasks,
+                                                 chunksize=64):
+      max_overlaps[offsets[i]:offsets[i + 1]] = maxes
+      max_classes[offsets[i]:offsets[i + 1]] = classes
+  finally:
+    pool.close()
+    pool.join()
+  return max_overlaps, max_classes
+
+
+class LazyRoidb(object):
+  """A roidb merging ground-truth entries with stored proposals on access.
+
+  Entry i is only built (boxes stacked, gt_overlaps made sparse) the first
+  time it is read, and is kept afterwards so that later updates to it (e.g.
+  by prepare_roidb) persist. Supports the list operations the training code
+  uses: len, indexing, iteration and append.
+  """
+
+  def __init__(self, store, num_classes, gt_roidb=None, num_workers=None):
+    self._store = store
+    self._num_classes = num_classes
+    self._gt_roidb = gt_roidb
+    self._max_overlaps, self._max_classes = compute_gt_overlaps(
+      store, gt_roidb, num_workers)
+    self._entries = [None] * len(store)
+
+  def _build(self, i):
+    start, end = self._store.offsets[i], self._store.offsets[i + 1]
+    boxes = np.array(self._store[i])
+    num_boxes = boxes.shape[0]
+    maxes = self._max_overlaps[start:end]
+    I = np.where(maxes > 0)[0]
+    overlaps = scipy.sparse.csr_matrix(
+      (maxes[I], (I, self._max_classes[start:end][I])),
+      shape=(num_boxes, self._num_classes), dtype=np.float32)
+    entry = {'boxes': boxes,
+             'gt_classes': np.zeros((num_boxes,), dtype=np.int32),
+             'gt_overlaps': overlaps,
+             'flipped': False,
+             'seg_areas': np.zeros((num_boxes,), dtype=np.float32)}
+    if self._gt_roidb is None:
+      return entry
+
+    gt = self._gt_roidb[i]
+    return {'boxes': np.vstack((gt['boxes'], entry['boxes'])),
+            'gt_classes': np.hstack((gt['gt_classes'], entry['gt_classes'])),
+            'gt_overlaps': scipy.sparse.vstack([gt['gt_overlaps'],
+                                                entry['gt_overlaps']]),
+            'flipped': gt['flipped'],
+            'seg_areas': np.hstack((gt['seg_areas'], entry['seg_areas']))}
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in range(*i.indices(len(self)))]
+    if i < 0:
+      i += len(self)
+    entry = self._entries[i]
+    if entry is None:
+      entry = self._build(i)
+      self._entries[i] = entry
+    return entry
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self[i]
+
+  def append(self, entry):
+    self._entries.append(entry)
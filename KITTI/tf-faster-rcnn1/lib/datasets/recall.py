@@ -0,0 +1,156 @@
+# --------------------------------------------------------
+# Tensorflow Faster R-CNN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""Proposal recall for all area ranges and IoU thresholds in one pass.
+
+Gives the same numbers as the greedy matching of imdb.evaluate_recall, but
+the overlaps of an image are computed and sorted once: the (iou, gt, box)
+pairs are visited in decreasing IoU order and every area range only filters
+them, instead of repeating a full argmax over the overlaps matrix for every
+gt box and every area range. Images are matched by a process pool.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+from collections import OrderedDict
+import numpy as np
+from utils.cython_bbox import bbox_overlaps
+
+AREA_RANGES = OrderedDict([
+  ('all', (0 ** 2, 1e5 ** 2)),
+  ('small', (0 ** 2, 32 ** 2)),
+  ('medium', (32 ** 2, 96 ** 2)),
+  ('large', (96 ** 2, 1e5 ** 2)),
+  ('96-128', (96 ** 2, 128 ** 2)),
+  ('128-256', (128 ** 2, 256 ** 2)),
+  ('256-512', (256 ** 2, 512 ** 2)),
+  ('512-inf', (512 ** 2, 1e5 ** 2)),
+])
+
+
+def sorted_pairs(overlaps):
+  """Return the (iou, gt, box) candidate pairs of an overlaps matrix
+  (boxes x gt boxes) in the order the greedy matching visits them: by
+  decreasing IoU, ties broken by the lower gt then box index."""
+  num_boxes, num_gt = overlaps.shape
+  # A gt box loses at most num_gt - 1 boxes to the other gt boxes, so it is
+  # matched to one of its num_gt best boxes
+  top = np.argsort(-overlaps, axis=0, kind='stable')[:min(num_gt, num_boxes)]
+  gt = np.tile(np.arange(num_gt), top.shape[0])
+  box = top.ravel()
+  iou = overlaps[box, gt]
+  order = np.lexsort((box, gt, -iou))
+  return iou[order], gt[order], box[order]
+
+
+def greedy_match(iou, gt, box, num_gt):
+  """Match gt boxes to boxes walking the sorted pairs, return the IoU of the
+  match of each of the num_gt distinct gt boxes in the pairs (0 if none)."""
+  matched = []
+  gt_used = set()
+  box_used = set()
+  for o, g, b in zip(iou.tolist(), gt.tolist(), box.tolist()):
+    if g in gt_used or b in box_used:
+      continue
+    gt_used.add(g)
+    box_used.add(b)
+    matched.append(o)
+    if len(matched) == num_gt:
+      break
+  matched.extend([0.] * (num_gt - len(matched)))
+  return matched
+
+
+def _image_recall(args):
+  """IoU of the greedy match of every gt box of one image, per area range."""
+  gt_boxes, gt_areas, boxes, area_ranges = args
+  in_range = [(gt_areas >= lo) & (gt_areas <= hi) for lo, hi in area_ranges]
+  if boxes.shape[0] == 0 or gt_boxes.shape[0] == 0:
+    return [int(r.sum()) for r in in_range], [[] for _ in area_ranges]
+  overlaps = bbox_overlaps(
+    np.ascontiguousarray(boxes, dtype=np.float64),
+    np.ascontiguousarray(gt_boxes, dtype=np.float64))
+  iou, gt, box = sorted_pairs(overlaps)
+  matched = []
+  for r in in_range:
+    keep = r[gt]
+    matched.append(greedy_match(iou[keep], gt[keep], box[keep], int(r.sum())))
+  return [int(r.sum()) for r in in_range], matched
+
+
+def _tasks(roidb, candidate_boxes, area_ranges, limit):
+  for i in range(len(roidb)):
+    entry = roidb[i]
+    # Checking for max_overlaps == 1 avoids including crowd annotations
+    max_gt_overlaps = entry['gt_overlaps'].max(axis=1).toarray().ravel()
+    gt_inds = np.where((entry['gt_classes'] > 0) & (max_gt_overlaps == 1))[0]
+    gt_boxes = entry['boxes'][gt_inds, :]
+    gt_areas = entry['seg_areas'][gt_inds]
+    if candidate_boxes is None:
+      # Default to the non-ground-truth boxes of the roidb
+      boxes = entry['boxes'][entry['gt_classes'] == 0, :]
+    else:
+      boxes = candidate_boxes[i]
+    if limit is not None:
+      boxes = boxes[:limit, :]
+    yield gt_boxes, gt_areas, boxes[:, :4], area_ranges
+
+
+def evaluate_recall(roidb, candidate_boxes=None, thresholds=None, areas=None,
+                    limit=None, num_workers=None):
+  """Evaluate detection proposal recall metrics for several area ranges.
+
+  areas is a list of keys of AREA_RANGES (default: all of them). The images
+  are matched by num_workers processes (default: one per CPU, 1 to match
+  them in this process).
+
+  Returns:
+      results: OrderedDict mapping each area to a dictionary with keys
+          'ar': average recall
+          'recalls': vector recalls at each IoU overlap threshold
+          'thresholds': vector of IoU overlap thresholds
+          'gt_overlaps': vector of all ground-truth overlaps
+  """
+  if areas is None:
+    areas = list(AREA_RANGES.keys())
+  for area in areas:
+    assert area in AREA_RANGES, 'unknown area range: {}'.format(area)
+  if thresholds is None:
+    step = 0.05
+    thresholds = np.arange(0.5, 0.95 + 1e-5, step)
+  area_ranges = [AREA_RANGES[area] for area in areas]
+
+  num_pos = np.zeros((len(areas),), dtype=np.int64)
+  gt_overlaps = [[] for _ in areas]
+  tasks = _tasks(roidb, candidate_boxes, area_ranges, limit)
+  if num_workers is None:
+    num_workers = multiprocessing.cpu_count()
+  if num_workers > 1:
+    pool = multiprocessing.Pool(num_workers)
+    results = pool.imap_unordered(_image_recall, tasks, chunksize=32)
+  else:
+    pool = None
+    results = (_image_recall(task) for task in tasks)
+  try:
+    for counts, matched in results:
+      num_pos += counts
+      for k in range(len(areas)):
+        gt_overlaps[k].extend(matched[k])
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+
+  out = OrderedDict()
+  for k, area in enumerate(areas):
+    overlaps = np.sort(np.array(gt_overlaps[k], dtype=np.float64))
+    # number of gt overlaps >= t for each threshold t
+    covered = overlaps.size - np.searchsorted(overlaps, thresholds, side='left')
+    recalls = covered / float(num_pos[k])
+    out[area] = {'ar': recalls.mean(), 'recalls': recalls,
+                 'thresholds': thresholds, 'gt_overlaps': overlaps}
+  return out
@@ -71,12 +71,11 @@ def _get_bbox_regression_labels(bbox_target_data, num_classes):
   bbox_targets = np.zeros((clss.size, 4 * num_classes), dtype=np.float32)
   bbox_inside_weights = np.zeros(bbox_targets.shape, dtype=np.float32)
   inds = np.where(clss > 0)[0]
-  for ind in inds:
-    cls = clss[ind]
-    start = int(4 * cls)
-    end = start + 4
-    bbox_targets[ind, start:end] = bbox_target_data[ind, 1:]
-    bbox_inside_weights[ind, start:end] = cfg.TRAIN.BBOX_INSIDE_WEIGHTS
+  # Scatter the 4 targets of every fg RoI into the columns of its class
+  rows = inds[:, np.newaxis]
+  cols = 4 * clss[inds].astype(np.int64)[:, np.newaxis] + np.arange(4)
+  bbox_targets[rows, cols] = bbox_target_data[inds, 1:]
+  bbox_inside_weights[rows, cols] = cfg.TRAIN.BBOX_INSIDE_WEIGHTS
   return bbox_targets, bbox_inside_weights
 
 
@@ -102,10 +101,10 @@ def _sample_rois(all_rois, all_scores, gt_boxes, fg_rois_per_image, rois_per_ima
   """
   # overlaps: (rois x gt_boxes)
   overlaps = bbox_overlaps(
-    np.ascontiguousarray(all_rois[:, 1:5], dtype=np.float),
-    np.ascontiguousarray(gt_boxes[:, :4], dtype=np.float))
+    np.ascontiguousarray(all_rois[:, 1:5], dtype=np.float32),
+    np.ascontiguousarray(gt_boxes[:, :4], dtype=np.float32))
   gt_assignment = overlaps.argmax(axis=1)
-  max_overlaps = overlaps.max(axis=1)
+  max_overlaps = overlaps[np.arange(overlaps.shape[0]), gt_assignment]
   labels = gt_boxes[gt_assignment, 4]
 
   # Select foreground RoIs as those with >= FG_THRESH overlap
@@ -131,8 +130,12 @@ def _sample_rois(all_rois, all_scores, gt_boxes, fg_rois_per_image, rois_per_ima
     bg_inds = npr.choice(bg_inds, size=int(rois_per_image), replace=to_replace)
     fg_rois_per_image = 0
   else:
-    import pdb
-    pdb.set_trace()
+    # No RoI overlaps a gt box enough to be fg nor bg (e.g. all of them are
+    # below BG_THRESH_LO): use all RoIs as background instead of stopping
+    bg_inds = np.arange(all_rois.shape[0])
+    to_replace = bg_inds.size < rois_per_image
+    bg_inds = npr.choice(bg_inds, size=int(rois_per_image), replace=to_replace)
+    fg_rois_per_image = 0
 
   # The indices that we're selecting (both fg and bg)
   keep_inds = np.append(fg_inds, bg_inds)
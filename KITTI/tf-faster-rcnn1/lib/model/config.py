@@ -52,6 +52,11 @@ __C.TRAIN.USE_GT = False
 # GPU memory
 __C.TRAIN.ASPECT_GROUPING = False
 
+# Number of buckets for grouping training images by their scaled (height, width),
+# so that multi-image minibatches are padded as little as possible. 0 disables
+# the bucketing, otherwise it takes precedence over ASPECT_GROUPING
+__C.TRAIN.SIZE_BUCKETS = 0
+
 # The number of snapshots kept, older ones are deleted to save space
 __C.TRAIN.SNAPSHOT_KEPT = 3
 
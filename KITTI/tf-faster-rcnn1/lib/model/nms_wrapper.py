@@ -9,15 +9,19 @@ from __future__ import division
 from __future__ import print_function
 
 from model.config import cfg
-from nms.gpu_nms import gpu_nms
 from nms.cpu_nms import cpu_nms
+# The GPU kernel is only built on machines with CUDA
+try:
+  from nms.gpu_nms import gpu_nms
+except ImportError:
+  gpu_nms = None
 
 def nms(dets, thresh, force_cpu=False):
   """Dispatch to either CPU or GPU NMS implementations."""
 
   if dets.shape[0] == 0:
     return []
-  if cfg.USE_GPU_NMS and not force_cpu:
+  if cfg.USE_GPU_NMS and gpu_nms is not None and not force_cpu:
     return gpu_nms(dets, thresh, device_id=0)
   else:
     return cpu_nms(dets, thresh)
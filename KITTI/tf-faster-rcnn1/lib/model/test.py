@@ -17,7 +17,7 @@ import os
 import math
 
 from utils.timer import Timer
-from utils.blob import im_list_to_blob
+from utils.blob import ims_to_blob
 
 from model.config import cfg, get_output_dir
 from model.bbox_transform import clip_boxes, bbox_transform_inv
@@ -32,28 +32,10 @@ def _get_image_blob(im):
     im_scale_factors (list): list of image scales (relative to im) used
       in the image pyramid
   """
-  im_orig = im.astype(np.float32, copy=True)
-  im_orig -= cfg.PIXEL_MEANS
-
-  im_shape = im_orig.shape
-  im_size_min = np.min(im_shape[0:2])
-  im_size_max = np.max(im_shape[0:2])
-
-  processed_ims = []
-  im_scale_factors = []
-
-  for target_size in cfg.TEST.SCALES:
-    im_scale = float(target_size) / float(im_size_min)
-    # Prevent the biggest axis from being more than MAX_SIZE
-    if np.round(im_scale * im_size_max) > cfg.TEST.MAX_SIZE:
-      im_scale = float(cfg.TEST.MAX_SIZE) / float(im_size_max)
-    im = cv2.resize(im_orig, None, None, fx=im_scale, fy=im_scale,
-            interpolation=cv2.INTER_LINEAR)
-    im_scale_factors.append(im_scale)
-    processed_ims.append(im)
-
   # Create a blob to hold the input images
-  blob = im_list_to_blob(processed_ims)
+  blob, im_scale_factors = ims_to_blob([im] * len(cfg.TEST.SCALES),
+                                       cfg.PIXEL_MEANS, cfg.TEST.SCALES,
+                                       cfg.TEST.MAX_SIZE)
 
   return blob, np.array(im_scale_factors)
 
@@ -67,6 +67,11 @@ class SolverWrapper(object):
     cur_val = self.data_layer_val._cur
     # current shuffled indexes of the validation database
     perm_val = self.data_layer_val._perm
+    # state of the size-bucketing samplers, None when bucketing is off
+    sampler = self.data_layer._sampler
+    sampler_state = sampler.state() if sampler is not None else None
+    sampler_val = self.data_layer_val._sampler
+    sampler_state_val = sampler_val.state() if sampler_val is not None else None
 
     # Dump the meta info
     with open(nfilename, 'wb') as fid:
@@ -76,6 +81,8 @@ class SolverWrapper(object):
       pickle.dump(cur_val, fid, pickle.HIGHEST_PROTOCOL)
       pickle.dump(perm_val, fid, pickle.HIGHEST_PROTOCOL)
       pickle.dump(iter, fid, pickle.HIGHEST_PROTOCOL)
+      pickle.dump(sampler_state, fid, pickle.HIGHEST_PROTOCOL)
+      pickle.dump(sampler_state_val, fid, pickle.HIGHEST_PROTOCOL)
 
     return filename, nfilename
 
@@ -93,12 +100,23 @@ class SolverWrapper(object):
       cur_val = pickle.load(fid)
       perm_val = pickle.load(fid)
       last_snapshot_iter = pickle.load(fid)
+      # Snapshots written before size bucketing do not carry sampler states
+      try:
+        sampler_state = pickle.load(fid)
+        sampler_state_val = pickle.load(fid)
+      except EOFError:
+        sampler_state = None
+        sampler_state_val = None
 
       np.random.set_state(st0)
       self.data_layer._cur = cur
       self.data_layer._perm = perm
       self.data_layer_val._cur = cur_val
       self.data_layer_val._perm = perm_val
+      if self.data_layer._sampler is not None and sampler_state is not None:
+        self.data_layer._sampler.set_state(sampler_state)
+      if self.data_layer_val._sampler is not None and sampler_state_val is not None:
+        self.data_layer_val._sampler.set_state(sampler_state_val)
 
     return last_snapshot_iter
 
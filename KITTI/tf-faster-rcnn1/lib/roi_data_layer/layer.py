@@ -15,6 +15,7 @@ from __future__ import print_function
 
 from model.config import cfg
 from roi_data_layer.minibatch import get_minibatch
+from roi_data_layer.sampler import BucketSampler
 import numpy as np
 import time
 
@@ -27,6 +28,13 @@ class RoIDataLayer(object):
     self._num_classes = num_classes
     # Also set a random flag
     self._random = random
+    # Group the images by their scaled size if requested
+    self._sampler = None
+    if cfg.TRAIN.SIZE_BUCKETS > 0:
+      self._sampler = BucketSampler(roidb, cfg.TRAIN.SIZE_BUCKETS,
+                                    cfg.TRAIN.IMS_PER_BATCH,
+                                    max(cfg.TRAIN.SCALES),
+                                    cfg.TRAIN.MAX_SIZE)
     self._shuffle_roidb_inds()
 
   def _shuffle_roidb_inds(self):
@@ -39,7 +47,9 @@ class RoIDataLayer(object):
       millis = int(round(time.time() * 1000)) % 4294967295
       np.random.seed(millis)
     
-    if cfg.TRAIN.ASPECT_GROUPING:
+    if self._sampler is not None:
+      self._perm = self._sampler.permutation()
+    elif cfg.TRAIN.ASPECT_GROUPING:
       widths = np.array([r['width'] for r in self._roidb])
       heights = np.array([r['height'] for r in self._roidb])
       horz = (widths >= heights)
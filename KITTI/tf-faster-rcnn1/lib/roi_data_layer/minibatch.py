@@ -14,7 +14,7 @@ import numpy as np
 import numpy.random as npr
 import cv2
 from model.config import cfg
-from utils.blob import prep_im_for_blob, im_list_to_blob
+from utils.blob import ims_to_blob
 
 def get_minibatch(roidb, num_classes):
   """Given a roidb, construct a minibatch sampled from it."""
@@ -56,19 +56,17 @@ def _get_image_blob(roidb, scale_inds):
   scales.
   """
   num_images = len(roidb)
-  processed_ims = []
-  im_scales = []
+  ims = []
+  target_sizes = []
   for i in range(num_images):
     im = cv2.imread(roidb[i]['image'])
     if roidb[i]['flipped']:
       im = im[:, ::-1, :]
-    target_size = cfg.TRAIN.SCALES[scale_inds[i]]
-    im, im_scale = prep_im_for_blob(im, cfg.PIXEL_MEANS, target_size,
-                    cfg.TRAIN.MAX_SIZE)
-    im_scales.append(im_scale)
-    processed_ims.append(im)
+    ims.append(im)
+    target_sizes.append(cfg.TRAIN.SCALES[scale_inds[i]])
 
   # Create a blob to hold the input images
-  blob = im_list_to_blob(processed_ims)
+  blob, im_scales = ims_to_blob(ims, cfg.PIXEL_MEANS, target_sizes,
+                                cfg.TRAIN.MAX_SIZE)
 
   return blob, im_scales
@@ -0,0 +1,132 @@
+# --------------------------------------------------------
+# Tensorflow Faster R-CNN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""Size-bucketed sampling of the training roidb.
+
+Images are grouped by their (height, width) after the training rescale so
+that the images stacked into one minibatch blob need as little zero-padding
+as possible.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+def scaled_shape(height, width, target_size, max_size):
+  """Return the (height, width) an image gets in prep_im_for_blob."""
+  height = np.asarray(height, dtype=np.float64)
+  width = np.asarray(width, dtype=np.float64)
+  size_min = np.minimum(height, width)
+  size_max = np.maximum(height, width)
+  im_scale = float(target_size) / size_min
+  # Prevent the biggest axis from being more than MAX_SIZE
+  too_big = np.round(im_scale * size_max) > max_size
+  im_scale[too_big] = float(max_size) / size_max[too_big]
+  return (np.round(height * im_scale).astype(np.int64),
+          np.round(width * im_scale).astype(np.int64))
+
+
+class BucketSampler(object):
+  """Sample minibatches of images with similar post-scale sizes.
+
+  The roidb is sorted by scaled (height, width) and cut into num_buckets
+  buckets of (nearly) equal size. Each epoch the images are shuffled inside
+  their bucket, cut into minibatches, and the minibatches are shuffled
+  across buckets. Images left over at the end of a bucket are batched
+  together in size order.
+  """
+
+  def __init__(self, roidb, num_buckets, ims_per_batch, target_size,
+               max_size):
+    heights = np.array([r['height'] for r in roidb])
+    widths = np.array([r['width'] for r in roidb])
+    self._heights, self._widths = scaled_shape(heights, widths,
+                                               target_size, max_size)
+    self._ims_per_batch = ims_per_batch
+    num_buckets = max(1, min(num_buckets, len(roidb)))
+    order = np.lexsort((self._widths, self._heights))
+    self._buckets = np.array_split(order, num_buckets)
+    self._epoch = 0
+    self._overheads = []
+
+  @property
+  def num_buckets(self):
+    return len(self._buckets)
+
+  @property
+  def epoch(self):
+    return self._epoch
+
+  @property
+  def padding_overheads(self):
+    """Padding overhead ratio of every epoch sampled so far."""
+    return list(self._overheads)
+
+  def padding_overhead(self, perm):
+    """Ratio of padded to real pixels when perm is cut into minibatches."""
+    num_batches = len(perm) // self._ims_per_batch
+    if num_batches == 0:
+      return 0.
+    inds = perm[:num_batches * self._ims_per_batch]
+    inds = inds.reshape((num_batches, self._ims_per_batch))
+    heights = self._heights[inds]
+    widths = self._widths[inds]
+    real = (heights * widths).sum()
+    padded = (heights.max(axis=1) * widths.max(axis=1)).sum() \
+             * self._ims_per_batch
+    return float(padded - real) / float(real)
+
+  def permutation(self):
+    """Return the image order for a new epoch and record its overhead."""
+    batches = []
+    leftover = []
+    for bucket in self._buckets:
+      inds = np.random.permutation(bucket)
+      num_full = len(inds) // self._ims_per_batch * self._ims_per_batch
+      if num_full > 0:
+        batches.append(inds[:num_full].reshape((-1, self._ims_per_batch)))
+      leftover.append(inds[num_full:])
+    # The leftovers keep the sorted bucket order, so neighbours stay similar
+    leftover = np.hstack(leftover).astype(np.int64)
+    if len(leftover) > 0:
+      num_full = len(leftover) // self._ims_per_batch * self._ims_per_batch
+      if num_full > 0:
+        batches.append(leftover[:num_full].reshape((-1, self._ims_per_batch)))
+      tail = leftover[num_full:]
+    else:
+      tail = leftover
+    if len(batches) > 0:
+      batches = np.vstack(batches)
+      batches = batches[np.random.permutation(batches.shape[0]), :]
+      perm = np.hstack((batches.reshape((-1,)), tail))
+    else:
+      perm = tail
+
+    overhead = self.padding_overhead(perm)
+    self._overheads.append(overhead)
+    self._epoch += 1
+    print('Bucketed epoch {:d}: {:d} buckets, padding overhead {:.2%}'
+          .format(self._epoch, self.num_buckets, overhead))
+    return perm
+
+  def state(self):
+    """Return the sampler state to be stored with a training snapshot."""
+    return {'num_images': len(self._heights),
+            'num_buckets': self.num_buckets,
+            'epoch': self._epoch,
+            'overheads': list(self._overheads)}
+
+  def set_state(self, state):
+    """Restore a state produced by state()."""
+    assert state['num_images'] == len(self._heights), \
+      'Snapshot sampler covers {} images, roidb has {}'.format(
+        state['num_images'], len(self._heights))
+    assert state['num_buckets'] == self.num_buckets, \
+      'Snapshot sampler has {} buckets, config asks for {}'.format(
+        state['num_buckets'], self.num_buckets)
+    self._epoch = state['epoch']
+    self._overheads = list(state['overheads'])
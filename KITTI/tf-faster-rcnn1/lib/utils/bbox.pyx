@@ -9,24 +9,30 @@ cimport cython
 import numpy as np
 cimport numpy as np
 
-DTYPE = np.float
-ctypedef np.float_t DTYPE_t
+# float32 boxes are handled without converting them to float64 first
+ctypedef fused DTYPE_t:
+    np.float32_t
+    np.float64_t
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
 def bbox_overlaps(
         np.ndarray[DTYPE_t, ndim=2] boxes,
         np.ndarray[DTYPE_t, ndim=2] query_boxes):
     """
     Parameters
     ----------
-    boxes: (N, 4) ndarray of float
-    query_boxes: (K, 4) ndarray of float
+    boxes: (N, 4) ndarray of float32 or float64
+    query_boxes: (K, 4) ndarray of the same dtype
     Returns
     -------
-    overlaps: (N, K) ndarray of overlap between boxes and query_boxes
+    overlaps: (N, K) ndarray of overlap between boxes and query_boxes, of
+    the dtype of the inputs
     """
     cdef unsigned int N = boxes.shape[0]
     cdef unsigned int K = query_boxes.shape[0]
-    cdef np.ndarray[DTYPE_t, ndim=2] overlaps = np.zeros((N, K), dtype=DTYPE)
+    cdef np.ndarray[DTYPE_t, ndim=2] overlaps = np.zeros(
+        (N, K), dtype=np.float32 if DTYPE_t is np.float32_t else np.float64)
     cdef DTYPE_t iw, ih, box_area
     cdef DTYPE_t ua
     cdef unsigned int k, n
@@ -46,7 +52,7 @@ def bbox_overlaps(
                     max(boxes[n, 1], query_boxes[k, 1]) + 1
                 )
                 if ih > 0:
-                    ua = float(
+                    ua = (
                         (boxes[n, 2] - boxes[n, 0] + 1) *
                         (boxes[n, 3] - boxes[n, 1] + 1) +
                         box_area - iw * ih
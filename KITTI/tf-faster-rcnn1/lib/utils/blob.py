@@ -10,6 +10,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from collections import OrderedDict
 import numpy as np
 import cv2
 
@@ -34,14 +35,82 @@ def prep_im_for_blob(im, pixel_means, target_size, max_size):
   """Mean subtract and scale an image for use in a blob."""
   im = im.astype(np.float32, copy=False)
   im -= pixel_means
-  im_shape = im.shape
+  im_scale = im_scale_for_blob(im.shape, target_size, max_size)
+  im = cv2.resize(im, None, None, fx=im_scale, fy=im_scale,
+                  interpolation=cv2.INTER_LINEAR)
+
+  return im, im_scale
+
+
+def im_scale_for_blob(im_shape, target_size, max_size):
+  """Return the scale prep_im_for_blob applies to an image of im_shape."""
   im_size_min = np.min(im_shape[0:2])
   im_size_max = np.max(im_shape[0:2])
   im_scale = float(target_size) / float(im_size_min)
   # Prevent the biggest axis from being more than MAX_SIZE
   if np.round(im_scale * im_size_max) > max_size:
     im_scale = float(max_size) / float(im_size_max)
-  im = cv2.resize(im, None, None, fx=im_scale, fy=im_scale,
-                  interpolation=cv2.INTER_LINEAR)
+  return im_scale
 
-  return im, im_scale
+
+class BlobPool(object):
+  """A small pool of preallocated float32 blobs, keyed by shape.
+
+  A blob handed out by the pool is reused by the next request for the same
+  shape, so it must be consumed (e.g. fed to the session) before that.
+  """
+
+  def __init__(self, max_blobs=4):
+    self._max_blobs = max_blobs
+    self._blobs = OrderedDict()
+
+  def get(self, shape):
+    shape = tuple(int(s) for s in shape)
+    blob = self._blobs.pop(shape, None)
+    if blob is None:
+      blob = np.empty(shape, dtype=np.float32)
+      # Drop the least recently used blob if the pool is full
+      if len(self._blobs) >= self._max_blobs:
+        self._blobs.popitem(last=False)
+    self._blobs[shape] = blob
+    return blob
+
+  def clear(self):
+    self._blobs.clear()
+
+
+_blob_pool = BlobPool()
+
+
+def ims_to_blob(ims, pixel_means, target_sizes, max_size, pool=None):
+  """Scale, mean subtract and stack a list of uint8 images into a blob.
+
+  Equivalent to prep_im_for_blob followed by im_list_to_blob, but images are
+  resized while still in uint8, and the float conversion and the mean
+  subtraction are fused into a single write into a blob taken from pool.
+  Only the padded borders of the blob are zeroed.
+
+  Returns the blob and the list of scales applied to the images.
+  """
+  if pool is None:
+    pool = _blob_pool
+  scaled_ims = []
+  im_scales = []
+  for im, target_size in zip(ims, target_sizes):
+    im_scale = im_scale_for_blob(im.shape, target_size, max_size)
+    im = cv2.resize(np.ascontiguousarray(im), None, None,
+                    fx=im_scale, fy=im_scale,
+                    interpolation=cv2.INTER_LINEAR)
+    scaled_ims.append(im)
+    im_scales.append(im_scale)
+
+  max_shape = np.array([im.shape for im in scaled_ims]).max(axis=0)
+  blob = pool.get((len(scaled_ims), max_shape[0], max_shape[1], 3))
+  for i, im in enumerate(scaled_ims):
+    h, w = im.shape[0:2]
+    np.subtract(im, pixel_means, out=blob[i, 0:h, 0:w, :],
+                dtype=np.float32, casting='unsafe')
+    blob[i, h:, :, :] = 0
+    blob[i, 0:h, w:, :] = 0
+
+  return blob, im_scales
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# Tensorflow Faster R-CNN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""Microbenchmark of the image blob construction.
+
+Compares prep_im_for_blob + im_list_to_blob (float32 resize, fresh blob
+on every call) against ims_to_blob (uint8 resize, fused mean subtraction,
+pooled blob) on synthetic KITTI-sized images.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import _init_paths
+from utils.blob import prep_im_for_blob, im_list_to_blob, ims_to_blob
+from model.config import cfg
+import argparse
+import time
+import numpy as np
+
+
+def parse_args():
+  """
+  Parse input arguments
+  """
+  parser = argparse.ArgumentParser(description='Benchmark blob construction')
+  parser.add_argument('--iters', dest='iters', help='timed iterations',
+                      default=50, type=int)
+  parser.add_argument('--ims', dest='num_ims', help='images per blob',
+                      default=1, type=int)
+  parser.add_argument('--height', dest='height', default=375, type=int)
+  parser.add_argument('--width', dest='width', default=1242, type=int)
+  args = parser.parse_args()
+  return args
+
+
+def old_blob(ims, target_sizes):
+  processed_ims = []
+  im_scales = []
+  for im, target_size in zip(ims, target_sizes):
+    im, im_scale = prep_im_for_blob(im, cfg.PIXEL_MEANS, target_size,
+                                    cfg.TRAIN.MAX_SIZE)
+    processed_ims.append(im)
+    im_scales.append(im_scale)
+  return im_list_to_blob(processed_ims), im_scales
+
+
+def new_blob(ims, target_sizes):
+  return ims_to_blob(ims, cfg.PIXEL_MEANS, target_sizes, cfg.TRAIN.MAX_SIZE)
+
+
+def time_fn(fn, ims, target_sizes, iters):
+  fn(ims, target_sizes)
+  start = time.time()
+  for _ in range(iters):
+    fn(ims, target_sizes)
+  return (time.time() - start) / iters
+
+
+if __name__ == '__main__':
+  args = parse_args()
+  np.random.seed(cfg.RNG_SEED)
+  ims = [np.random.randint(0, 256, size=(args.height, args.width, 3))
+           .astype(np.uint8) for _ in range(args.num_ims)]
+  target_sizes = [cfg.TRAIN.SCALES[i % len(cfg.TRAIN.SCALES)]
+                  for i in range(args.num_ims)]
+
+  blob_old, scales_old = old_blob(ims, target_sizes)
+  blob_new, scales_new = new_blob(ims, target_sizes)
+  assert blob_old.shape == blob_new.shape
+  assert np.allclose(scales_old, scales_new)
+  # uint8 resizing rounds the interpolated pixels, expect up to one level
+  print('max abs difference: {:.3f}'.format(np.abs(blob_old - blob_new).max()))
+
+  t_old = time_fn(old_blob, ims, target_sizes, args.iters)
+  t_new = time_fn(new_blob, ims, target_sizes, args.iters)
+  print('prep_im_for_blob + im_list_to_blob: {:.2f}ms'.format(t_old * 1000))
+  print('ims_to_blob:                        {:.2f}ms'.format(t_new * 1000))
+  print('speedup: {:.2f}x'.format(t_old / t_new))
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------
+# Tensorflow Faster R-CNN
+# Licensed under The MIT License [see LICENSE for details]
+# --------------------------------------------------------
+
+"""Benchmark and regression check of the numeric kernels in lib/.
+
+Synthetic KITTI-shaped inputs (wide 375x1242-like images, a few to a few
+dozen gt boxes, thousands of proposals) are generated at several scales and
+every kernel is timed on them. Only numpy and the compiled CPU extensions are
+needed, so the suite runs offline on a CPU-only machine; kernels whose
+extension is not built (e.g. gpu_nms) are skipped.
+
+    ./tools/benchmark_kernels.py --output bench.json
+    ./tools/benchmark_kernels.py --output new.json --baseline bench.json \\
+        --threshold 0.15
+
+With --baseline the results are compared against a stored run and the
+script exits with status 1 if any kernel got slower than the threshold.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import _init_paths
+from model.config import cfg
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+import numpy as np
+
+# Image size after the blob rescaling, number of gt boxes, proposals fed to
+# the RoI layers, boxes fed to NMS and number of images for voc_eval
+SCALES = OrderedDict([
+  ('small', {'im_size': (302, 1000), 'num_gt': 4, 'num_rois': 2000,
+             'num_dets': 2000, 'num_images': 50}),
+  ('kitti', {'im_size': (375, 1242), 'num_gt': 12, 'num_rois': 6000,
+             'num_dets': 6000, 'num_images': 200}),
+  ('large', {'im_size': (600, 1987), 'num_gt': 32, 'num_rois': 12000,
+             'num_dets': 12000, 'num_images': 500}),
+])
+
+FEAT_STRIDE = 16
+NUM_CLASSES = 3
+
+
+def parse_args():
+  """
+  Parse input arguments
+  """
+  parser = argparse.ArgumentParser(description='Benchmark the numeric kernels')
+  parser.add_argument('--output', dest='output', help='write results to JSON',
+                      default=None, type=str)
+  parser.add_argument('--baseline', dest='baseline',
+                      help='compare against this results JSON',
+                      default=None, type=str)
+  parser.add_argument('--threshold', dest='threshold',
+                      help='allowed relative slowdown before failing',
+                      default=0.1, type=float)
+  parser.add_argument('--repeat', dest='repeat', help='timed runs per kernel',
+                      default=20, type=int)
+  parser.add_argument('--scales', dest='scales', nargs='+',
+                      default=list(SCALES.keys()), choices=list(SCALES.keys()))
+  parser.add_argument('--kernels', dest='kernels', nargs='+', default=None,
+                      help='only run kernels whose name starts with these')
+  parser.add_argument('--seed', dest='seed', default=cfg.RNG_SEED, type=int)
+  args = parser.parse_args()
+  return args
+
+
+def random_boxes(rng, num, im_size, min_size=8, max_size=300):
+  """Random (x1, y1, x2, y2) boxes inside an image of im_size."""
+  h, w = im_size
+  bw = rng.uniform(min_size, min(max_size, w - 1), size=num)
+  bh = rng.uniform(min_size, min(max_size, h - 1), size=num)
+  x1 = rng.uniform(0, w - bw)
+  y1 = rng.uniform(0, h - bh)
+  return np.vstack((x1, y1, x1 + bw, y1 + bh)).transpose().astype(np.float32)
+
+
+def jitter_boxes(rng, boxes, num, im_size, sigma=0.15):
+  """Boxes scattered around the given ones, so that some overlap them."""
+  h, w = im_size
+  base = boxes[rng.randint(0, boxes.shape[0], size=num)]
+  size = np.hstack((base[:, 2:4] - base[:, 0:2],) * 2)
+  out = base + rng.normal(scale=sigma, size=base.shape) * size
+  out[:, 0::2] = np.clip(out[:, 0::2], 0, w - 1)
+  out[:, 1::2] = np.clip(out[:, 1::2], 0, h - 1)
+  out[:, 2:4] = np.maximum(out[:, 2:4], out[:, 0:2] + 1)
+  return out.astype(np.float32)
+
+
+def gt_boxes_for(rng, scale):
+  boxes = random_boxes(rng, scale['num_gt'], scale['im_size'])
+  classes = rng.randint(1, NUM_CLASSES, size=(scale['num_gt'], 1))
+  return np.hstack((boxes, classes)).astype(np.float32)
+
+
+def feat_size(scale):
+  h, w = scale['im_size']
+  return int(np.ceil(h / float(FEAT_STRIDE))), int(np.ceil(w / float(FEAT_STRIDE)))
+
+
+def setup_nms(backend):
+  def setup(rng, scale):
+    if backend == 'py':
+      from nms.py_cpu_nms import py_cpu_nms as fn
+    elif backend == 'cpu':
+      from nms.cpu_nms import cpu_nms as fn
+    else:
+      from nms.gpu_nms import gpu_nms as fn
+    gt = random_boxes(rng, scale['num_gt'], scale['im_size'])
+    boxes = jitter_boxes(rng, gt, scale['num_dets'], scale['im_size'])
+    scores = rng.uniform(size=(scale['num_dets'], 1)).astype(np.float32)
+    dets = np.hstack((boxes, scores))
+    return lambda: fn(dets, 0.7)
+  return setup
+
+
+def setup_bbox_overlaps(rng, scale):
+  from utils.cython_bbox import bbox_overlaps
+  gt = random_boxes(rng, scale['num_gt'], scale['im_size']).astype(np.float64)
+  rois = jitter_boxes(rng, gt, scale['num_rois'], scale['im_size']) \
+    .astype(np.float64)
+  return lambda: bbox_overlaps(rois, gt)
+
+
+def setup_bbox_transform(rng, scale):
+  from model.bbox_transform import bbox_transform
+  gt = random_boxes(rng, scale['num_gt'], scale['im_size'])
+  rois = jitter_boxes(rng, gt, scale['num_rois'], scale['im_size'])
+  targets = gt[rng.randint(0, gt.shape[0], size=rois.shape[0])]
+  return lambda: bbox_transform(rois, targets)
+
+
+def setup_bbox_transform_inv(rng, scale):
+  from model.bbox_transform import bbox_transform_inv
+  boxes = random_boxes(rng, scale['num_rois'], scale['im_size'])
+  deltas = rng.normal(scale=0.1, size=(scale['num_rois'], 4 * NUM_CLASSES)) \
+    .astype(np.float32)
+  return lambda: bbox_transform_inv(boxes, deltas)
+
+
+def setup_generate_anchors_pre(rng, scale):
+  from layer_utils.snippets import generate_anchors_pre
+  height, width = feat_size(scale)
+  return lambda: generate_anchors_pre(height, width, FEAT_STRIDE,
+                                      cfg.ANCHOR_SCALES, cfg.ANCHOR_RATIOS)
+
+
+def setup_anchor_target_layer(rng, scale):
+  from layer_utils.snippets import generate_anchors_pre
+  from layer_utils.anchor_target_layer import anchor_target_layer
+  height, width = feat_size(scale)
+  anchors, length = generate_anchors_pre(height, width, FEAT_STRIDE,
+                                         cfg.ANCHOR_SCALES, cfg.ANCHOR_RATIOS)
+  num_anchors = len(cfg.ANCHOR_SCALES) * len(cfg.ANCHOR_RATIOS)
+  rpn_cls_score = np.zeros((1, height, width, num_anchors * 2), dtype=np.float32)
+  gt_boxes = gt_boxes_for(rng, scale)
+  im_info = np.array([scale['im_size'][0], scale['im_size'][1], 1.],
+                     dtype=np.float32)
+  return lambda: anchor_target_layer(rpn_cls_score, gt_boxes, im_info,
+                                     FEAT_STRIDE, anchors, num_anchors)
+
+
+def setup_proposal_layer(rng, scale):
+  from layer_utils.snippets import generate_anchors_pre
+  from layer_utils.proposal_layer import proposal_layer
+  height, width = feat_size(scale)
+  anchors, length = generate_anchors_pre(height, width, FEAT_STRIDE,
+                                         cfg.ANCHOR_SCALES, cfg.ANCHOR_RATIOS)
+  num_anchors = len(cfg.ANCHOR_SCALES) * len(cfg.ANCHOR_RATIOS)
+  rpn_cls_prob = rng.uniform(size=(1, height, width, num_anchors * 2)) \
+    .astype(np.float32)
+  rpn_bbox_pred = rng.normal(scale=0.1, size=(1, height, width, num_anchors * 4)) \
+    .astype(np.float32)
+  im_info = np.array([scale['im_size'][0], scale['im_size'][1], 1.],
+                     dtype=np.float32)
+  return lambda: proposal_layer(rpn_cls_prob, rpn_bbox_pred, im_info, 'TRAIN',
+                                FEAT_STRIDE, anchors, num_anchors)
+
+
+def setup_proposal_target_layer(rng, scale):
+  from layer_utils.proposal_target_layer import proposal_target_layer
+  gt_boxes = gt_boxes_for(rng, scale)
+  rois = jitter_boxes(rng, gt_boxes[:, :4], scale['num_rois'], scale['im_size'])
+  rpn_rois = np.hstack((np.zeros((rois.shape[0], 1), dtype=np.float32), rois))
+  rpn_scores = rng.uniform(size=(rois.shape[0], 1)).astype(np.float32)
+  return lambda: proposal_target_layer(rpn_rois, rpn_scores, gt_boxes,
+                                       NUM_CLASSES)
+
+
+def _write_voc_annotation(filename, boxes, classes):
+  objs = []
+  for box, cls in zip(boxes.astype(np.int64), classes):
+    objs.append('<object><name>{}</name><pose>Unspecified</pose>'
+                '<truncated>0</truncated><difficult>0</difficult><bndbox>'
+                '<xmin>{}</xmin><ymin>{}</ymin><xmax>{}</xmax><ymax>{}</ymax>'
+                '</bndbox></object>'.format(cls, *box.tolist()))
+  with open(filename, 'w') as f:
+    f.write('<annotation>{}</annotation>'.format(''.join(objs)))
+
+
+def setup_voc_eval(rng, scale, workdir):
+  from datasets.voc_eval import voc_eval
+  names = ['{:06d}'.format(i) for i in range(scale['num_images'])]
+  annopath = os.path.join(workdir, '{:s}.xml')
+  imagesetfile = os.path.join(workdir, 'test.txt')
+  detpath = os.path.join(workdir, 'det_{:s}.txt')
+  cachedir = os.path.join(workdir, 'cache')
+  with open(imagesetfile, 'w') as f:
+    f.write(''.join(n + '\n' for n in names))
+  dets_per_image = max(1, scale['num_dets'] // scale['num_images'])
+  with open(detpath.format('Car'), 'w') as f:
+    for name in names:
+      gt = random_boxes(rng, scale['num_gt'], scale['im_size'])
+      _write_voc_annotation(annopath.format(name), gt, ['Car'] * len(gt))
+      dets = jitter_boxes(rng, gt, dets_per_image, scale['im_size'])
+      for box, score in zip(dets, rng.uniform(size=dets_per_image)):
+        f.write('{} {:.3f} {:.1f} {:.1f} {:.1f} {:.1f}\n'
+                .format(name, score, *box.tolist()))
+  return lambda: voc_eval(detpath, annopath, imagesetfile, 'Car', cachedir,
+                          ovthresh=0.5)
+
+
+KERNELS = OrderedDict([
+  ('nms_py', setup_nms('py')),
+  ('nms_cpu', setup_nms('cpu')),
+  ('nms_gpu', setup_nms('gpu')),
+  ('bbox_overlaps', setup_bbox_overlaps),
+  ('bbox_transform', setup_bbox_transform),
+  ('bbox_transform_inv', setup_bbox_transform_inv),
+  ('generate_anchors_pre', setup_generate_anchors_pre),
+  ('anchor_target_layer', setup_anchor_target_layer),
+  ('proposal_layer', setup_proposal_layer),
+  ('proposal_target_layer', setup_proposal_target_layer),
+  ('voc_eval', setup_voc_eval),
+])
+
+
+def time_kernel(fn, repeat):
+  """Time fn after one warm-up call, return statistics in milliseconds."""
+  fn()
+  times = np.zeros((repeat,))
+  for i in range(repeat):
+    start = time.perf_counter()
+    fn()
+    times[i] = time.perf_counter() - start
+  times *= 1000.
+  return {'median_ms': float(np.median(times)), 'mean_ms': float(times.mean()),
+          'min_ms': float(times.min()), 'repeat': repeat}
+
+
+def run(args):
+  results = OrderedDict()
+  workdir = tempfile.mkdtemp(prefix='frcnn_bench_')
+  try:
+    for name, setup in KERNELS.items():
+      if args.kernels and not any(name.startswith(k) for k in args.kernels):
+        continue
+      results[name] = OrderedDict()
+      for scale_name in args.scales:
+        rng = np.random.RandomState(args.seed)
+        np.random.seed(args.seed)
+        scale = SCALES[scale_name]
+        try:
+          if setup is setup_voc_eval:
+            scale_dir = os.path.join(workdir, scale_name)
+            os.makedirs(scale_dir)
+            fn = setup(rng, scale, scale_dir)
+          else:
+            fn = setup(rng, scale)
+        except ImportError as e:
+          print('{:<24s} skipped ({})'.format(name, e))
+          del results[name]
+          break
+        stats = time_kernel(fn, args.repeat)
+        results[name][scale_name] = stats
+        print('{:<24s} {:<6s} {:10.3f}ms'.format(name, scale_name,
+                                                 stats['median_ms']))
+  finally:
+    shutil.rmtree(workdir)
+  return results
+
+
+def compare(results, baseline, threshold):
+  """Print the change against baseline, return the regressed entries."""
+  regressions = []
+  print('\n{:<24s} {:<6s} {:>10s} {:>10s} {:>8s}'.format(
+    'kernel', 'scale', 'base(ms)', 'now(ms)', 'ratio'))
+  for name, scales in results.items():
+    for scale_name, stats in scales.items():
+      base = baseline.get(name, {}).get(scale_name)
+      if base is None:
+        continue
+      ratio = stats['median_ms'] / max(base['median_ms'], 1e-9)
+      flag = ''
+      if ratio > 1. + threshold:
+        flag = '  REGRESSION'
+        regressions.append((name, scale_name, ratio))
+      print('{:<24s} {:<6s} {:10.3f} {:10.3f} {:8.2f}{}'.format(
+        name, scale_name, base['median_ms'], stats['median_ms'], ratio, flag))
+  return regressions
+
+
+if __name__ == '__main__':
+  args = parse_args()
+  print('Called with args:')
+  print(args)
+
+  results = run(args)
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({'meta': {'python': platform.python_version(),
+                          'numpy': np.__version__,
+                          'machine': platform.machine(),
+                          'processor': platform.processor(),
+                          'seed': args.seed,
+                          'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+                 'results': results}, f, indent=2)
+    print('Wrote results to {:s}'.format(args.output))
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+      print('\n{:d} kernel(s) slower than {:.0%} over the baseline'.format(
+        len(regressions), args.threshold))
+      sys.exit(1)
+    print('\nNo regression over {:.0%}'.format(args.threshold))
@@ -1,112 +1,220 @@
-from xml.dom.minidom import Document  
-import cv2  
-import os  
-  
-def generate_xml(name,split_lines,img_size,class_ind):  
-    doc = Document()  # 创建DOM文档对象  
-  
-    annotation = doc.createElement('annotation')  
-    doc.appendChild(annotation)  
-  
-    title = doc.createElement('folder')  
-    title_text = doc.createTextNode('VOC2007')#这里修改了文件夹名  
-    title.appendChild(title_text)  
-    annotation.appendChild(title)  
-  
-    img_name=name+'.jpg'#要用jpg格式  
-  
-    title = doc.createElement('filename')  
-    title_text = doc.createTextNode(img_name)  
-    title.appendChild(title_text)  
-    annotation.appendChild(title)  
-  
-    source = doc.createElement('source')  
-    annotation.appendChild(source)  
-  
-    title = doc.createElement('database')  
-    title_text = doc.createTextNode('The VOC2007 Database')#修改为VOC  
-    title.appendChild(title_text)  
-    source.appendChild(title)  
-  
-    title = doc.createElement('annotation')  
-    title_text = doc.createTextNode('PASCAL VOC2007')#修改为VOC  
-    title.appendChild(title_text)  
-    source.appendChild(title)  
-  
-    size = doc.createElement('size')  
-    annotation.appendChild(size)  
-  
-    title = doc.createElement('width')  
-    title_text = doc.createTextNode(str(img_size[1]))  
-    title.appendChild(title_text)  
-    size.appendChild(title)  
-  
-    title = doc.createElement('height')  
-    title_text = doc.createTextNode(str(img_size[0]))  
-    title.appendChild(title_text)  
-    size.appendChild(title)  
-  
-    title = doc.createElement('depth')  
-    title_text = doc.createTextNode(str(img_size[2]))  
-    title.appendChild(title_text)  
-    size.appendChild(title)  
-  
-    for split_line in split_lines:  
-        line=split_line.strip().split()  
-        if line[0] in class_ind:  
-            object = doc.createElement('object')  
-            annotation.appendChild(object)  
-  
-            title = doc.createElement('name')  
-            title_text = doc.createTextNode(line[0])  
-            title.appendChild(title_text)  
-            object.appendChild(title)  
-          
-            title = doc.createElement('difficult')  
-            title_text = doc.createTextNode('0')  
-            title.appendChild(title_text)  
-            object.appendChild(title)  
-  
-            bndbox = doc.createElement('bndbox')  
-            object.appendChild(bndbox)  
-            title = doc.createElement('xmin')  
-            title_text = doc.createTextNode(str(int(float(line[4]))))  
-            title.appendChild(title_text)  
-            bndbox.appendChild(title)  
-            title = doc.createElement('ymin')  
-            title_text = doc.createTextNode(str(int(float(line[5]))))  
-            title.appendChild(title_text)  
-            bndbox.appendChild(title)  
-            title = doc.createElement('xmax')  
-            title_text = doc.createTextNode(str(int(float(line[6]))))  
-            title.appendChild(title_text)  
-            bndbox.appendChild(title)  
-            title = doc.createElement('ymax')  
-            title_text = doc.createTextNode(str(int(float(line[7]))))  
-            title.appendChild(title_text)  
-            bndbox.appendChild(title)  
-  
-    # 将DOM对象doc写入文件  
-    f = open('E:/KITTI/Annotation/'+name+'.xml','w+')  
-    f.write(doc.toprettyxml(indent = ''))  
-    f.close()  
-  
-if __name__ == '__main__':  
-    class_ind=('pedestrian', 'car')#修改为了两类  
-    os.chdir('E:/KITTI')
-    cur_dir=os.getcwd()  
-    labels_dir=os.path.join(cur_dir,'labels')  
-    for parent, dirnames, filenames in os.walk(labels_dir): # 分别得到根目录，子目录和根目录下文件     
-        for file_name in filenames:  
-            full_path=os.path.join(parent, file_name) # 获取文件全路径  
-            #print full_path  
-            f=open(full_path)  
-            split_lines = f.readlines()  
-            name= file_name[:-4] # 后四位是扩展名.txt，只取前面的文件名  
-            #print name  
-            img_name=name+'.jpg'   
-            img_path=os.path.join('E:/KITTI/images/test',img_name) # 路径需要自行修改              
-            #print img_path  
-            img_size=cv2.imread('E:/KITTI/images/000000.jpg').shape  
-            generate_xml(name,split_lines,img_size,class_ind)  
-#print('all txts has converted into xmls')  
\ No newline at end of file
+"""Convert KITTI label txt files to PASCAL VOC annotations.
+
+Usable as a module or as a script:
+
+    python txt_to_xml.py --labels E:/KITTI/labels --images E:/KITTI/JPEGImages \
+        --annotations E:/KITTI/Annotations
+
+Label files are converted by a process pool, image sizes are read from the
+image headers only, and the XML is serialized with ElementTree. With
+--roidb the training roidb cache (the pickle pascal_voc.gt_roidb loads) is
+written straight from the label files, optionally without any XML.
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import scipy.sparse
+from PIL import Image
+
+CLASSES = ('__background__', 'car', 'pedestrian')  # 修改为了两类
+
+
+def parse_label_file(path):
+    """Return the objects of a KITTI label file as a list of dicts."""
+    objects = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            objects.append({'name': fields[0],
+                            'truncated': float(fields[1]),
+                            'occluded': int(float(fields[2])),
+                            'alpha': float(fields[3]),
+                            'bbox': [float(x) for x in fields[4:8]]})
+    return objects
+
+
+def image_size(path):
+    """Return (height, width, depth) read from the image header only."""
+    with Image.open(path) as im:  # PIL只读取文件头，不解码整张图像
+        width, height = im.size
+        depth = len(im.getbands())
+    return height, width, depth
+
+
+def build_xml(name, objects, img_size, classes, image_ext='.jpg'):
+    """Build the VOC annotation tree of one image."""
+    annotation = ET.Element('annotation')
+    ET.SubElement(annotation, 'folder').text = 'VOC2007'  # 这里修改了文件夹名
+    ET.SubElement(annotation, 'filename').text = name + image_ext
+    source = ET.SubElement(annotation, 'source')
+    ET.SubElement(source, 'database').text = 'The VOC2007 Database'
+    ET.SubElement(source, 'annotation').text = 'PASCAL VOC2007'
+    size = ET.SubElement(annotation, 'size')
+    ET.SubElement(size, 'width').text = str(img_size[1])
+    ET.SubElement(size, 'height').text = str(img_size[0])
+    ET.SubElement(size, 'depth').text = str(img_size[2])
+
+    for obj in objects:
+        if obj['name'].lower() not in classes:
+            continue
+        node = ET.SubElement(annotation, 'object')
+        ET.SubElement(node, 'name').text = obj['name']
+        ET.SubElement(node, 'pose').text = 'Unspecified'
+        ET.SubElement(node, 'truncated').text = '1' if obj['truncated'] > 0 else '0'
+        ET.SubElement(node, 'difficult').text = '0'
+        bndbox = ET.SubElement(node, 'bndbox')
+        for tag, value in zip(('xmin', 'ymin', 'xmax', 'ymax'), obj['bbox']):
+            ET.SubElement(bndbox, tag).text = str(int(value))
+    return ET.ElementTree(annotation)
+
+
+def roidb_entry(objects, classes):
+    """Build the gt roidb entry pascal_voc._load_pascal_annotation would
+    produce from the XML written for these objects."""
+    class_to_ind = dict(zip(classes, range(len(classes))))
+    objects = [obj for obj in objects if obj['name'].lower() in class_to_ind]
+    num_objs = len(objects)
+    # XML里写入的是整数坐标，读取时再减1并截断到0
+    bbox = np.array([[int(v) for v in obj['bbox']] for obj in objects],
+                    dtype=np.float32).reshape((num_objs, 4))
+    bbox = np.maximum(bbox - 1, 0)
+    gt_classes = np.array([class_to_ind[obj['name'].lower()] for obj in objects],
+                          dtype=np.int32)
+    overlaps = np.zeros((num_objs, len(classes)), dtype=np.float32)
+    overlaps[np.arange(num_objs), gt_classes] = 1.0
+    seg_areas = ((bbox[:, 2] - bbox[:, 0] + 1) *
+                 (bbox[:, 3] - bbox[:, 1] + 1)).astype(np.float32)
+    return {'boxes': bbox.astype(np.uint16),
+            'gt_classes': gt_classes,
+            'gt_overlaps': scipy.sparse.csr_matrix(overlaps),
+            'flipped': False,
+            'seg_areas': seg_areas}
+
+
+def remap_objects(objects, class_map):
+    """Rename the objects through class_map, dropping those mapped to None."""
+    remapped = []
+    for obj in objects:
+        name = class_map.get(obj['name'], obj['name'])
+        if name is not None:
+            remapped.append(dict(obj, name=name))
+    return remapped
+
+
+def convert_one(task):
+    """Convert one label file; run inside the worker processes."""
+    (name, label_path, image_path, xml_path, classes, class_map, image_ext,
+     make_entry) = task
+    objects = parse_label_file(label_path)
+    if class_map is not None:
+        objects = remap_objects(objects, class_map)
+    if os.path.exists(image_path):
+        size = image_size(image_path)
+    elif xml_path is not None:
+        raise IOError('image not found: {}'.format(image_path))
+    else:
+        # The roidb alone does not need the image
+        size = None
+    if xml_path is not None:
+        tree = build_xml(name, objects, size, classes, image_ext)
+        tree.write(xml_path)
+    entry = roidb_entry(objects, classes) if make_entry else None
+    return name, size, entry
+
+
+def list_labels(labels_dir):
+    """Return the sorted image names of all label files in labels_dir."""
+    return sorted(os.path.splitext(e.name)[0] for e in os.scandir(labels_dir)
+                  if e.name.endswith('.txt'))
+
+
+def convert(labels_dir, images_dir, annotations_dir=None, classes=CLASSES,
+            names=None, roidb_file=None, workers=None, image_ext='.jpg',
+            chunksize=64, class_map=None, entries=False):
+    """Convert the label files of names (default: all) in parallel.
+
+    Writes one XML per image into annotations_dir unless it is None, and,
+    if roidb_file is given, pickles the gt roidb in the order of names.
+    Objects are renamed through class_map first if it is given.
+
+    Returns the list of image sizes in the order of names, and with
+    entries=True or a roidb_file also the list of gt roidb entries.
+    """
+    if names is None:
+        names = list_labels(labels_dir)
+    if annotations_dir is not None and not os.path.isdir(annotations_dir):
+        os.makedirs(annotations_dir)
+    classes = tuple(c.lower() for c in classes)
+    make_entry = entries or roidb_file is not None
+    tasks = ((name,
+              os.path.join(labels_dir, name + '.txt'),
+              os.path.join(images_dir, name + image_ext),
+              None if annotations_dir is None
+              else os.path.join(annotations_dir, name + '.xml'),
+              classes, class_map, image_ext, make_entry)
+             for name in names)
+
+    sizes = {}
+    roidb = {}
+    pool = multiprocessing.Pool(workers)
+    try:
+        for i, (name, size, entry) in enumerate(
+                pool.imap_unordered(convert_one, tasks, chunksize=chunksize)):
+            sizes[name] = size
+            roidb[name] = entry
+            if (i + 1) % 1000 == 0:
+                print('converted {:d}/{:d}'.format(i + 1, len(names)))
+    finally:
+        pool.close()
+        pool.join()
+
+    sizes = [sizes[name] for name in names]
+    if not make_entry:
+        return sizes
+    roidb = [roidb[name] for name in names]
+    if roidb_file is not None:
+        with open(roidb_file, 'wb') as fid:
+            pickle.dump(roidb, fid, pickle.HIGHEST_PROTOCOL)
+        print('wrote gt roidb to {}'.format(roidb_file))
+    return sizes, roidb
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert KITTI labels to VOC')
+    parser.add_argument('--labels', required=True, help='KITTI label txt dir')
+    parser.add_argument('--images', required=True, help='image dir')
+    parser.add_argument('--annotations', default=None,
+                        help='output dir of the VOC XML files')
+    parser.add_argument('--roidb', default=None,
+                        help='also write the gt roidb cache pickle here')
+    parser.add_argument('--image-set', default=None,
+                        help='ImageSets/Main txt file giving the roidb order')
+    parser.add_argument('--no-xml', action='store_true',
+                        help='only write the roidb cache')
+    parser.add_argument('--classes', nargs='+', default=CLASSES[1:])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--ext', default='.jpg', help='image extension')
+    args = parser.parse_args()
+    if args.no_xml:
+        args.annotations = None
+    if args.annotations is None and args.roidb is None:
+        parser.error('nothing to do, give --annotations and/or --roidb')
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    names = None
+    if args.image_set is not None:
+        with open(args.image_set) as f:
+            names = [x.strip() for x in f if x.strip()]
+    convert(args.labels, args.images, args.annotations,
+            classes=('__background__',) + tuple(args.classes), names=names,
+            roidb_file=args.roidb, workers=args.workers, image_ext=args.ext)
+    print('all txts has converted into xmls')
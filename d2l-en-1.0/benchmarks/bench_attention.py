@@ -0,0 +1,134 @@
+"""Compare the attention layers of d2l.model with their chunked versions.
+
+    python benchmarks/bench_attention.py
+    python benchmarks/bench_attention.py --num-keys 4096 --memory-budget 4
+
+First checks that ChunkedDotProductAttention and ChunkedMLPAttention give the
+outputs and gradients of DotProductAttention and MLPAttention, with the same
+parameters, for several chunk sizes and for no, per-example and per-query
+valid lengths. Then runs a forward pass of each layer on long keys, every
+one in a fresh process, and reports its time and the growth of the peak
+resident memory of the process.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import mxnet as mx
+import numpy as np
+from mxnet import autograd, nd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import d2l
+
+
+def make_layer(name, units, memory_budget):
+    if name == 'dot':
+        return d2l.DotProductAttention(0)
+    if name == 'mlp':
+        return d2l.MLPAttention(units, 0)
+    if name == 'chunked_dot':
+        return d2l.ChunkedDotProductAttention(0, memory_budget)
+    return d2l.ChunkedMLPAttention(units, 0, memory_budget)
+
+
+def make_inputs(batch_size, num_queries, num_keys, size, seed):
+    rng = np.random.RandomState(seed)
+    query, key, value = [nd.array(rng.randn(batch_size, n, size))
+                         for n in (num_queries, num_keys, num_keys)]
+    return query, key, value
+
+
+def run(layer, query, key, value, valid_length):
+    for x in (query, key, value):
+        x.attach_grad()
+    with autograd.record():
+        out = layer(query, key, value, valid_length)
+        # A loss that depends on every output
+        l = (out * nd.arange(out.size).reshape(out.shape) / out.size).sum()
+    l.backward()
+    grads = [x.grad.asnumpy() for x in (query, key, value)]
+    grads += [p.grad().asnumpy() for p in layer.collect_params().values()]
+    return out.asnumpy(), grads
+
+
+def check(units=8, batch_size=3, num_queries=4, num_keys=11, size=6):
+    query, key, value = make_inputs(batch_size, num_queries, num_keys, size, 0)
+    valid_lengths = [None, nd.array([0, 4, 11]),
+                     nd.array(np.random.RandomState(1).randint(
+                         0, num_keys + 1, (batch_size, num_queries)))]
+    max_diff = 0
+    for name in ['dot', 'mlp']:
+        full = make_layer(name, units, 0)
+        full.initialize()
+        full(query, key, value, None)
+        for chunk_size in [1, 3, 4, num_keys, 2 * num_keys]:
+            # The budget that gives chunks of chunk_size keys
+            if name == 'dot':
+                budget = chunk_size * 2 * batch_size * num_queries * 4
+            else:
+                budget = chunk_size * batch_size * num_queries * units * 4
+            chunked = make_layer('chunked_' + name, units, budget)
+            chunked.initialize()
+            chunked(query, key, value, None)
+            for p, q in zip(full.collect_params().values(),
+                            chunked.collect_params().values()):
+                q.set_data(p.data())
+            for valid_length in valid_lengths:
+                expected = run(full, query, key, value, valid_length)
+                actual = run(chunked, query, key, value, valid_length)
+                for x, y in zip([expected[0]] + expected[1],
+                                [actual[0]] + actual[1]):
+                    diff = np.abs(x - y).max()
+                    assert diff < 1e-5, (name, chunk_size, diff)
+                    max_diff = max(max_diff, diff)
+    return max_diff
+
+
+def measure(name, args):
+    """Time a forward pass of the layer, return the seconds and the growth
+    of the peak resident memory in bytes."""
+    layer = make_layer(name, args.units, int(args.memory_budget * 2 ** 20))
+    layer.initialize()
+    query, key, value = make_inputs(args.batch_size, args.num_queries,
+                                    args.num_keys, args.size, 2)
+    valid_length = nd.array(np.random.RandomState(3).randint(
+        1, args.num_keys + 1, (args.batch_size,)))
+    mx.nd.waitall()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        layer(query, key, value, valid_length)
+        mx.nd.waitall()
+        times.append(time.perf_counter() - start)
+    growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak
+    return np.median(times), growth * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--num-queries', type=int, default=64)
+    parser.add_argument('--num-keys', type=int, default=2048)
+    parser.add_argument('--size', type=int, default=64)
+    parser.add_argument('--units', type=int, default=64)
+    parser.add_argument('--memory-budget', type=float, default=8,
+                        help='memory budget of the chunked layers in MB')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('chunked outputs and gradients match (max diff %.1e)' % check())
+    pool = multiprocessing.get_context('spawn')
+    for name in ['dot', 'chunked_dot', 'mlp', 'chunked_mlp']:
+        with pool.Pool(1) as p:
+            seconds, growth = p.apply(measure, (name, args))
+        print('%-12s %8.1f ms  peak memory +%7.1f MB'
+              % (name, seconds * 1e3, growth / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
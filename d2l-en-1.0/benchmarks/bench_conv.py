@@ -0,0 +1,152 @@
+"""Compare the loop and the im2col versions of corr2d and pool2d.
+
+    python benchmarks/bench_conv.py
+    python benchmarks/bench_conv.py --size 64 --repeat 5
+
+Checks that d2l.corr2d, corr2d_multi_in, corr2d_multi_in_out,
+corr2d_multi_in_out_1x1 and pool2d give the results of the former loop
+implementations, on NumPy arrays and on NDArrays, and with stride and
+padding the results of nd.Convolution and nd.Pooling. Then times the loop
+and the im2col versions on a size x size image.
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+from mxnet import nd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import d2l
+
+
+def loop_corr2d(X, K):
+    h, w = K.shape
+    Y = nd.zeros((X.shape[0] - h + 1, X.shape[1] - w + 1))
+    for i in range(Y.shape[0]):
+        for j in range(Y.shape[1]):
+            Y[i, j] = (X[i: i + h, j: j + w] * K).sum()
+    return Y
+
+
+def loop_corr2d_multi_in(X, K):
+    return nd.add_n(*[loop_corr2d(x, k) for x, k in zip(X, K)])
+
+
+def loop_corr2d_multi_in_out(X, K):
+    return nd.stack(*[loop_corr2d_multi_in(X, k) for k in K])
+
+
+def loop_pool2d(X, pool_size, mode='max'):
+    p_h, p_w = pool_size
+    Y = nd.zeros((X.shape[0] - p_h + 1, X.shape[1] - p_w + 1))
+    for i in range(Y.shape[0]):
+        for j in range(Y.shape[1]):
+            if mode == 'max':
+                Y[i, j] = X[i: i + p_h, j: j + p_w].max()
+            elif mode == 'avg':
+                Y[i, j] = X[i: i + p_h, j: j + p_w].mean()
+    return Y
+
+
+def close(x, y):
+    x = x.asnumpy() if isinstance(x, nd.NDArray) else x
+    y = y.asnumpy() if isinstance(y, nd.NDArray) else y
+    assert x.shape == y.shape, (x.shape, y.shape)
+    return np.abs(x - y).max() <= 1e-5 * max(1, np.abs(x).max())
+
+
+def check():
+    rng = np.random.RandomState(0)
+    X = rng.randn(3, 9, 11).astype(np.float32)
+    K = rng.randn(2, 3, 3, 2).astype(np.float32)
+    K1 = rng.randn(2, 3, 1, 1).astype(np.float32)
+    for array in [np.array, nd.array]:
+        x, k, k1 = array(X), array(K), array(K1)
+        assert close(d2l.corr2d(x[0], k[0, 0]),
+                     loop_corr2d(nd.array(X[0]), nd.array(K[0, 0])))
+        assert close(d2l.corr2d_multi_in(x, k[0]),
+                     loop_corr2d_multi_in(nd.array(X), nd.array(K[0])))
+        assert close(d2l.corr2d_multi_in_out(x, k),
+                     loop_corr2d_multi_in_out(nd.array(X), nd.array(K)))
+        assert close(d2l.corr2d_multi_in_out_1x1(x, k1),
+                     loop_corr2d_multi_in_out(nd.array(X), nd.array(K1)))
+        for mode in ['max', 'avg']:
+            assert close(d2l.pool2d(x[0], (2, 3), mode),
+                         loop_pool2d(nd.array(X[0]), (2, 3), mode))
+        for stride, pad in itertools.product([1, 2, (2, 3)], [0, 1, (1, 2)]):
+            pad2 = (pad, pad) if isinstance(pad, int) else pad
+            stride2 = (stride, stride) if isinstance(stride, int) else stride
+            expected = nd.Convolution(
+                nd.array(X[None]), nd.array(K), kernel=(3, 2),
+                stride=stride2, pad=pad2, num_filter=2, no_bias=True)[0]
+            assert close(d2l.corr2d_multi_in_out(x, k, stride, pad),
+                         expected)
+            expected = nd.Convolution(
+                nd.array(X[None]), nd.array(K1), kernel=(1, 1),
+                stride=stride2, pad=pad2, num_filter=2, no_bias=True)[0]
+            assert close(d2l.corr2d_multi_in_out_1x1(x, k1, stride, pad),
+                         expected)
+            for mode in ['max', 'avg']:
+                # The window must be larger than the padding
+                expected = nd.Pooling(
+                    nd.array(X[None]), kernel=(3, 3), pool_type=mode,
+                    stride=stride2, pad=pad2)[0]
+                assert close(d2l.pool2d(x, (3, 3), mode, stride, pad),
+                             expected), (mode, stride, pad)
+    # Integer inputs keep their dtype and the max padding is ignored
+    x = np.arange(16, dtype=np.int64).reshape(4, 4) - 20
+    assert (d2l.pool2d(x, 2, 'max', 2, 1) ==
+            [[-20, -18, -17], [-12, -10, -9], [-8, -6, -5]]).all()
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        y = fn()
+        if isinstance(y, nd.NDArray):
+            y.wait_to_read()
+        times.append(time.perf_counter() - start)
+    return np.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=32)
+    parser.add_argument('--channels', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    check()
+    print('im2col versions match the loop versions, nd.Convolution and '
+          'nd.Pooling')
+    rng = np.random.RandomState(1)
+    X = rng.randn(args.channels, args.size, args.size).astype(np.float32)
+    K = rng.randn(2, args.channels, 3, 3).astype(np.float32)
+    Xn, Kn = nd.array(X), nd.array(K)
+    cases = [
+        ('corr2d', lambda: loop_corr2d(Xn[0], Kn[0, 0]),
+         lambda: d2l.corr2d(Xn[0], Kn[0, 0]),
+         lambda: d2l.corr2d(X[0], K[0, 0])),
+        ('corr2d_multi_in_out', lambda: loop_corr2d_multi_in_out(Xn, Kn),
+         lambda: d2l.corr2d_multi_in_out(Xn, Kn),
+         lambda: d2l.corr2d_multi_in_out(X, K)),
+        ('pool2d max', lambda: loop_pool2d(Xn[0], (3, 3)),
+         lambda: d2l.pool2d(Xn[0], (3, 3)),
+         lambda: d2l.pool2d(X[0], (3, 3))),
+    ]
+    for name, loop, vec_nd, vec_np in cases:
+        t_loop = timeit(loop, args.repeat)
+        t_nd = timeit(vec_nd, args.repeat * 10)
+        t_np = timeit(vec_np, args.repeat * 10)
+        print('%-20s loop %9.2f ms  NDArray %6.3f ms (%5.0fx)  '
+              'NumPy %6.3f ms (%5.0fx)'
+              % (name, t_loop * 1e3, t_nd * 1e3, t_loop / t_nd, t_np * 1e3,
+                 t_loop / t_np))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Compare the CPU throughput of the d2l.model blocks imperative and
+hybridized.
+
+    python benchmarks/bench_hybridize.py
+    python benchmarks/bench_hybridize.py --models resnet18 rnn --repeat 20
+
+Times the forward pass and a forward-backward pass of every block on the
+same parameters and inputs, first imperatively and then hybridized, and
+checks that both give the same outputs.
+"""
+import argparse
+import os
+import sys
+import time
+
+import mxnet as mx
+import numpy as np
+from mxnet import autograd, nd
+from mxnet.gluon import rnn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import d2l
+
+
+def resnet18(batch_size):
+    net = d2l.resnet18(10)
+    return net, (nd.random.normal(shape=(batch_size, 1, 28, 28)),)
+
+
+def rnn_model(batch_size, num_steps=35, vocab_size=1027):
+    net = d2l.RNNModel(rnn.LSTM(256), vocab_size)
+    inputs = nd.random.randint(0, vocab_size, shape=(batch_size, num_steps))
+    state = net.begin_state(batch_size=batch_size)
+    return net, (inputs.astype('float32'), state)
+
+
+def seq2seq_encoder(batch_size, num_steps=30, vocab_size=5000):
+    net = d2l.Seq2SeqEncoder(vocab_size, 32, 64, 2)
+    inputs = nd.random.randint(0, vocab_size, shape=(batch_size, num_steps))
+    return net, (inputs.astype('float32'),)
+
+
+def attention(cls, batch_size, num_queries=10, num_keys=30, size=64):
+    net = cls(0.1) if cls is d2l.DotProductAttention else cls(size, 0.1)
+    valid_length = nd.random.randint(1, num_keys + 1, shape=(batch_size,))
+    query = nd.random.normal(shape=(batch_size, num_queries, size))
+    key = nd.random.normal(shape=(batch_size, num_keys, size))
+    value = nd.random.normal(shape=(batch_size, num_keys, size))
+    # DotProductAttention has no parameters to differentiate
+    for x in [query, key, value]:
+        x.attach_grad()
+    return net, (query, key, value, valid_length.astype('float32'))
+
+
+MODELS = {
+    'resnet18': resnet18,
+    'rnn': rnn_model,
+    'encoder': seq2seq_encoder,
+    'dot_attention': lambda b: attention(d2l.DotProductAttention, b),
+    'mlp_attention': lambda b: attention(d2l.MLPAttention, b),
+}
+
+
+def flatten(x):
+    if isinstance(x, nd.NDArray):
+        return [x]
+    return [z for y in x for z in flatten(y)]
+
+
+def forward(net, inputs):
+    return flatten(net(*inputs))
+
+
+def forward_backward(net, inputs):
+    with autograd.record():
+        outputs = flatten(net(*inputs))
+    autograd.backward(outputs)
+    return outputs
+
+
+def timeit(fn, net, inputs, repeat):
+    fn(net, inputs)  # warm-up, builds the graph when hybridized
+    mx.nd.waitall()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(net, inputs)
+        mx.nd.waitall()
+        times.append(time.perf_counter() - start)
+    return np.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--models', nargs='+', default=sorted(MODELS),
+                        choices=sorted(MODELS))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    for name in args.models:
+        mx.random.seed(0)
+        net, inputs = MODELS[name](args.batch_size)
+        net.initialize()
+        times = {}
+        for fn in [forward, forward_backward]:
+            times[fn.__name__] = [timeit(fn, net, inputs, args.repeat)]
+        # Compared before the hybridized training passes update the
+        # BatchNorm statistics
+        expected = [y.asnumpy() for y in forward(net, inputs)]
+        net.hybridize(static_alloc=True, static_shape=True)
+        diff = max(np.abs(x - y.asnumpy()).max()
+                   for x, y in zip(expected, forward(net, inputs)))
+        assert diff < 1e-4, (name, diff)
+        for fn in [forward, forward_backward]:
+            times[fn.__name__].append(timeit(fn, net, inputs, args.repeat))
+        for fn_name, (imperative, hybridized) in sorted(times.items()):
+            print('%-14s %-16s imperative %8.1f samples/sec  hybridized '
+                  '%8.1f samples/sec  %.2fx'
+                  % (name, fn_name, args.batch_size / imperative,
+                     args.batch_size / hybridized, imperative / hybridized))
+
+
+if __name__ == '__main__':
+    main()
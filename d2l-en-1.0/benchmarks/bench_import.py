@@ -0,0 +1,95 @@
+"""Check the import time budget of the d2l package.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --budget-ms 50 --repeat 5
+
+Imports d2l in fresh interpreters and fails (exit status 1) if the median
+import time is over --budget-ms, if the import loads MXNet, matplotlib or
+IPython, or if the name tables of the lazy d2l and d2l.data packages differ
+from the __all__ of their submodules. It also reports the time of the first
+use of a name, which loads MXNet, and of loading every submodule.
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+HEAVY = ['mxnet', 'matplotlib', 'IPython']
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import d2l
+imported = time.perf_counter()
+loaded = [m for m in %r if m in sys.modules]
+d2l.try_gpu()
+first_use = time.perf_counter()
+for name in d2l.__all__:
+    getattr(d2l, name)
+everything = time.perf_counter()
+print(json.dumps({'import': imported - start, 'loaded': loaded,
+                  'first_use': first_use - imported,
+                  'everything': everything - imported}))
+''' % HEAVY
+
+
+def probe():
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    out = subprocess.check_output([sys.executable, '-c', PROBE], env=env,
+                                  stderr=subprocess.DEVNULL)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def check_tables():
+    """Return the names missing from or extra in the lazy name tables."""
+    sys.path.insert(0, ROOT)
+    import d2l
+    errors = []
+    for package in [d2l, importlib.import_module('d2l.data')]:
+        for module, names in package._SUBMODULES.items():
+            module = importlib.import_module(package.__name__ + '.' + module)
+            if sorted(names) != sorted(module.__all__):
+                errors.append((module.__name__,
+                               sorted(set(module.__all__) - set(names)),
+                               sorted(set(names) - set(module.__all__))))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--budget-ms', type=float, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    runs = [probe() for _ in range(args.repeat)]
+    import_ms = 1e3 * np.median([r['import'] for r in runs])
+    print('import d2l            %8.1f ms' % import_ms)
+    print('first use (MXNet)     %8.1f ms'
+          % (1e3 * np.median([r['first_use'] for r in runs])))
+    print('every name            %8.1f ms'
+          % (1e3 * np.median([r['everything'] for r in runs])))
+
+    failures = []
+    if import_ms > args.budget_ms:
+        failures.append('import d2l took %.1f ms, over the budget of %.1f ms'
+                        % (import_ms, args.budget_ms))
+    loaded = sorted(set(m for r in runs for m in r['loaded']))
+    if loaded:
+        failures.append('import d2l loaded %s' % ', '.join(loaded))
+    for module, missing, extra in check_tables():
+        failures.append('the lazy table of %s misses %s and has extra %s'
+                        % (module, missing, extra))
+    for failure in failures:
+        print('FAIL: ' + failure)
+    if failures:
+        sys.exit(1)
+    print('OK: within the budget of %.1f ms' % args.budget_ms)
+
+
+if __name__ == '__main__':
+    main()
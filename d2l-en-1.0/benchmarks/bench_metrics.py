@@ -0,0 +1,127 @@
+"""Compare per-batch asscalar() metrics with d2l.Accumulator on CPU.
+
+    python benchmarks/bench_metrics.py --net lenet --num-epochs 3
+    python benchmarks/bench_metrics.py --net mlp
+
+Trains the same network (LeNet, or the one hidden layer MLP of the
+multilayer perceptron chapter), from the same initial parameters, for a few
+epochs
+on random Fashion-MNIST shaped data, once reading the loss and accuracy of
+every batch with asscalar() (the former train_ch5 loop) and once summing
+them on the device with Accumulator, and reports the time per epoch and the
+metrics of both, which must agree.
+"""
+import argparse
+import os
+import sys
+import time
+
+import mxnet as mx
+import numpy as np
+from mxnet import autograd, gluon, init, nd
+from mxnet.gluon import data as gdata, loss as gloss, nn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import d2l
+
+
+def lenet():
+    net = nn.Sequential()
+    net.add(nn.Conv2D(6, kernel_size=5, activation='sigmoid'),
+            nn.MaxPool2D(pool_size=2, strides=2),
+            nn.Conv2D(16, kernel_size=5, activation='sigmoid'),
+            nn.MaxPool2D(pool_size=2, strides=2),
+            nn.Dense(120, activation='sigmoid'),
+            nn.Dense(84, activation='sigmoid'),
+            nn.Dense(10))
+    return net
+
+
+def mlp():
+    net = nn.Sequential()
+    net.add(nn.Dense(256, activation='relu'), nn.Dense(10))
+    return net
+
+
+def sync_epoch(net, train_iter, trainer, loss, batch_size, ctx):
+    train_l_sum, train_acc_sum, n = 0.0, 0.0, 0
+    for X, y in train_iter:
+        X, y = X.as_in_context(ctx), y.as_in_context(ctx)
+        with autograd.record():
+            y_hat = net(X)
+            l = loss(y_hat, y).sum()
+        l.backward()
+        trainer.step(batch_size)
+        y = y.astype('float32')
+        train_l_sum += l.asscalar()
+        train_acc_sum += (y_hat.argmax(axis=1) == y).sum().asscalar()
+        n += y.size
+    return train_l_sum / n, train_acc_sum / n
+
+
+def accumulated_epoch(net, train_iter, trainer, loss, batch_size, ctx):
+    metric = d2l.Accumulator(3)
+    for X, y in train_iter:
+        X, y = X.as_in_context(ctx), y.as_in_context(ctx)
+        with autograd.record():
+            y_hat = net(X)
+            l = loss(y_hat, y).sum()
+        l.backward()
+        trainer.step(batch_size)
+        y = y.astype('float32')
+        metric.add(l, (y_hat.argmax(axis=1) == y).sum(), y.size)
+    train_l_sum, train_acc_sum, n = metric.result()
+    return train_l_sum / n, train_acc_sum / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--net', choices=['lenet', 'mlp'], default='lenet')
+    parser.add_argument('--num-examples', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--num-epochs', type=int, default=3)
+    args = parser.parse_args()
+    ctx = mx.cpu()
+
+    rng = np.random.RandomState(0)
+    features = rng.rand(args.num_examples, 1, 28, 28).astype(np.float32)
+    labels = rng.randint(0, 10, args.num_examples).astype(np.float32)
+    train_iter = gdata.DataLoader(gdata.ArrayDataset(features, labels),
+                                  args.batch_size)
+    loss = gloss.SoftmaxCrossEntropyLoss()
+
+    net = lenet() if args.net == 'lenet' else mlp()
+    net.initialize(init.Xavier(), ctx=ctx)
+    net(nd.array(features[:1], ctx=ctx))
+    fname = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '.bench_metrics.params')
+    net.save_parameters(fname)
+
+    results = {}
+    for name, epoch_fn in [('asscalar', sync_epoch),
+                           ('accumulator', accumulated_epoch)]:
+        net.load_parameters(fname, ctx=ctx)
+        trainer = gluon.Trainer(net.collect_params(), 'sgd',
+                                {'learning_rate': 0.1})
+        times, metrics = [], []
+        for _ in range(args.num_epochs):
+            mx.nd.waitall()
+            start = time.perf_counter()
+            metrics.append(epoch_fn(net, train_iter, trainer, loss,
+                                    args.batch_size, ctx))
+            times.append(time.perf_counter() - start)
+        # The first epoch includes the warm-up
+        results[name] = np.median(times[1:] or times), metrics
+        print('%-12s %.3f sec/epoch  %s' % (name, results[name][0], ' '.join(
+            'loss %.4f acc %.3f' % m for m in metrics)))
+    os.remove(fname)
+
+    for (l1, a1), (l2, a2) in zip(results['asscalar'][1],
+                                  results['accumulator'][1]):
+        assert abs(l1 - l2) <= 1e-5 * abs(l1) and a1 == a2
+    print('speedup %.2fx' % (results['asscalar'][0] /
+                             results['accumulator'][0]))
+
+
+if __name__ == '__main__':
+    main()
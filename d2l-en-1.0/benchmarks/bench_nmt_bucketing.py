@@ -0,0 +1,106 @@
+"""Compare seq2seq training throughput on padded and length-bucketed batches.
+
+    python benchmarks/bench_nmt_bucketing.py --data-dir ./data
+
+Trains the same encoder-decoder for a few epochs on the batches of
+load_data_nmt (padded to max_len) and of load_data_nmt_bucketed (trimmed to
+the longest pair of each bucketed batch), and reports the valid target
+tokens per second and the share of padding the LSTMs process. It also checks
+that MaskedSoftmaxCELoss gives the same per-token loss on a padded and on a
+trimmed batch. fra-eng.zip is downloaded to --data-dir if it is not there.
+"""
+import argparse
+import os
+import sys
+import time
+
+import mxnet as mx
+from mxnet import autograd, gluon, init, nd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import d2l
+from d2l.train import MaskedSoftmaxCELoss
+
+
+def check_loss(vocab_size, ctx):
+    """The per-token loss must not depend on the padding of the batch."""
+    loss = MaskedSoftmaxCELoss()
+    valid_len = nd.array([3, 5, 1, 4], ctx=ctx)
+    pred = nd.random.normal(shape=(4, 12, vocab_size), ctx=ctx)
+    label = nd.random.randint(0, vocab_size, shape=(4, 12),
+                              ctx=ctx).astype('float32')
+    padded = loss(pred, label, valid_len).sum().asscalar()
+    trimmed = loss(pred[:, :5], label[:, :5], valid_len).sum().asscalar()
+    assert abs(padded - trimmed) <= 1e-5 * abs(padded), (padded, trimmed)
+
+
+def train(data_iter, src_size, tgt_size, args, ctx):
+    encoder = d2l.Seq2SeqEncoder(src_size, args.embed_size, args.num_hiddens,
+                                 args.num_layers)
+    decoder = d2l.Seq2SeqDecoder(tgt_size, args.embed_size, args.num_hiddens,
+                                 args.num_layers)
+    model = d2l.EncoderDecoder(encoder, decoder)
+    model.initialize(init.Xavier(), ctx=ctx)
+    trainer = gluon.Trainer(model.collect_params(), 'adam',
+                            {'learning_rate': args.lr})
+    loss = MaskedSoftmaxCELoss()
+    l_sum = num_tokens = num_slots = 0.0
+    mx.nd.waitall()
+    start = time.perf_counter()
+    for _ in range(args.num_epochs):
+        for batch in data_iter:
+            X, X_vlen, Y, Y_vlen = [x.as_in_context(ctx) for x in batch]
+            Y_input, Y_label, Y_vlen = Y[:, :-1], Y[:, 1:], Y_vlen - 1
+            with autograd.record():
+                Y_hat, _ = model(X, Y_input, X_vlen, Y_vlen)
+                l = loss(Y_hat, Y_label, Y_vlen)
+            l.backward()
+            d2l.grad_clipping_gluon(model, 5, ctx)
+            n = Y_vlen.sum().asscalar()
+            trainer.step(n)
+            l_sum += l.sum().asscalar()
+            num_tokens += n
+            num_slots += X.size + Y_label.size
+    mx.nd.waitall()
+    elapsed = time.perf_counter() - start
+    return l_sum / num_tokens, num_tokens / elapsed, num_slots, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--data-dir', default='.')
+    parser.add_argument('--num-examples', type=int, default=10000)
+    parser.add_argument('--max-len', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--num-buckets', type=int, default=10)
+    parser.add_argument('--num-epochs', type=int, default=2)
+    parser.add_argument('--embed-size', type=int, default=32)
+    parser.add_argument('--num-hiddens', type=int, default=32)
+    parser.add_argument('--num-layers', type=int, default=2)
+    parser.add_argument('--lr', type=float, default=0.005)
+    args = parser.parse_args()
+    ctx = d2l.try_gpu()
+
+    os.chdir(args.data_dir)
+    src_vocab, tgt_vocab, padded_iter = d2l.load_data_nmt(
+        args.batch_size, args.max_len, args.num_examples)
+    _, _, bucketed_iter = d2l.load_data_nmt_bucketed(
+        args.batch_size, args.max_len, args.num_examples,
+        num_buckets=args.num_buckets)
+    check_loss(len(tgt_vocab), ctx)
+
+    results = {}
+    for name, data_iter in [('padded', padded_iter),
+                            ('bucketed', bucketed_iter)]:
+        results[name] = train(data_iter, len(src_vocab), len(tgt_vocab),
+                              args, ctx)
+        l, speed, slots, elapsed = results[name]
+        print('%-9s loss %.3f  %8.0f tokens/sec  %9d token slots  %.1f sec'
+              % (name, l, speed, slots, elapsed))
+    print('bucketed: %.2fx tokens/sec, %.0f%% of the padded token slots' % (
+        results['bucketed'][1] / results['padded'][1],
+        100 * results['bucketed'][2] / results['padded'][2]))
+
+
+if __name__ == '__main__':
+    main()
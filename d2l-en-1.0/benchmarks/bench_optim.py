@@ -0,0 +1,123 @@
+"""Compare the former gradient clipping and sgd with the fused versions.
+
+    python benchmarks/bench_optim.py
+
+For the parameters of the scratch RNN of the RNN chapter and of ResNet-18,
+checks that d2l.grad_clipping gives bit-identical gradients to the former
+implementation (which read the norm back with asscalar() and rescaled every
+gradient separately), both when the gradient is clipped and when it is not,
+and that d2l.sgd_fused gives bit-identical parameters to d2l.sgd for
+power-of-two batch sizes. Then times a clip and update step of each.
+"""
+import argparse
+import os
+import sys
+import time
+
+import mxnet as mx
+import numpy as np
+from mxnet import nd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import d2l
+
+
+def reference_grad_clipping(params, theta, ctx):
+    norm = nd.array([0], ctx)
+    for param in params:
+        norm += (param.grad ** 2).sum()
+    norm = norm.sqrt().asscalar()
+    if norm > theta:
+        for param in params:
+            param.grad[:] *= theta / norm
+
+
+def rnn_params(vocab_size=1027, num_hiddens=256):
+    return [(vocab_size, num_hiddens), (num_hiddens, num_hiddens),
+            (num_hiddens,), (num_hiddens, vocab_size), (vocab_size,)]
+
+
+def resnet18_params():
+    net = d2l.resnet18(10)
+    net.initialize()
+    net(nd.zeros((1, 1, 96, 96)))
+    return [p.shape for p in net.collect_params().values()
+            if p.grad_req != 'null']
+
+
+def make_params(shapes, seed, ctx):
+    rng = np.random.RandomState(seed)
+    params = []
+    for shape in shapes:
+        param = nd.array(rng.randn(*shape), ctx=ctx)
+        param.attach_grad()
+        param.grad[:] = nd.array(rng.randn(*shape), ctx=ctx)
+        params.append(param)
+    return params
+
+
+def same(a, b):
+    return all((x.asnumpy() == y.asnumpy()).all() for x, y in zip(a, b))
+
+
+def check(shapes, ctx):
+    for theta in [1e-2, 1e6]:  # clipped, not clipped
+        a, b = make_params(shapes, 0, ctx), make_params(shapes, 0, ctx)
+        reference_grad_clipping(a, theta, ctx)
+        d2l.grad_clipping(b, theta, ctx)
+        assert same([p.grad for p in a], [p.grad for p in b]), theta
+    for batch_size in [1, 2, 64, 256]:
+        a, b = make_params(shapes, 1, ctx), make_params(shapes, 1, ctx)
+        d2l.sgd(a, 0.1, batch_size)
+        d2l.sgd_fused(b, 0.1, batch_size)
+        assert same(a, b), batch_size
+    a, b = make_params(shapes, 1, ctx), make_params(shapes, 1, ctx)
+    d2l.sgd(a, 0.1, 100)
+    d2l.sgd_fused(b, 0.1, 100)
+    return max(np.abs(x.asnumpy() - y.asnumpy()).max() for x, y in zip(a, b))
+
+
+def timeit(step, params, repeat):
+    times = []
+    for _ in range(repeat):
+        mx.nd.waitall()
+        start = time.perf_counter()
+        step(params)
+        mx.nd.waitall()
+        times.append(time.perf_counter() - start)
+    return np.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+    ctx = d2l.try_gpu()
+
+    def reference_step(params):
+        reference_grad_clipping(params, 1e-2, ctx)
+        d2l.sgd(params, 0.1, 256)
+
+    def fused_step(params):
+        d2l.grad_clipping(params, 1e-2, ctx)
+        d2l.sgd_fused(params, 0.1, 256)
+
+    for name, shapes in [('rnn', rnn_params()),
+                         ('resnet18', resnet18_params())]:
+        diff = check(shapes, ctx)
+        params = make_params(shapes, 2, ctx)
+        t_ref = timeit(reference_step, params, args.repeat)
+        t_fused = timeit(fused_step, params, args.repeat)
+        t_sgd = timeit(lambda p: d2l.sgd(p, 0.1, 256), params, args.repeat)
+        t_sgd_fused = timeit(lambda p: d2l.sgd_fused(p, 0.1, 256), params,
+                             args.repeat)
+        print('%-9s %3d params  identical (batch size 100: max diff %.1e)  '
+              'former %.2f ms  fused %.2f ms  %.2fx'
+              % (name, len(shapes), diff, t_ref * 1e3, t_fused * 1e3,
+                 t_ref / t_fused))
+        print('%-9s sgd alone: former %.2f ms  fused %.2f ms  %.2fx'
+              % ('', t_sgd * 1e3, t_sgd_fused * 1e3, t_sgd / t_sgd_fused))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""Benchmark suite of the d2l models and training helpers.
+
+    python benchmarks/bench_suite.py --output bench.json
+    python benchmarks/bench_suite.py --output new.json --baseline bench.json
+    python benchmarks/bench_suite.py --cases model/resnet18 --profile prof
+
+Every case is timed with d2l.benchmark on synthetic data: warm-up calls, then
+repeated calls each waiting for the engine, reported as median and 95th
+percentile with the rise of the peak resident memory over the resident memory
+before the case. With --profile DIR one more call of every case is traced with
+mx.profiler into DIR and its most expensive operators are printed. With
+--baseline the results are compared against a stored run and the script exits
+with status 1 if any case got slower than --threshold.
+"""
+import argparse
+import collections
+import json
+import os
+import platform
+import sys
+import time
+
+import mxnet as mx
+import numpy as np
+from mxnet import autograd, gluon, init, nd
+from mxnet.gluon import data as gdata, loss as gloss, nn, rnn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import d2l
+from d2l.train import MaskedSoftmaxCELoss
+
+
+def setup_resnet18_forward(ctx, batch_size=64):
+    net = d2l.resnet18(10)
+    net.initialize(init.Xavier(), ctx=ctx)
+    X = nd.random.uniform(shape=(batch_size, 1, 28, 28), ctx=ctx)
+    return lambda: net(X)
+
+
+def setup_resnet18_train_step(ctx, batch_size=64):
+    net = d2l.resnet18(10)
+    net.initialize(init.Xavier(), ctx=ctx)
+    X = nd.random.uniform(shape=(batch_size, 1, 28, 28), ctx=ctx)
+    y = nd.random.randint(0, 10, shape=(batch_size,), ctx=ctx)
+    trainer = gluon.Trainer(net.collect_params(), 'sgd',
+                            {'learning_rate': 0.01})
+    loss = gloss.SoftmaxCrossEntropyLoss()
+
+    def step():
+        with autograd.record():
+            l = loss(net(X), y).sum()
+        l.backward()
+        trainer.step(batch_size)
+    return step
+
+
+def setup_rnn_train_step(ctx, batch_size=32, num_steps=35, vocab_size=1027):
+    model = d2l.RNNModel(rnn.LSTM(256), vocab_size)
+    model.initialize(init.Normal(0.01), ctx=ctx)
+    X = nd.random.randint(0, vocab_size, shape=(batch_size, num_steps),
+                          ctx=ctx).astype('float32')
+    y = nd.random.randint(0, vocab_size, shape=(num_steps * batch_size,),
+                          ctx=ctx).astype('float32')
+    trainer = gluon.Trainer(model.collect_params(), 'sgd',
+                            {'learning_rate': 1})
+    loss = gloss.SoftmaxCrossEntropyLoss()
+
+    def step():
+        state = model.begin_state(batch_size=batch_size, ctx=ctx)
+        with autograd.record():
+            output, state = model(X, state)
+            l = loss(output, y).mean()
+        l.backward()
+        d2l.grad_clipping_gluon(model, 0.01, ctx)
+        trainer.step(1)
+    return step
+
+
+def setup_seq2seq_train_step(ctx, batch_size=64, num_steps=10,
+                             vocab_size=500):
+    encoder = d2l.Seq2SeqEncoder(vocab_size, 32, 32, 2)
+    decoder = d2l.Seq2SeqAttentionDecoder(vocab_size, 32, 32, 2)
+    model = d2l.EncoderDecoder(encoder, decoder)
+    model.initialize(init.Xavier(), ctx=ctx)
+    X, Y = [nd.random.randint(0, vocab_size, shape=(batch_size, num_steps),
+                              ctx=ctx).astype('float32') for _ in range(2)]
+    X_vlen, Y_vlen = [nd.random.randint(2, num_steps + 1,
+                                        shape=(batch_size,),
+                                        ctx=ctx).astype('float32')
+                      for _ in range(2)]
+    trainer = gluon.Trainer(model.collect_params(), 'adam',
+                            {'learning_rate': 0.005})
+    loss = MaskedSoftmaxCELoss()
+
+    def step():
+        with autograd.record():
+            Y_hat, _ = model(X, Y[:, :-1], X_vlen, Y_vlen)
+            l = loss(Y_hat, Y[:, 1:], Y_vlen - 1)
+        l.backward()
+        d2l.grad_clipping_gluon(model, 5, ctx)
+        trainer.step(batch_size)
+    return step
+
+
+def setup_attention(cls):
+    def setup(ctx, batch_size=8, num_queries=32, num_keys=512, size=64):
+        net = cls(0) if 'Dot' in cls.__name__ else cls(size, 0)
+        net.initialize(ctx=ctx)
+        query = nd.random.normal(shape=(batch_size, num_queries, size),
+                                 ctx=ctx)
+        key, value = [nd.random.normal(shape=(batch_size, num_keys, size),
+                                       ctx=ctx) for _ in range(2)]
+        valid_length = nd.random.randint(1, num_keys + 1, shape=(batch_size,),
+                                         ctx=ctx).astype('float32')
+        return lambda: net(query, key, value, valid_length)
+    return setup
+
+
+def setup_corr2d_multi_in_out(ctx, size=64):
+    X = nd.random.normal(shape=(3, size, size), ctx=ctx)
+    K = nd.random.normal(shape=(16, 3, 3, 3), ctx=ctx)
+    return lambda: d2l.corr2d_multi_in_out(X, K, 1, 1)
+
+
+def setup_evaluate_accuracy(ctx, num_examples=4096, batch_size=256):
+    net = nn.Sequential()
+    net.add(nn.Dense(256, activation='relu'), nn.Dense(10))
+    net.initialize(init.Xavier(), ctx=ctx)
+    rng = np.random.RandomState(0)
+    features = rng.rand(num_examples, 784).astype(np.float32)
+    labels = rng.randint(0, 10, num_examples).astype(np.float32)
+    data_iter = gdata.DataLoader(gdata.ArrayDataset(features, labels),
+                                 batch_size)
+    return lambda: d2l.evaluate_accuracy(data_iter, net, ctx)
+
+
+def setup_clip_and_sgd(ctx, vocab_size=1027, num_hiddens=256):
+    shapes = [(vocab_size, num_hiddens), (num_hiddens, num_hiddens),
+              (num_hiddens,), (num_hiddens, vocab_size), (vocab_size,)]
+    params = []
+    for shape in shapes:
+        param = nd.random.normal(shape=shape, ctx=ctx)
+        param.attach_grad()
+        param.grad[:] = nd.random.normal(shape=shape, ctx=ctx)
+        params.append(param)
+
+    def step():
+        d2l.grad_clipping(params, 1e-2, ctx)
+        d2l.sgd_fused(params, 0.1, 256)
+    return step
+
+
+def setup_predict_rnn_gluon_batch(ctx, num_prefixes=16, num_chars=50):
+    vocab = d2l.ArrayVocab(list('abcdefghijklmnopqrstuvwxyz '))
+    model = d2l.RNNModel(rnn.LSTM(256), len(vocab))
+    model.initialize(init.Normal(0.01), ctx=ctx)
+    prefixes = ['the time', 'a', 'machine '] * (num_prefixes // 3 + 1)
+    return lambda: d2l.predict_rnn_gluon_batch(prefixes[:num_prefixes],
+                                               num_chars, model, vocab, ctx)
+
+
+CASES = collections.OrderedDict([
+    ('model/resnet18_forward', setup_resnet18_forward),
+    ('model/resnet18_train_step', setup_resnet18_train_step),
+    ('model/rnn_train_step', setup_rnn_train_step),
+    ('model/seq2seq_attention_train_step', setup_seq2seq_train_step),
+    ('model/dot_attention', setup_attention(d2l.DotProductAttention)),
+    ('model/mlp_attention', setup_attention(d2l.MLPAttention)),
+    ('model/chunked_mlp_attention', setup_attention(d2l.ChunkedMLPAttention)),
+    ('model/corr2d_multi_in_out', setup_corr2d_multi_in_out),
+    ('train/evaluate_accuracy', setup_evaluate_accuracy),
+    ('train/grad_clipping_sgd_fused', setup_clip_and_sgd),
+    ('train/predict_rnn_gluon_batch', setup_predict_rnn_gluon_batch),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--cases', nargs='+', default=None,
+                        help='only run the cases whose name starts with these')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--profile', default=None,
+                        help='directory of the mx.profiler traces')
+    parser.add_argument('--output', default=None, help='write results to JSON')
+    parser.add_argument('--baseline', default=None,
+                        help='compare against this results JSON')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed relative slowdown before failing')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    ctx = d2l.try_gpu()
+    if args.profile and not os.path.exists(args.profile):
+        os.makedirs(args.profile)
+
+    results = collections.OrderedDict()
+    for name, setup in CASES.items():
+        if args.cases and not any(name.startswith(c) for c in args.cases):
+            continue
+        mx.random.seed(args.seed)
+        np.random.seed(args.seed)
+        profile = None
+        if args.profile:
+            profile = os.path.join(args.profile,
+                                   name.replace('/', '_') + '.json')
+        stats = d2l.benchmark(setup(ctx), args.repeat, args.warmup, profile)
+        results[name] = stats
+        print('%-36s median %9.3f ms  p95 %9.3f ms  peak RSS +%7.1f MB'
+              % (name, stats['median_ms'], stats['p95_ms'],
+                 stats['peak_rss_growth_mb'] or 0))
+        if profile:
+            top = sorted(stats['operators'].items(),
+                         key=lambda x: -x[1]['total_ms'])[:5]
+            print('    ' + '  '.join('%s %.2f ms' % (op, s['total_ms'])
+                                     for op, s in top))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'python': platform.python_version(),
+                                'mxnet': mx.__version__,
+                                'machine': platform.machine(),
+                                'context': str(ctx),
+                                'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+                       'results': results}, f, indent=2)
+        print('Wrote results to %s' % args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        print()
+        regressions = d2l.compare_benchmarks(results, baseline,
+                                             args.threshold)
+        if regressions:
+            print('\n%d case(s) slower than %.0f%% over the baseline'
+                  % (len(regressions), 100 * args.threshold))
+            sys.exit(1)
+        print('\nNo regression over %.0f%%' % (100 * args.threshold))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""Compare the memory use and throughput of the former and the compact
+VOCSegDataset.
+
+    python benchmarks/bench_voc.py
+    python benchmarks/bench_voc.py --voc-dir ../data/VOCdevkit/VOC2012
+
+Without --voc-dir a synthetic dataset with the VOC2012 layout (JPEG images of
+300 to 500 by 440 to 500 pixels, colormap PNG labels with a border color
+outside of VOC_COLORMAP) is written to a temporary directory. Checks that the
+compact dataset gives the normalized crops and labels of the former one for the
+same crop corners and pickles to about the size of its arrays, then builds each
+one in a fresh process and reports the bytes its arrays hold, the resident
+memory it holds once built and the growth of the peak resident memory while
+building and iterating (read from /proc, so on Linux only), the construction
+time (twice for the compact one, without and with the label cache) and the
+samples per second of an epoch of random crops.
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from mxnet import image, nd
+from mxnet.gluon import data as gdata
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import d2l
+from d2l.data.voc import read_voc_images, voc_label_indices, voc_rand_crop
+
+
+class ReferenceVOCSegDataset(gdata.Dataset):
+    """The former VOCSegDataset, holding normalized float32 images."""
+
+    def __init__(self, is_train, crop_size, voc_dir, colormap2label):
+        self.rgb_mean = nd.array([0.485, 0.456, 0.406])
+        self.rgb_std = nd.array([0.229, 0.224, 0.225])
+        self.crop_size = crop_size
+        data, labels = read_voc_images(root=voc_dir, is_train=is_train)
+        self.data = [self.normalize_image(im) for im in self.filter(data)]
+        self.labels = self.filter(labels)
+        self.colormap2label = colormap2label
+
+    def normalize_image(self, data):
+        return (data.astype('float32') / 255 - self.rgb_mean) / self.rgb_std
+
+    def filter(self, images):
+        return [im for im in images if (
+            im.shape[0] >= self.crop_size[0] and
+            im.shape[1] >= self.crop_size[1])]
+
+    def __getitem__(self, idx):
+        data, labels = voc_rand_crop(self.data[idx], self.labels[idx],
+                                     *self.crop_size)
+        return (data.transpose((2, 0, 1)),
+                voc_label_indices(labels, self.colormap2label))
+
+    def __len__(self):
+        return len(self.data)
+
+
+def colormap2label():
+    table = nd.zeros(256 ** 3)
+    for i, colormap in enumerate(d2l.VOC_COLORMAP):
+        table[(colormap[0] * 256 + colormap[1]) * 256 + colormap[2]] = i
+    return table
+
+
+def make_synthetic_voc(root, num_images, seed=0):
+    from PIL import Image
+    rng = np.random.RandomState(seed)
+    for folder in ['ImageSets/Segmentation', 'JPEGImages',
+                   'SegmentationClass']:
+        os.makedirs(os.path.join(root, folder))
+    colors = np.array(d2l.VOC_COLORMAP + [[224, 224, 192]], dtype=np.uint8)
+    names = ['%06d' % i for i in range(num_images)]
+    for name in names:
+        h, w = rng.randint(300, 501), rng.randint(440, 501)
+        # Smooth images compress like photos
+        im = rng.randint(0, 256, (h // 16 + 1, w // 16 + 1, 3))
+        im = np.kron(im, np.ones((16, 16, 1)))[:h, :w].astype(np.uint8)
+        Image.fromarray(im).save('%s/JPEGImages/%s.jpg' % (root, name))
+        blocks = rng.randint(0, len(colors), (h // 32 + 1, w // 32 + 1))
+        label = colors[np.kron(blocks, np.ones((32, 32), np.int64))[:h, :w]]
+        Image.fromarray(label).save('%s/SegmentationClass/%s.png'
+                                    % (root, name))
+    split = num_images * 4 // 5
+    for fname, part in [('train.txt', names[:split]),
+                        ('val.txt', names[split:])]:
+        with open('%s/ImageSets/Segmentation/%s' % (root, fname), 'w') as f:
+            f.write('\n'.join(part))
+
+
+def check(voc_dir, crop_size, cache_dir):
+    reference = ReferenceVOCSegDataset(True, crop_size, voc_dir,
+                                       colormap2label())
+    compact = d2l.VOCSegDataset(True, crop_size, voc_dir, colormap2label(),
+                                cache_dir=cache_dir)
+    assert len(reference) == len(compact)
+    rng = np.random.RandomState(1)
+    indices = rng.randint(0, len(compact), 8)
+    h, w = crop_size
+    corners = (rng.rand(8, 2) * (compact.shapes[indices] - (h, w) + 1)
+               ).astype(np.int64)
+    crops, labels = compact.crop(indices, corners)
+    images = compact.normalize_image(nd.array(crops, dtype='uint8'))
+    for j, (i, (y, x)) in enumerate(zip(indices, corners)):
+        feature = image.fixed_crop(reference.data[i], x, y, w, h)
+        label = image.fixed_crop(reference.labels[i], x, y, w, h)
+        label = voc_label_indices(label, reference.colormap2label)
+        assert (feature == images[j]).min() == 1
+        assert (label.asnumpy() == labels[j]).all()
+    X, y = compact.batchify(indices)
+    assert X.shape == (8, 3, h, w) and X.dtype == np.float32
+    assert y.shape == (8, h, w) and y.dtype == np.float32
+    X, y = compact[0]
+    assert X.shape == (3, h, w) and y.shape == (h, w)
+    # DataLoader workers get the dataset pickled, without the row views
+    pickled = pickle.dumps(compact)
+    nbytes = compact.images.nbytes + compact.labels.nbytes
+    assert len(pickled) < 1.1 * nbytes + 2 ** 16, (len(pickled), nbytes)
+    crops2, labels2 = pickle.loads(pickled).crop(indices, corners)
+    assert (crops2 == crops).all() and (labels2 == labels).all()
+    train_iter, test_iter = d2l.load_data_voc(8, crop_size, voc_dir,
+                                              cache_dir=cache_dir)
+    for X, y in train_iter:
+        assert X.shape == (8, 3, h, w) and y.shape == (8, h, w)
+
+
+def memory_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def measure(name, voc_dir, crop_size, batch_size, cache_dir):
+    # Reset the peak, which exec keeps from the parent process
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    start_rss = memory_kb('VmHWM')
+    table = colormap2label()
+    table_rss = memory_kb('VmRSS')
+    times = []
+    for _ in range(1 if name == 'former' else 2):
+        start = time.perf_counter()
+        if name == 'former':
+            dataset = ReferenceVOCSegDataset(True, crop_size, voc_dir, table)
+            loader = gdata.DataLoader(dataset, batch_size, shuffle=True,
+                                      last_batch='discard')
+            nbytes = sum(x.size * 4 + y.size for x, y in
+                         zip(dataset.data, dataset.labels))
+        else:
+            dataset = d2l.VOCSegDataset(True, crop_size, voc_dir, table,
+                                        cache_dir)
+            loader = gdata.DataLoader(
+                gdata.SimpleDataset(list(range(len(dataset)))), batch_size,
+                shuffle=True, last_batch='discard',
+                batchify_fn=dataset.batchify)
+            nbytes = dataset.images.nbytes + dataset.labels.nbytes
+        times.append(time.perf_counter() - start)
+    held = memory_kb('VmRSS') - table_rss
+    num_samples = 0
+    start = time.perf_counter()
+    for X, y in loader:
+        X.wait_to_read()
+        num_samples += X.shape[0]
+    speed = num_samples / (time.perf_counter() - start)
+    growth = memory_kb('VmHWM') - start_rss
+    return times, nbytes, held * 1024, growth * 1024, speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--voc-dir', default=None)
+    parser.add_argument('--num-images', type=int, default=300)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--crop-size', type=int, nargs=2, default=[320, 480])
+    args = parser.parse_args()
+    crop_size = tuple(args.crop_size)
+
+    workdir = tempfile.mkdtemp(prefix='voc_bench_')
+    try:
+        voc_dir = args.voc_dir
+        if voc_dir is None:
+            voc_dir = os.path.join(workdir, 'VOC2012')
+            make_synthetic_voc(voc_dir, args.num_images)
+        cache_dir = os.path.join(workdir, 'label_cache')
+        check(voc_dir, crop_size, os.path.join(workdir, 'check_cache'))
+        print('compact crops and labels match the former dataset')
+        pool = multiprocessing.get_context('spawn')
+        for name in ['former', 'compact']:
+            with pool.Pool(1) as p:
+                times, nbytes, held, growth, speed = p.apply(
+                    measure, (name, voc_dir, crop_size, args.batch_size,
+                              cache_dir))
+            print('%-8s arrays %6.1f MB  held +%6.1f MB  peak +%6.1f MB  '
+                  'built in %s  %6.1f samples/sec'
+                  % (name, nbytes / 2 ** 20, held / 2 ** 20, growth / 2 ** 20,
+                     ' then '.join('%.2f sec' % t for t in times), speed))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Compare d2l.data.base.Vocab and ArrayVocab on real corpora.
+
+    python benchmarks/bench_vocab.py
+    python benchmarks/bench_vocab.py --imdb ./aclImdb
+
+Times building each vocabulary and encoding and decoding the corpus, and
+checks that both give the same indices.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from d2l.data.base import Vocab, ArrayVocab
+
+
+def time_machine_tokens(fname):
+    with open(fname) as f:
+        lines = f.read().split('\n')
+    return list(' '.join(' '.join(lines).lower().split()))
+
+
+def imdb_tokens(data_dir):
+    tokens = []
+    for label in ['pos', 'neg']:
+        folder = os.path.join(data_dir, 'train', label)
+        for fname in os.listdir(folder):
+            with open(os.path.join(folder, fname), 'rb') as f:
+                tokens.extend(f.read().decode('utf-8').replace('\n', '')
+                              .split(' '))
+    return tokens
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, np.median(times)
+
+
+def compare(name, tokens, min_freq, repeat, as_array):
+    """Time both vocabularies; ArrayVocab gets the corpus as one NumPy array
+    if as_array, as the token list otherwise."""
+    data = np.array(tokens) if as_array else tokens
+    vocab, t_build = timeit(lambda: Vocab(tokens, min_freq=min_freq), repeat)
+    avocab, t_abuild = timeit(lambda: ArrayVocab(data, min_freq=min_freq),
+                              repeat)
+    indices, t_enc = timeit(lambda: vocab[tokens], repeat)
+    aindices, t_aenc = timeit(lambda: avocab.encode(data), repeat)
+    _, t_dec = timeit(lambda: vocab.to_tokens(indices), repeat)
+    _, t_adec = timeit(lambda: avocab.decode(aindices), repeat)
+    assert vocab.idx_to_token == avocab.idx_to_token
+    assert np.array_equal(np.array(indices), aindices)
+    print('%s: %d tokens, vocabulary of %d' % (name, len(tokens), len(vocab)))
+    for step, t, at in (('build', t_build, t_abuild),
+                        ('encode', t_enc, t_aenc),
+                        ('decode', t_dec, t_adec)):
+        print('  %-7s Vocab %8.1f ms  ArrayVocab %8.1f ms  (%.1fx)'
+              % (step, t * 1e3, at * 1e3, t / at))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--time-machine', default=os.path.join(
+        os.path.dirname(__file__), '..', 'data', 'timemachine.txt'))
+    parser.add_argument('--imdb', default=None,
+                        help='extracted aclImdb directory')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    compare('time machine', time_machine_tokens(args.time_machine), 0,
+            args.repeat, as_array=True)
+    if args.imdb:
+        compare('imdb', imdb_tokens(args.imdb), 5, args.repeat,
+                as_array=False)
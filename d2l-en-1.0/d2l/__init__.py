@@ -1,7 +1,70 @@
-from .base import *
-from .figure import *
-from .data import *
-from .model import *
-from .train import *
+"""Dive into Deep Learning utilities.
+
+The submodules, and MXNet and matplotlib with them, are only imported when
+one of their names is first used, so that importing d2l is instant.
+"""
+import importlib
+import sys
+import types
 
 __version__ = '0.9'
+
+# The public names of every submodule, as listed in its __all__
+_SUBMODULES = {
+    'base': ['try_gpu', 'try_all_gpus', 'Benchmark', 'benchmark',
+             'compare_benchmarks'],
+    'figure': ['plt', 'bbox_to_rect', 'semilogy', 'set_figsize',
+               'show_bboxes', 'show_images', 'show_trace_2d',
+               'use_svg_display'],
+    'data': ['data_iter_consecutive', 'data_iter_random', 'strided_windows',
+             'Prefetcher', 'seq_iter_random', 'seq_iter_consecutive',
+             'get_data_ch7', 'load_data_time_machine', 'mkdir_if_not_exist',
+             'Vocab', 'ArrayVocab', 'load_data_fashion_mnist',
+             'get_fashion_mnist_labels', 'show_fashion_mnist',
+             'load_data_imdb', 'load_data_imdb_bucketed', 'build_imdb_cache',
+             'IMDBCache', 'LengthBucketSampler', 'load_data_nmt',
+             'load_data_nmt_bucketed', 'load_data_pikachu', 'VOC_COLORMAP',
+             'download_voc_pascal', 'VOCSegDataset', 'read_voc_images',
+             'load_data_voc'],
+    'model': ['corr2d', 'corr2d_multi_in', 'corr2d_multi_in_out',
+              'corr2d_multi_in_out_1x1', 'pool2d', 'linreg', 'Residual',
+              'resnet18', 'RNNModel', 'Encoder', 'Decoder', 'EncoderDecoder',
+              'DotProductAttention', 'MLPAttention',
+              'ChunkedDotProductAttention', 'ChunkedMLPAttention',
+              'Seq2SeqEncoder', 'Seq2SeqDecoder', 'Seq2SeqAttentionDecoder',
+              'set_hybridize', 'export_model', 'import_model'],
+    'train': ['Accumulator', 'evaluate_accuracy', 'squared_loss',
+              'grad_clipping', 'grad_clipping_gluon', 'sgd', 'sgd_fused',
+              'train', 'train_2d', 'train_and_predict_rnn',
+              'train_and_predict_rnn_gluon', 'train_ch3', 'train_ch5',
+              'train_ch9', 'train_gluon_ch9', 'predict_sentiment',
+              'train_ch7', 'translate_ch7', 'translate_beam_ch7',
+              'predict_rnn_batch', 'predict_rnn_gluon_batch'],
+}
+_NAMES = {name: module for module, names in _SUBMODULES.items()
+          for name in names}
+__all__ = list(_NAMES)
+
+def __getattr__(name):
+    if name not in _NAMES:
+        if name in _SUBMODULES:
+            return importlib.import_module('.' + name, __name__)
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    module = importlib.import_module('.' + _NAMES[name], __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name, value):
+        # Importing d2l.train must not hide the train function, as
+        # `from .train import *` used to rebind it
+        if name in _NAMES and isinstance(value, types.ModuleType):
+            return
+        super(_Package, self).__setattr__(name, value)
+
+sys.modules[__name__].__class__ = _Package
@@ -1,33 +1,32 @@
 """Some basic functions/classes for d2l"""
 
+import functools
+import json
+import sys
 import time
 import mxnet as mx
+import numpy as np
 from mxnet import nd
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
-__all__ = ['try_gpu', 'try_all_gpus', 'Benchmark']
+__all__ = ['try_gpu', 'try_all_gpus', 'Benchmark', 'benchmark',
+           'compare_benchmarks']
+
+@functools.lru_cache(maxsize=None)
+def _num_gpus():
+    # One query of the driver instead of allocating on every device
+    return mx.context.num_gpus()
 
 def try_gpu():
     """If GPU is available, return mx.gpu(0); else return mx.cpu()."""
-    try:
-        ctx = mx.gpu()
-        _ = nd.array([0], ctx=ctx)
-    except mx.base.MXNetError:
-        ctx = mx.cpu()
-    return ctx
+    return mx.gpu() if _num_gpus() else mx.cpu()
 
 def try_all_gpus():
     """Return all available GPUs, or [mx.cpu()] if there is no GPU."""
-    ctxes = []
-    try:
-        for i in range(16):
-            ctx = mx.gpu(i)
-            _ = nd.array([0], ctx=ctx)
-            ctxes.append(ctx)
-    except mx.base.MXNetError:
-        pass
-    if not ctxes:
-        ctxes = [mx.cpu()]
-    return ctxes
+    return [mx.gpu(i) for i in range(_num_gpus())] or [mx.cpu()]
 
 class Benchmark():
     """Benchmark programs."""
@@ -35,7 +34,108 @@ class Benchmark():
         self.prefix = prefix + ' ' if prefix else ''
 
     def __enter__(self):
-        self.start = time.time()
+        nd.waitall()
+        self.start = time.perf_counter()
 
     def __exit__(self, *args):
-        print('%stime: %.4f sec' % (self.prefix, time.time() - self.start))
+        # Wait for the engine, or only the dispatch is timed
+        nd.waitall()
+        self.elapsed = time.perf_counter() - self.start
+        print('%stime: %.4f sec' % (self.prefix, self.elapsed))
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # Kilobytes on Linux, bytes on macOS
+    scale = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+def _proc_memory_mb(field):
+    """VmRSS or VmHWM of the process in MB, None without /proc."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 2 ** 10
+    except (IOError, ValueError):
+        return None
+
+def _reset_peak_rss():
+    """Reset the peak resident memory (VmHWM) to the current one, where
+    Linux allows it, and return whether it did."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _proc_memory_mb('VmHWM') is not None
+    except IOError:
+        return False
+
+def benchmark(fn, repeat=10, warmup=1, profile=None):
+    """Time fn() and return statistics in milliseconds.
+
+    fn is called warmup times untimed, then repeat times, each time waiting
+    for the engine to finish all the work fn queued. The result holds the
+    median, 95th percentile, mean and min times and, as 'peak_rss_growth_mb',
+    how far the peak resident memory rose over the resident memory before
+    the warm-up (None where it is not available). Where the peak cannot be
+    reset (outside Linux) it is the rise of the peak of the whole process,
+    so 0 for fn using less than an earlier peak. If profile is a file name,
+    one more call is traced with mx.profiler into it, and the time spent in
+    every operator is added under 'operators'.
+    """
+    nd.waitall()
+    if _reset_peak_rss():
+        start_rss = _proc_memory_mb('VmRSS')
+        peak_rss = functools.partial(_proc_memory_mb, 'VmHWM')
+    else:
+        start_rss, peak_rss = _peak_rss_mb(), _peak_rss_mb
+    for _ in range(warmup):
+        fn()
+    nd.waitall()
+    times = np.zeros((repeat,))
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        nd.waitall()
+        times[i] = time.perf_counter() - start
+    times *= 1000.
+    growth = None
+    if start_rss is not None:
+        growth = max(peak_rss() - start_rss, 0.)
+    stats = {'median_ms': float(np.median(times)),
+             'p95_ms': float(np.percentile(times, 95)),
+             'mean_ms': float(times.mean()), 'min_ms': float(times.min()),
+             'repeat': repeat, 'peak_rss_growth_mb': growth}
+    if profile:
+        mx.profiler.set_config(profile_imperative=True, profile_symbolic=True,
+                               aggregate_stats=True, filename=profile)
+        mx.profiler.set_state('run')
+        fn()
+        nd.waitall()
+        mx.profiler.set_state('stop')
+        mx.profiler.dump(finished=False)
+        aggregate = json.loads(mx.profiler.dumps(reset=True, format='json'))
+        stats['operators'] = {
+            name: {'count': op['Count'], 'total_ms': op['Total']}
+            for name, op in aggregate['Time'].get('operator', {}).items()}
+    return stats
+
+def compare_benchmarks(results, baseline, threshold=0.1):
+    """Print the median times of results against those of baseline, both
+    dicts of benchmark() statistics, and return the names of the entries
+    more than threshold slower."""
+    regressions = []
+    print('%-32s %10s %10s %8s' % ('benchmark', 'base(ms)', 'now(ms)',
+                                  'ratio'))
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]['median_ms']
+        ratio = stats['median_ms'] / max(base, 1e-9)
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-32s %10.3f %10.3f %8.2f%s' % (name, base, stats['median_ms'],
+                                              ratio, flag))
+    return regressions
@@ -1,8 +1,37 @@
-"""The data module contains functions/classes to load data sets"""
-
-from .base import *
-from .fashion_mnist import *
-from .imdb import *
-from .nmt import *
-from .pikachu import *
-from .voc import *
+"""The data module contains functions/classes to load data sets
+
+The submodules are only imported when one of their names is first used.
+"""
+import importlib
+
+_SUBMODULES = {
+    'base': ['data_iter_consecutive', 'data_iter_random', 'strided_windows',
+             'Prefetcher', 'seq_iter_random', 'seq_iter_consecutive',
+             'get_data_ch7', 'load_data_time_machine', 'mkdir_if_not_exist',
+             'Vocab', 'ArrayVocab'],
+    'fashion_mnist': ['load_data_fashion_mnist', 'get_fashion_mnist_labels',
+                      'show_fashion_mnist'],
+    'imdb': ['load_data_imdb', 'load_data_imdb_bucketed', 'build_imdb_cache',
+             'IMDBCache', 'LengthBucketSampler'],
+    'nmt': ['load_data_nmt', 'load_data_nmt_bucketed'],
+    'pikachu': ['load_data_pikachu'],
+    'voc': ['VOC_COLORMAP', 'download_voc_pascal', 'VOCSegDataset',
+            'read_voc_images', 'load_data_voc'],
+}
+_NAMES = {name: module for module, names in _SUBMODULES.items()
+          for name in names}
+__all__ = list(_NAMES)
+
+def __getattr__(name):
+    if name not in _NAMES:
+        if name in _SUBMODULES:
+            return importlib.import_module('.' + name, __name__)
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    module = importlib.import_module('.' + _NAMES[name], __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
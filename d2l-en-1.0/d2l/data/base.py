@@ -1,11 +1,18 @@
 import os
+import queue
 import random
+import threading
 import numpy as np
 import zipfile
 import collections
 from mxnet import nd
 from mxnet.gluon import utils as gutils, data as gdata
 
+__all__ = ['data_iter_consecutive', 'data_iter_random', 'strided_windows',
+           'Prefetcher', 'seq_iter_random', 'seq_iter_consecutive',
+           'get_data_ch7', 'load_data_time_machine', 'mkdir_if_not_exist',
+           'Vocab', 'ArrayVocab']
+
 def data_iter_consecutive(corpus_indices, batch_size, num_steps, ctx=None):
     """Sample mini-batches in a consecutive order from sequential data."""
     # Offset for the iterator over the data for uniform starts
@@ -45,6 +52,118 @@ def data_iter_random(corpus_indices, batch_size, num_steps, ctx=None):
         Y = [_data(j + 1) for j in batch_indices]
         yield nd.array(X, ctx), nd.array(Y, ctx)
 
+def strided_windows(corpus, width):
+    """Return all windows of width consecutive items of a 1-D array as a
+    read-only (len(corpus) - width + 1, width) view, without copying."""
+    corpus = np.ascontiguousarray(corpus)
+    stride = corpus.strides[0]
+    return np.lib.stride_tricks.as_strided(
+        corpus, shape=(max(len(corpus) - width + 1, 0), width),
+        strides=(stride, stride), writeable=False)
+
+class Prefetcher(object):
+    """Iterate over an iterable in a background thread.
+
+    Up to depth items, passed through transform if given, are kept ready in
+    a bounded queue. Exceptions of the thread are raised in the consumer.
+    """
+    def __init__(self, iterable, depth=2, transform=None):
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(iter(iterable), transform))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, iterator, transform):
+        try:
+            for item in iterator:
+                if transform is not None:
+                    item = transform(item)
+                if not self._put((True, item)):
+                    return
+        except Exception as e:
+            self._put((False, e))
+            return
+        self._put((False, None))
+
+    def __iter__(self):
+        try:
+            while True:
+                ok, item = self._queue.get()
+                if ok:
+                    yield item
+                elif item is None:
+                    return
+                else:
+                    raise item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the background thread."""
+        self._stop.set()
+
+def _stage_batch(batch, ctx):
+    """Split (batch_size, num_steps + 1) windows into inputs and targets on
+    ctx."""
+    return nd.array(batch[:, :-1], ctx=ctx), nd.array(batch[:, 1:], ctx=ctx)
+
+def _prefetched(batches, ctx, prefetch):
+    if not prefetch:
+        return (_stage_batch(batch, ctx) for batch in batches)
+    return iter(Prefetcher(batches, prefetch,
+                           lambda batch: _stage_batch(batch, ctx)))
+
+def seq_iter_random(corpus_indices, batch_size, num_steps, ctx=None,
+                    prefetch=2):
+    """Sample mini-batches in a random order from sequential data.
+
+    Yields the same batches as data_iter_random, but every batch is one
+    fancy index into a strided view of the int32 corpus, and the batches
+    are staged onto ctx by a background thread keeping prefetch batches
+    ready (0 to stage them in the caller).
+    """
+    corpus = np.ascontiguousarray(corpus_indices, dtype=np.int32)
+    # Draw the offset and the order right away, as data_iter_random does
+    offset = int(random.uniform(0, num_steps))
+    num_examples = ((len(corpus) - offset - 1) // num_steps) - 1
+    num_batches = num_examples // batch_size
+    example_indices = list(
+        range(offset, offset + num_examples * num_steps, num_steps))
+    random.shuffle(example_indices)
+    starts = np.array(example_indices[:num_batches * batch_size],
+                      dtype=np.int64).reshape((num_batches, batch_size))
+    windows = strided_windows(corpus, num_steps + 1)
+    return _prefetched((windows[s] for s in starts), ctx, prefetch)
+
+def seq_iter_consecutive(corpus_indices, batch_size, num_steps, ctx=None,
+                         prefetch=2):
+    """Sample mini-batches in a consecutive order from sequential data.
+
+    Yields the same batches as data_iter_consecutive, sliced from one
+    (batch_size, -1) view of the int32 corpus and staged onto ctx by a
+    background thread keeping prefetch batches ready (0 to stage them in
+    the caller).
+    """
+    corpus = np.ascontiguousarray(corpus_indices, dtype=np.int32)
+    offset = int(random.uniform(0, num_steps))
+    num_indices = ((len(corpus) - offset) // batch_size) * batch_size
+    indices = corpus[offset:(offset + num_indices)].reshape((batch_size, -1))
+    num_epochs = ((num_indices // batch_size) - 1) // num_steps
+    batches = (indices[:, i:(i + num_steps + 1)]
+               for i in range(0, num_epochs * num_steps, num_steps))
+    return _prefetched(batches, ctx, prefetch)
+
 def get_data_ch7():
     """Get the data set used in Chapter 7."""
     data = np.genfromtxt('../data/airfoil_self_noise.dat', delimiter='\t')
@@ -57,8 +176,9 @@ def load_data_time_machine(num_examples=10000):
         raw_text = f.read()
     lines = raw_text.split('\n')
     text = ' '.join(' '.join(lines).lower().split())[:num_examples]
-    vocab = Vocab(text)
-    corpus_indices = [vocab[char] for char in text]
+    chars = np.array(list(text))
+    vocab = ArrayVocab(chars)
+    corpus_indices = vocab.encode(chars)
     return corpus_indices, vocab
 
 def mkdir_if_not_exist(path):
@@ -99,3 +219,109 @@ class Vocab(object):
             return self.idx_to_token[indices]
         else:
             return [self.idx_to_token[index] for index in indices]
+
+class ArrayVocab(object):
+    """A vocabulary backed by NumPy arrays.
+
+    Builds the same token indices as Vocab and supports its interface, and
+    encodes and decodes whole sequences at once: arrays of single
+    characters through a table indexed by code point, other token arrays by
+    binary search in the sorted token table, and lists through a dict.
+    Decoding is a fancy index into the token array.
+    """
+    def __init__(self, tokens=None, min_freq=0, use_special_tokens=False,
+                 idx_to_token=None):
+        if use_special_tokens:
+            self.pad, self.bos, self.eos, self.unk = (0, 1, 2, 3)
+            special_tokens = ['<pad>', '<bos>', '<eos>', '<unk>']
+        else:
+            self.unk = 0
+            special_tokens = ['<unk>']
+        self.use_special_tokens = use_special_tokens
+        if idx_to_token is None:
+            values, counts = _count_tokens(tokens)
+            # By decreasing frequency, ties in token order as in Vocab
+            order = np.argsort(-counts, kind='stable')
+            values, counts = values[order], counts[order]
+            keep = (counts >= min_freq) & ~np.in1d(values, special_tokens)
+            idx_to_token = np.concatenate(
+                [np.array(special_tokens, dtype=np.str_), values[keep]])
+        self._idx_to_token = np.asarray(idx_to_token, dtype=np.str_)
+        self.idx_to_token = self._idx_to_token.tolist()
+        self._sort_order = np.argsort(self._idx_to_token).astype(np.int32)
+        self._sorted_tokens = self._idx_to_token[self._sort_order]
+        self.token_to_idx = dict(zip(self.idx_to_token,
+                                     range(len(self.idx_to_token))))
+        # Indices of the single-character tokens by code point
+        chars = [(ord(t), i) for i, t in enumerate(self.idx_to_token)
+                 if len(t) == 1]
+        codes = np.array([c for c, _ in chars], dtype=np.int64)
+        self._char_table = np.full((codes.max() + 1 if chars else 1,),
+                                   self.unk, dtype=np.int32)
+        self._char_table[codes] = [i for _, i in chars]
+
+    def __len__(self):
+        return len(self.idx_to_token)
+
+    def encode(self, tokens):
+        """Return the int32 indices of an array or list of tokens."""
+        if not isinstance(tokens, np.ndarray):
+            return np.array([self.token_to_idx.get(t, self.unk)
+                             for t in tokens], dtype=np.int32)
+        tokens = tokens.astype(np.str_, copy=False)
+        if tokens.dtype.itemsize == 4:
+            # Single characters: gather by code point
+            codes = tokens.view(np.uint32)
+            table = self._char_table
+            inside = codes < len(table)
+            return np.where(inside, table[np.where(inside, codes, 0)],
+                            np.int32(self.unk))
+        pos = np.searchsorted(self._sorted_tokens, tokens)
+        np.minimum(pos, len(self._sorted_tokens) - 1, out=pos)
+        found = self._sorted_tokens[pos] == tokens
+        return np.where(found, self._sort_order[pos], np.int32(self.unk))
+
+    def decode(self, indices):
+        """Return the array of tokens of an array of indices."""
+        return self._idx_to_token[np.asarray(indices, dtype=np.int64)]
+
+    def __getitem__(self, tokens):
+        if isinstance(tokens, np.ndarray):
+            return self.encode(tokens)
+        if not isinstance(tokens, (list, tuple)):
+            return self.token_to_idx.get(tokens, self.unk)
+        return [self.token_to_idx.get(t, self.unk) for t in tokens]
+
+    def to_tokens(self, indices):
+        if isinstance(indices, np.ndarray):
+            return self.decode(indices)
+        if not isinstance(indices, (list, tuple)):
+            return self.idx_to_token[indices]
+        return self.decode(indices).tolist()
+
+    def save(self, fname):
+        """Save the vocabulary to a .npz file."""
+        np.savez(fname, idx_to_token=self._idx_to_token,
+                 use_special_tokens=self.use_special_tokens)
+
+    @classmethod
+    def load(cls, fname):
+        """Load a vocabulary saved by save."""
+        with np.load(fname) as f:
+            return cls(idx_to_token=f['idx_to_token'],
+                       use_special_tokens=bool(f['use_special_tokens']))
+
+def _count_tokens(tokens):
+    """Return the distinct tokens in sorted order and their counts."""
+    if isinstance(tokens, np.ndarray):
+        tokens = tokens.astype(np.str_, copy=False)
+        if tokens.dtype.itemsize == 4:
+            # Single characters: count the code points as integers
+            codes, counts = np.unique(tokens.view(np.uint32),
+                                      return_counts=True)
+            return codes.view('<U1'), counts
+        return np.unique(tokens, return_counts=True)
+    counter = collections.Counter(tokens)
+    values = np.array(sorted(counter), dtype=np.str_)
+    counts = np.array([counter[v] for v in values.tolist()], dtype=np.int64)
+    return values, counts
@@ -1,7 +1,9 @@
 import os
 import sys
 from mxnet.gluon import data as gdata
-from ..figure import plt, use_svg_display
+
+__all__ = ['load_data_fashion_mnist', 'get_fashion_mnist_labels',
+           'show_fashion_mnist']
 
 
 def load_data_fashion_mnist(batch_size, resize=None, root=os.path.join(
@@ -35,6 +37,7 @@ def get_fashion_mnist_labels(labels):
 
 def show_fashion_mnist(images, labels):
     """Plot Fashion-MNIST images with labels."""
+    from ..figure import plt, use_svg_display
     use_svg_display()
     _, figs = plt.subplots(1, len(images), figsize=(12, 12))
     for f, img, lbl in zip(figs, images, labels):
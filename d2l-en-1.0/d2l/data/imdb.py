@@ -1,69 +1,237 @@
+import hashlib
+import multiprocessing
 import tarfile
 import os
+import numpy as np
 from mxnet import nd
 from mxnet.gluon import utils as gutils, data as gdata
-from .base import Vocab
+from .base import ArrayVocab
 
-__all__ = ['load_data_imdb']
+__all__ = ['load_data_imdb', 'load_data_imdb_bucketed', 'build_imdb_cache',
+           'IMDBCache', 'LengthBucketSampler']
 
-def load_data_imdb(batch_size, max_len=500):
-    """Download a IMDB dataset, return the vocabulary and iterators"""
-
-    data_dir = './'
+def download_imdb(data_dir='./'):
+    """Download and extract the IMDB dataset, return its directory."""
     url = 'http://ai.stanford.edu/~amaas/data/sentiment/aclImdb_v1.tar.gz'
+    imdb_dir = os.path.join(data_dir, 'aclImdb')
+    if os.path.isdir(imdb_dir):
+        return imdb_dir
     fname = gutils.download(url, data_dir)
     with tarfile.open(fname, 'r') as f:
         def is_within_directory(directory, target):
-            
+
             abs_directory = os.path.abspath(directory)
             abs_target = os.path.abspath(target)
-        
+
             prefix = os.path.commonprefix([abs_directory, abs_target])
-            
+
             return prefix == abs_directory
-        
+
         def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-        
+
             for member in tar.getmembers():
                 member_path = os.path.join(path, member.name)
                 if not is_within_directory(path, member_path):
                     raise Exception("Attempted Path Traversal in Tar File")
-        
-            tar.extractall(path, members, numeric_owner=numeric_owner) 
-            
-        
+
+            tar.extractall(path, members, numeric_owner=numeric_owner)
+
+
         safe_extract(f, data_dir)
+    return imdb_dir
+
+def _review_files(imdb_dir, folder):
+    """Return the review files of a split and their labels."""
+    files, labels = [], []
+    for label in ['pos', 'neg']:
+        folder_name = os.path.join(imdb_dir, folder, label)
+        names = sorted(os.listdir(folder_name))
+        files += [os.path.join(folder_name, name) for name in names]
+        labels += [1 if label == 'pos' else 0] * len(names)
+    return files, labels
+
+def _tokenize_review(fname):
+    with open(fname, 'rb') as f:
+        return f.read().decode('utf-8').replace('\n', '').split(' ')
+
+def read_imdb_tokens(imdb_dir, folder='train', num_workers=None):
+    """Read and tokenize the reviews of a split in worker processes."""
+    files, labels = _review_files(imdb_dir, folder)
+    with multiprocessing.Pool(num_workers) as pool:
+        tokens = pool.map(_tokenize_review, files, chunksize=256)
+    return tokens, labels
+
+def _corpus_hash(imdb_dir, min_freq):
+    """Hash of the names, sizes and modification times of all reviews."""
+    h = hashlib.sha1(('min_freq=%d\n' % min_freq).encode('utf-8'))
+    for folder in ['train', 'test']:
+        for fname in _review_files(imdb_dir, folder)[0]:
+            st = os.stat(fname)
+            h.update(('%s %d %d\n' % (os.path.relpath(fname, imdb_dir),
+                                      st.st_size, st.st_mtime_ns))
+                     .encode('utf-8'))
+    return h.hexdigest()[:16]
 
-    def read_imdb(folder='train'):
-        data, labels = [], []
-        for label in ['pos', 'neg']:
-            folder_name = os.path.join(data_dir, 'aclImdb', folder, label)
-            for file in os.listdir(folder_name):
-                with open(os.path.join(folder_name, file), 'rb') as f:
-                    review = f.read().decode('utf-8').replace('\n', '')
-                    data.append(review)
-                    labels.append(1 if label == 'pos' else 0)
-        return data, labels
+class IMDBCache(object):
+    """Token ids of the encoded IMDB reviews, memory-mapped from a cache.
 
-    train_data, test_data = read_imdb('train'), read_imdb('test')
+    The ids of all reviews of a split are one int32 array, review i being
+    ids[offsets[i]:offsets[i + 1]].
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.vocab = ArrayVocab.load(os.path.join(cache_dir, 'vocab.npz'))
 
-    def tokenize(sentences):
-        return [line.split(' ') for line in sentences]
+    def _load(self, split, name, mmap_mode=None):
+        return np.load(os.path.join(self.cache_dir,
+                                    '%s_%s.npy' % (split, name)),
+                       mmap_mode=mmap_mode)
 
-    train_tokens = tokenize(train_data[0])
-    test_tokens = tokenize(test_data[0])
+    def split(self, split):
+        """Return the ids (memory-mapped), offsets and labels of a split."""
+        return (self._load(split, 'ids', 'r'), self._load(split, 'offsets'),
+                self._load(split, 'labels'))
 
-    vocab = Vocab([tk for line in train_tokens for tk in line], min_freq=5)
+    @staticmethod
+    def write(cache_dir, vocab, splits):
+        """Write the vocabulary and {split: (tokens, labels)}."""
+        tmp_dir = cache_dir + '.tmp'
+        if not os.path.exists(tmp_dir):
+            os.makedirs(tmp_dir)
+        for split, (tokens, labels) in splits.items():
+            lengths = np.array([len(line) for line in tokens], dtype=np.int64)
+            offsets = np.zeros((len(tokens) + 1,), dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            ids = vocab.encode([tk for line in tokens for tk in line])
+            np.save(os.path.join(tmp_dir, split + '_ids.npy'), ids)
+            np.save(os.path.join(tmp_dir, split + '_offsets.npy'), offsets)
+            np.save(os.path.join(tmp_dir, split + '_labels.npy'),
+                    np.array(labels, dtype=np.int8))
+        vocab.save(os.path.join(tmp_dir, 'vocab.npz'))
+        os.rename(tmp_dir, cache_dir)
+        return IMDBCache(cache_dir)
 
-    def pad(x):
-        return x[:max_len] if len(x) > max_len else x + [vocab.unk] * (max_len - len(x))
+def build_imdb_cache(data_dir='./', cache_root=None, min_freq=5,
+                     num_workers=None):
+    """Return the IMDBCache of the dataset in data_dir, reading, tokenizing
+    and encoding the reviews only if no cache exists for their current
+    content."""
+    imdb_dir = download_imdb(data_dir)
+    if cache_root is None:
+        cache_root = os.path.join(data_dir, 'imdb_cache')
+    cache_dir = os.path.join(cache_root, _corpus_hash(imdb_dir, min_freq))
+    if os.path.exists(os.path.join(cache_dir, 'vocab.npz')):
+        return IMDBCache(cache_dir)
+    if not os.path.exists(cache_root):
+        os.makedirs(cache_root)
+    train = read_imdb_tokens(imdb_dir, 'train', num_workers)
+    test = read_imdb_tokens(imdb_dir, 'test', num_workers)
+    vocab = ArrayVocab([tk for line in train[0] for tk in line],
+                       min_freq=min_freq)
+    return IMDBCache.write(cache_dir, vocab, {'train': train, 'test': test})
 
-    train_features = nd.array([pad(vocab[line]) for line in train_tokens])
-    test_features = nd.array([pad(vocab[line]) for line in test_tokens])
+def _pad_reviews(ids, offsets, inds, length, padding):
+    """Return the reviews inds truncated or padded to length as one array."""
+    starts = offsets[inds]
+    lengths = np.minimum(offsets[inds + 1] - starts, length)
+    features = np.full((len(inds), length), padding, dtype=np.int32)
+    mask = np.arange(length) < lengths[:, None]
+    # Positions of the kept tokens in ids, row by row
+    features[mask] = ids[(starts[:, None] + np.arange(length))[mask]]
+    return features
 
-    train_set = gdata.ArrayDataset(train_features, train_data[1])
-    test_set = gdata.ArrayDataset(test_features, test_data[1])
-    train_iter = gdata.DataLoader(train_set, batch_size, shuffle=True)
-    test_iter = gdata.DataLoader(test_set, batch_size)
+class LengthBucketSampler(gdata.Sampler):
+    """Batch sampler grouping sequences of similar length.
 
+    The sequences are sorted by length and cut into num_buckets buckets of
+    equal size; every epoch the sequences are shuffled within their bucket,
+    batched, and the batches shuffled, so that a batch only needs padding up
+    to the longest sequence of its bucket. lengths may also be a (n, k)
+    array, e.g. of source and target lengths, sorted by its first column,
+    ties by the next ones.
+    """
+    def __init__(self, lengths, batch_size, num_buckets=10, shuffle=True,
+                 last_batch='keep'):
+        lengths = np.asarray(lengths)
+        if lengths.ndim == 2:
+            order = np.lexsort(lengths.T[::-1])
+        else:
+            order = np.argsort(lengths, kind='stable')
+        self._buckets = np.array_split(order, num_buckets)
+        self._batch_size = batch_size
+        self._shuffle = shuffle
+        self._last_batch = last_batch
+
+    def __iter__(self):
+        batches = []
+        for bucket in self._buckets:
+            if self._shuffle:
+                bucket = np.random.permutation(bucket)
+            for i in range(0, len(bucket), self._batch_size):
+                batch = bucket[i:i + self._batch_size]
+                if (len(batch) < self._batch_size and
+                        self._last_batch == 'discard'):
+                    continue
+                batches.append(batch)
+        if self._shuffle:
+            batches = [batches[i] for i in np.random.permutation(len(batches))]
+        return iter(batches)
+
+    def __len__(self):
+        if self._last_batch == 'discard':
+            return sum(len(b) // self._batch_size for b in self._buckets)
+        return sum((len(b) + self._batch_size - 1) // self._batch_size
+                   for b in self._buckets)
+
+class _ReviewDataset(gdata.Dataset):
+    """Review indices, padded into batches by batchify."""
+    def __init__(self, ids, offsets, labels, max_len, padding):
+        self._ids, self._offsets, self._labels = ids, offsets, labels
+        self._lengths = np.minimum(np.diff(offsets), max_len)
+        self._padding = padding
+
+    def __getitem__(self, idx):
+        return idx
+
+    def __len__(self):
+        return len(self._labels)
+
+    def batchify(self, inds):
+        inds = np.asarray(inds, dtype=np.int64)
+        length = int(self._lengths[inds].max())
+        features = _pad_reviews(self._ids, self._offsets, inds, length,
+                                self._padding)
+        return (nd.array(features),
+                nd.array(self._labels[inds].astype(np.float32)))
+
+def load_data_imdb(batch_size, max_len=500, data_dir='./', num_workers=None):
+    """Download a IMDB dataset, return the vocabulary and iterators"""
+    cache = build_imdb_cache(data_dir, num_workers=num_workers)
+    vocab = cache.vocab
+
+    def build_set(split):
+        ids, offsets, labels = cache.split(split)
+        features = _pad_reviews(ids, offsets, np.arange(len(labels)),
+                                max_len, vocab.unk)
+        return gdata.ArrayDataset(nd.array(features), labels.tolist())
+
+    train_iter = gdata.DataLoader(build_set('train'), batch_size, shuffle=True)
+    test_iter = gdata.DataLoader(build_set('test'), batch_size)
     return vocab, train_iter, test_iter
+
+def load_data_imdb_bucketed(batch_size, max_len=500, num_buckets=10,
+                            data_dir='./', num_workers=None):
+    """Like load_data_imdb, but every batch only holds reviews of similar
+    length and is padded to the longest of them (at most max_len)."""
+    cache = build_imdb_cache(data_dir, num_workers=num_workers)
+    vocab = cache.vocab
+
+    def build_iter(split, shuffle):
+        dataset = _ReviewDataset(*cache.split(split), max_len=max_len,
+                                 padding=vocab.unk)
+        sampler = LengthBucketSampler(dataset._lengths, batch_size,
+                                      num_buckets, shuffle)
+        return gdata.DataLoader(dataset, batch_sampler=sampler,
+                                batchify_fn=dataset.batchify)
+
+    return vocab, build_iter('train', True), build_iter('test', False)
@@ -1,61 +1,158 @@
+import hashlib
+import os
+import re
+import numpy as np
 from mxnet import nd
 from mxnet.gluon import utils as gutils, data as gdata
 import zipfile
-from .base import Vocab
+from .base import ArrayVocab
+from .imdb import LengthBucketSampler
 
-__all__  = ['load_data_nmt']
+__all__  = ['load_data_nmt', 'load_data_nmt_bucketed']
 
-def load_data_nmt(batch_size, max_len, num_examples=1000):
-    """Download a NMT dataset, return its vocabulary and data iterator"""
-    # download and preprocess
-    def preprocess_raw(text):
-        text = text.replace('\u202f', ' ').replace('\xa0', ' ')
-        out = ''
-        for i, char in enumerate(text.lower()):
-            if char in (',', '!', '.') and text[i-1] != ' ':
-                out += ' '
-            out += char
-        return out
-    fname = gutils.download('http://www.manythings.org/anki/fra-eng.zip')
-    with zipfile.ZipFile(fname, 'r') as f:
-        raw_text = f.read('fra.txt').decode("utf-8")
-    text = preprocess_raw(raw_text)
+_SPACES = str.maketrans({'\u202f': ' ', '\xa0': ' '})
+# A punctuation mark not preceded by a space
+_PUNCT = re.compile(r'(?<! )([,!.])')
+
+def preprocess_nmt(text):
+    """Lower-case the text and put a space before punctuation."""
+    return _PUNCT.sub(r' \1', text.translate(_SPACES).lower())
 
-    # tokenize
+def tokenize_nmt(text, num_examples=None):
+    """Split the first num_examples lines into source and target tokens."""
     source, target = [], []
-    for i, line in enumerate(text.split('\n')):
-        if i >= num_examples:
-            break
+    for line in text.split('\n')[:num_examples]:
         parts = line.split('\t')
         if len(parts) == 2:
             source.append(parts[0].split(' '))
             target.append(parts[1].split(' '))
+    return source, target
+
+def build_array(lines, vocab, max_len, is_source):
+    """Encode, truncate and pad the lines into one (n, max_len) int32
+    array, return it with the number of valid tokens of every line."""
+    lengths = np.array([len(line) for line in lines], dtype=np.int64)
+    ids = vocab.encode([tk for line in lines for tk in line])
+    starts = np.zeros((len(lines),), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    array = np.full((len(lines), max_len), vocab.pad, dtype=np.int32)
+    if is_source:
+        columns = np.arange(max_len)
+    else:
+        # Leave the first column for <bos>
+        array[:, 0] = vocab.bos
+        columns = np.arange(1, max_len)
+    positions = np.arange(len(columns))
+    mask = positions < lengths[:, None]
+    rows, cols = np.nonzero(mask)
+    array[rows, columns[cols]] = ids[starts[rows] + positions[cols]]
+    if not is_source:
+        # <eos> right after the last token, if it fits
+        eos_col = lengths + 1
+        fits = eos_col < max_len
+        array[np.nonzero(fits)[0], eos_col[fits]] = vocab.eos
+        lengths = lengths + 2
+    valid_len = np.minimum(lengths, max_len)
+    return array, valid_len
+
+def _file_hash(fname):
+    h = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _load_arrays(max_len, num_examples, min_freq, cache_dir):
+    """Return the vocabularies and the (src_array, src_valid_len, tgt_array,
+    tgt_valid_len) arrays, from the cache if possible.
+
+    The encoded arrays and vocabularies are cached in cache_dir (default:
+    nmt_cache next to the download), keyed by the content of the download
+    and the parameters, so that later calls skip the preprocessing.
+    """
+    fname = gutils.download('http://www.manythings.org/anki/fra-eng.zip')
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(fname)),
+                                 'nmt_cache')
+    key = hashlib.sha1(('%s %d %d %d' % (
+        _file_hash(fname), max_len, num_examples, min_freq)).encode('utf-8'))
+    cache_file = os.path.join(cache_dir, key.hexdigest()[:16] + '.npz')
+
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as f:
+            arrays = [f[name] for name in ('src_array', 'src_valid_len',
+                                           'tgt_array', 'tgt_valid_len')]
+            src_vocab = ArrayVocab(idx_to_token=f['src_tokens'],
+                                   use_special_tokens=True)
+            tgt_vocab = ArrayVocab(idx_to_token=f['tgt_tokens'],
+                                   use_special_tokens=True)
+        return src_vocab, tgt_vocab, arrays
+
+    with zipfile.ZipFile(fname, 'r') as f:
+        raw_text = f.read('fra.txt').decode("utf-8")
+    source, target = tokenize_nmt(preprocess_nmt(raw_text), num_examples)
 
-    # build vocab
     def build_vocab(tokens):
         tokens = [token for line in tokens for token in line]
-        return Vocab(tokens, min_freq=3, use_special_tokens=True)
+        return ArrayVocab(tokens, min_freq=min_freq, use_special_tokens=True)
     src_vocab, tgt_vocab = build_vocab(source), build_vocab(target)
+    arrays = (build_array(source, src_vocab, max_len, True) +
+              build_array(target, tgt_vocab, max_len, False))
 
-    # convert to index arrays
-    def pad(line, max_len, padding_token):
-        if len(line) > max_len:
-            return line[:max_len]
-        return line + [padding_token] * (max_len - len(line))
-
-    def build_array(lines, vocab, max_len, is_source):
-        lines = [vocab[line] for line in lines]
-        if not is_source:
-            lines = [[vocab.bos] + line + [vocab.eos] for line in lines]
-        array = nd.array([pad(line, max_len, vocab.pad) for line in lines])
-        valid_len = (array != vocab.pad).sum(axis=1)
-        return array, valid_len
-
-    src_array, src_valid_len = build_array(source, src_vocab, max_len, True)
-    tgt_array, tgt_valid_len = build_array(target, tgt_vocab, max_len, False)
-
-    # construct data iterator
-    train_set = gdata.ArrayDataset(src_array, src_valid_len, tgt_array, tgt_valid_len)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_file = cache_file[:-len('.npz')] + '.tmp.npz'
+    np.savez(tmp_file, src_array=arrays[0], src_valid_len=arrays[1],
+             tgt_array=arrays[2], tgt_valid_len=arrays[3],
+             src_tokens=np.array(src_vocab.idx_to_token),
+             tgt_tokens=np.array(tgt_vocab.idx_to_token))
+    os.replace(tmp_file, cache_file)
+    return src_vocab, tgt_vocab, arrays
+
+def load_data_nmt(batch_size, max_len, num_examples=1000, min_freq=3,
+                  cache_dir=None):
+    """Download a NMT dataset, return its vocabulary and data iterator"""
+    src_vocab, tgt_vocab, arrays = _load_arrays(max_len, num_examples,
+                                                min_freq, cache_dir)
+    # construct data iterator, float32 as the models expect
+    train_set = gdata.ArrayDataset(*[nd.array(a, dtype='float32')
+                                     for a in arrays])
     train_iter = gdata.DataLoader(train_set, batch_size, shuffle=True)
+    return src_vocab, tgt_vocab, train_iter
+
+class _PairDataset(gdata.Dataset):
+    """Sentence pair indices, gathered into trimmed batches by batchify."""
+    def __init__(self, src_array, src_valid_len, tgt_array, tgt_valid_len):
+        self._src, self._src_vlen = src_array, src_valid_len
+        self._tgt, self._tgt_vlen = tgt_array, tgt_valid_len
+
+    def __getitem__(self, idx):
+        return idx
+
+    def __len__(self):
+        return len(self._src_vlen)
+
+    def batchify(self, inds):
+        inds = np.asarray(inds, dtype=np.int64)
+        src_vlen, tgt_vlen = self._src_vlen[inds], self._tgt_vlen[inds]
+        # Cut the padding columns no sequence of the batch reaches
+        src_len = max(int(src_vlen.max()), 1)
+        tgt_len = max(int(tgt_vlen.max()), 2)
+        return (nd.array(self._src[inds, :src_len], dtype='float32'),
+                nd.array(src_vlen, dtype='float32'),
+                nd.array(self._tgt[inds, :tgt_len], dtype='float32'),
+                nd.array(tgt_vlen, dtype='float32'))
 
+def load_data_nmt_bucketed(batch_size, max_len, num_examples=1000,
+                           min_freq=3, num_buckets=10, cache_dir=None):
+    """Like load_data_nmt, but every batch only holds sentence pairs of
+    similar (source, target) length and is trimmed to its longest source and
+    target, at most max_len."""
+    src_vocab, tgt_vocab, arrays = _load_arrays(max_len, num_examples,
+                                                min_freq, cache_dir)
+    dataset = _PairDataset(*arrays)
+    sampler = LengthBucketSampler(np.stack([arrays[1], arrays[3]], axis=1),
+                                  batch_size, num_buckets)
+    train_iter = gdata.DataLoader(dataset, batch_sampler=sampler,
+                                  batchify_fn=dataset.batchify)
     return src_vocab, tgt_vocab, train_iter
@@ -1,10 +1,13 @@
+import hashlib
 import tarfile
 import os
+import numpy as np
 from mxnet.gluon import utils as gutils, data as gdata
 from mxnet import nd, image
 
 
-__all__ = ['VOC_COLORMAP', 'download_voc_pascal', 'VOCSegDataset', 'read_voc_images']
+__all__ = ['VOC_COLORMAP', 'download_voc_pascal', 'VOCSegDataset',
+           'read_voc_images', 'load_data_voc']
 
 VOC_CLASSES = ['background', 'aeroplane', 'bicycle', 'bird', 'boat',
                'bottle', 'bus', 'car', 'cat', 'chair', 'cow',
@@ -49,12 +52,15 @@ def download_voc_pascal(data_dir='../data'):
         safe_extract(f, data_dir)
     return voc_dir
 
-def read_voc_images(root='../data/VOCdevkit/VOC2012', is_train=True):
-    """Read VOC images."""
+def _voc_names(root, is_train):
     txt_fname = '%s/ImageSets/Segmentation/%s' % (
         root, 'train.txt' if is_train else 'val.txt')
     with open(txt_fname, 'r') as f:
-        images = f.read().split()
+        return f.read().split()
+
+def read_voc_images(root='../data/VOCdevkit/VOC2012', is_train=True):
+    """Read VOC images."""
+    images = _voc_names(root, is_train)
     features, labels = [None] * len(images), [None] * len(images)
     for i, fname in enumerate(images):
         features[i] = image.imread('%s/JPEGImages/%s.jpg' % (root, fname))
@@ -76,19 +82,117 @@ def voc_rand_crop(feature, label, height, width):
     label = image.fixed_crop(label, *rect)
     return feature, label
 
+_RGB_MEAN, _RGB_STD = (0.485, 0.456, 0.406), (0.229, 0.224, 0.225)
+
+def _label_table(colormap2label=None):
+    """colormap2label as a uint8 NumPy array, by default for VOC_COLORMAP."""
+    if colormap2label is None:
+        table = np.zeros(256 ** 3, dtype=np.uint8)
+        for i, colormap in enumerate(VOC_COLORMAP):
+            table[(colormap[0] * 256 + colormap[1]) * 256 + colormap[2]] = i
+        return table
+    if isinstance(colormap2label, nd.NDArray):
+        colormap2label = colormap2label.asnumpy()
+    return np.asarray(colormap2label).astype(np.uint8)
+
+def _label_maps(root, names, table, cache_dir):
+    """Return the uint8 class index maps of the named images.
+
+    The colormap PNGs are decoded and looked up in table once, then the
+    maps are cached in cache_dir (default: label_cache in root), keyed by
+    the names, sizes and modification times of the PNGs and the table.
+    """
+    fnames = ['%s/SegmentationClass/%s.png' % (root, name) for name in names]
+    h = hashlib.sha1()
+    for fname in fnames:
+        st = os.stat(fname)
+        h.update(('%s %d %d\n' % (os.path.basename(fname), st.st_size,
+                                  st.st_mtime_ns)).encode('utf-8'))
+    nonzero = np.flatnonzero(table)
+    h.update(nonzero.tobytes())
+    h.update(table[nonzero].tobytes())
+    if cache_dir is None:
+        cache_dir = os.path.join(root, 'label_cache')
+    cache_file = os.path.join(cache_dir, h.hexdigest()[:16] + '.npz')
+
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as f:
+            labels, shapes = f['labels'], f['shapes']
+        ends = np.cumsum(shapes.prod(axis=1))
+        return [x.reshape(shape) for x, shape in
+                zip(np.split(labels, ends[:-1]), shapes)]
+
+    maps = []
+    for fname in fnames:
+        colormap = image.imread(fname).asnumpy().astype(np.int32)
+        idx = ((colormap[:, :, 0] * 256 + colormap[:, :, 1]) * 256
+               + colormap[:, :, 2])
+        maps.append(table[idx])
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_file = cache_file[:-len('.npz')] + '.tmp.npz'
+    np.savez(tmp_file, labels=np.concatenate([m.ravel() for m in maps]),
+             shapes=np.array([m.shape for m in maps], dtype=np.int64))
+    os.replace(tmp_file, cache_file)
+    return maps
 
-class VOCSegDataset(gdata.Dataset):
-    """The Pascal VOC2012 Dataset."""
 
-    def __init__(self, is_train, crop_size, voc_dir, colormap2label):
-        self.rgb_mean = nd.array([0.485, 0.456, 0.406])
-        self.rgb_std = nd.array([0.229, 0.224, 0.225])
+class VOCSegDataset(gdata.Dataset):
+    """The Pascal VOC2012 Dataset.
+
+    The images are kept as uint8 and their labels as uint8 class indices,
+    decoded once into a cache, all in two flat arrays: the pixels of image
+    i are rows offsets[i]:offsets[i + 1]. batchify crops a batch with one
+    gather of its crop rows and normalizes it as a whole; __getitem__
+    returns the same normalized (image, label) crop for a single example.
+    """
+
+    def __init__(self, is_train, crop_size, voc_dir, colormap2label=None,
+                 cache_dir=None):
+        self.rgb_mean = nd.array(_RGB_MEAN)
+        self.rgb_std = nd.array(_RGB_STD)
         self.crop_size = crop_size
-        data, labels = read_voc_images(root=voc_dir, is_train=is_train)
-        self.data = [self.normalize_image(im) for im in self.filter(data)]
-        self.labels = self.filter(labels)
-        self.colormap2label = colormap2label
-        print('read ' + str(len(self.data)) + ' examples')
+        names = _voc_names(voc_dir, is_train)
+        labels = _label_maps(voc_dir, names, _label_table(colormap2label),
+                             cache_dir)
+        keep = [i for i, label in enumerate(labels) if (
+            label.shape[0] >= self.crop_size[0] and
+            label.shape[1] >= self.crop_size[1])]
+        self.shapes = np.array([labels[i].shape for i in keep],
+                               dtype=np.int64).reshape((-1, 2))
+        self.offsets = np.zeros((len(keep) + 1,), dtype=np.int64)
+        np.cumsum(self.shapes.prod(axis=1), out=self.offsets[1:])
+        self.labels = np.concatenate(
+            [labels[i].ravel() for i in keep] or [np.zeros(0, np.uint8)])
+        del labels
+        self.images = np.empty((self.offsets[-1], 3), dtype=np.uint8)
+        for j, i in enumerate(keep):
+            im = image.imread('%s/JPEGImages/%s.jpg' % (voc_dir, names[i]))
+            self.images[self.offsets[j]:self.offsets[j + 1]] = (
+                im.asnumpy().reshape((-1, 3)))
+        self._make_rows()
+        print('read ' + str(len(keep)) + ' examples')
+
+    def _make_rows(self):
+        # Read-only views of the crop_size[1] pixels from every position,
+        # so that a crop row is one index
+        width = self.crop_size[1]
+        n = max(len(self.labels) - width + 1, 0)
+        self._image_rows = np.lib.stride_tricks.as_strided(
+            self.images, (n, width, 3), (3, 3, 1), writeable=False)
+        self._label_rows = np.lib.stride_tricks.as_strided(
+            self.labels, (n, width), (1, 1), writeable=False)
+
+    def __getstate__(self):
+        # Pickling would copy every overlapping row of the views, crop_size[1]
+        # times the data, e.g. for the DataLoader workers
+        state = self.__dict__.copy()
+        del state['_image_rows'], state['_label_rows']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_rows()
 
     def normalize_image(self, data):
         return (data.astype('float32') / 255 - self.rgb_mean) / self.rgb_std
@@ -98,11 +202,45 @@ class VOCSegDataset(gdata.Dataset):
             im.shape[0] >= self.crop_size[0] and
             im.shape[1] >= self.crop_size[1])]
 
+    def crop(self, indices, corners=None):
+        """Crop the examples at indices with their top-left corners (random
+        by default), return uint8 (n, h, w, 3) images and (n, h, w) labels."""
+        indices = np.asarray(indices, dtype=np.int64)
+        h, w = self.crop_size
+        shapes = self.shapes[indices]
+        if corners is None:
+            corners = (np.random.rand(len(indices), 2) *
+                       (shapes - (h, w) + 1)).astype(np.int64)
+        # The first pixel of every row of the crops
+        rows = corners[:, 0:1] + np.arange(h)
+        starts = (self.offsets[indices, None] + rows * shapes[:, 1:2] +
+                  corners[:, 1:2])
+        return self._image_rows[starts], self._label_rows[starts]
+
+    def batchify(self, indices):
+        """Crop and normalize the examples at indices as one batch."""
+        images, labels = self.crop(indices)
+        images = nd.image.to_tensor(nd.array(images, dtype='uint8'))
+        images = nd.image.normalize(images, mean=_RGB_MEAN, std=_RGB_STD)
+        return images, nd.array(labels, dtype='float32')
+
     def __getitem__(self, idx):
-        data, labels = voc_rand_crop(self.data[idx], self.labels[idx],
-                                     *self.crop_size)
-        return (data.transpose((2, 0, 1)),
-                voc_label_indices(labels, self.colormap2label))
+        data, labels = self.batchify([idx])
+        return data[0], labels[0]
 
     def __len__(self):
-        return len(self.data)
+        return len(self.shapes)
+
+def load_data_voc(batch_size, crop_size, voc_dir, colormap2label=None,
+                  cache_dir=None):
+    """Return the training and validation iterators of VOCSegDataset,
+    cropping and normalizing every batch at once."""
+    iters = []
+    for is_train in [True, False]:
+        dataset = VOCSegDataset(is_train, crop_size, voc_dir, colormap2label,
+                                cache_dir)
+        iters.append(gdata.DataLoader(
+            gdata.SimpleDataset(list(range(len(dataset)))), batch_size,
+            shuffle=is_train, last_batch='discard',
+            batchify_fn=dataset.batchify))
+    return iters
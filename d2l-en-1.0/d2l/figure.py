@@ -1,5 +1,4 @@
 """The image module contains functions for plotting"""
-from IPython import display
 from matplotlib import pyplot as plt
 import numpy as np
 
@@ -76,4 +75,5 @@ def show_trace_2d(f, res):
 
 def use_svg_display():
     """Use svg format to display plot in jupyter"""
+    from IPython import display
     display.set_matplotlib_formats('svg')
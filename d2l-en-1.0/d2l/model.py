@@ -1,26 +1,147 @@
 """The model module contains neural network building blocks"""
+import functools
 import math
+import numpy as np
 from mxnet import nd
-from mxnet.gluon import nn, rnn, loss as gloss
+from mxnet.gluon import nn, rnn, loss as gloss, SymbolBlock
 
-__all__ = ['corr2d', 'linreg', 'Residual', 'resnet18', 'RNNModel',
-           'Encoder', 'Decoder', 'EncoderDecoder', 'DotProductAttention',
-           'MLPAttention', 'Seq2SeqEncoder']
+__all__ = ['corr2d', 'corr2d_multi_in', 'corr2d_multi_in_out',
+           'corr2d_multi_in_out_1x1', 'pool2d', 'linreg', 'Residual',
+           'resnet18', 'RNNModel', 'Encoder', 'Decoder', 'EncoderDecoder',
+           'DotProductAttention', 'MLPAttention', 'ChunkedDotProductAttention',
+           'ChunkedMLPAttention', 'Seq2SeqEncoder', 'Seq2SeqDecoder',
+           'Seq2SeqAttentionDecoder', 'set_hybridize', 'export_model',
+           'import_model']
 
-def corr2d(X, K):
+_hybridize = False
+
+def set_hybridize(active=True):
+    """Hybridize the models built by this module from now on."""
+    global _hybridize
+    _hybridize = active
+
+def _maybe_hybridize(block):
+    if _hybridize:
+        block.hybridize()
+    return block
+
+def export_model(net, path, *inputs):
+    """Hybridize net, run it on inputs and export its graph and parameters
+    to path-symbol.json and path-0000.params."""
+    net.hybridize()
+    net(*inputs)
+    net.export(path)
+    return path + '-symbol.json', path + '-0000.params'
+
+def import_model(path, input_names, ctx=None):
+    """Load a model exported by export_model as a SymbolBlock."""
+    return SymbolBlock.imports(path + '-symbol.json', input_names,
+                               path + '-0000.params', ctx=ctx)
+
+def _pair(x):
+    return (x, x) if isinstance(x, int) else tuple(x)
+
+@functools.lru_cache(maxsize=None)
+def _im2col_index(height, width, kernel_size, stride, padding):
+    """The (h * w, out_h * out_w) positions in the flattened input of the
+    windows, height * width standing for the padding."""
+    (h, w), (s_h, s_w), (p_h, p_w) = kernel_size, stride, padding
+    out_h = (height + 2 * p_h - h) // s_h + 1
+    out_w = (width + 2 * p_w - w) // s_w + 1
+    rows = (np.arange(h)[:, None, None, None] +
+            s_h * np.arange(out_h)[None, None, :, None] - p_h)
+    cols = (np.arange(w)[None, :, None, None] +
+            s_w * np.arange(out_w)[None, None, None, :] - p_w)
+    index = rows * width + cols
+    outside = (rows < 0) | (rows >= height) | (cols < 0) | (cols >= width)
+    index = np.where(outside, height * width, index)
+    return index.reshape((h * w, out_h * out_w)), (out_h, out_w)
+
+def _im2col(X, kernel_size, stride=1, padding=0, pad_value=0):
+    """Gather the windows of the (n, height, width) array X into a
+    (n, h * w, out_h * out_w) array, return it with (out_h, out_w).
+
+    X is a NumPy array or an NDArray. Both are read with a single gather:
+    a strided view for NumPy, take for NDArray.
+    """
+    kernel_size, stride, padding = (_pair(kernel_size), _pair(stride),
+                                    _pair(padding))
+    n, height, width = X.shape
+    (h, w), (s_h, s_w), (p_h, p_w) = kernel_size, stride, padding
+    if isinstance(X, np.ndarray):
+        if p_h or p_w:
+            X = np.pad(X, ((0, 0), (p_h, p_h), (p_w, p_w)),
+                       constant_values=pad_value)
+        windows = np.lib.stride_tricks.sliding_window_view(
+            X, (h, w), axis=(1, 2))[:, ::s_h, ::s_w]
+        out_shape = windows.shape[1:3]
+        cols = windows.transpose((0, 3, 4, 1, 2)).reshape(
+            (n, h * w, out_shape[0] * out_shape[1]))
+        return cols, out_shape
+    index, out_shape = _im2col_index(height, width, kernel_size, stride,
+                                     padding)
+    X = X.reshape((n, height * width))
+    if p_h or p_w:
+        X = nd.concat(X, nd.full((n, 1), pad_value, ctx=X.context,
+                                 dtype=X.dtype), dim=1)
+    cols = nd.take(X, nd.array(index, ctx=X.context), axis=1)
+    return cols, out_shape
+
+def _dot(A, B):
+    return np.dot(A, B) if isinstance(A, np.ndarray) else nd.dot(A, B)
+
+def corr2d(X, K, stride=1, padding=0):
     """Compute 2D cross-correlation."""
-    h, w = K.shape
-    Y = nd.zeros((X.shape[0] - h + 1, X.shape[1] - w + 1))
-    for i in range(Y.shape[0]):
-        for j in range(Y.shape[1]):
-            Y[i, j] = (X[i: i + h, j: j + w] * K).sum()
-    return Y
+    return corr2d_multi_in(X.reshape((1,) + X.shape),
+                           K.reshape((1,) + K.shape), stride, padding)
+
+def corr2d_multi_in(X, K, stride=1, padding=0):
+    """Cross-correlate the (c_i, h, w) kernel K with the (c_i, height,
+    width) input X, summing over the input channels."""
+    return corr2d_multi_in_out(X, K.reshape((1,) + K.shape), stride,
+                               padding)[0]
+
+def corr2d_multi_in_out(X, K, stride=1, padding=0):
+    """Cross-correlate the (c_o, c_i, h, w) kernel K with the (c_i, height,
+    width) input X, as one matrix product of K and the windows of X."""
+    c_o, c_i, h, w = K.shape
+    cols, (out_h, out_w) = _im2col(X, (h, w), stride, padding)
+    Y = _dot(K.reshape((c_o, c_i * h * w)),
+             cols.reshape((c_i * h * w, out_h * out_w)))
+    return Y.reshape((c_o, out_h, out_w))
+
+def corr2d_multi_in_out_1x1(X, K, stride=1, padding=0):
+    """corr2d_multi_in_out for a (c_o, c_i, 1, 1) kernel K."""
+    if _pair(stride) != (1, 1) or _pair(padding) != (0, 0):
+        return corr2d_multi_in_out(X, K, stride, padding)
+    c_i, h, w = X.shape
+    c_o = K.shape[0]
+    Y = _dot(K.reshape((c_o, c_i)), X.reshape((c_i, h * w)))
+    return Y.reshape((c_o, h, w))
+
+def pool2d(X, pool_size, mode='max', stride=1, padding=0):
+    """Max or average pool the last two axes of X.
+
+    As in nn.MaxPool2D and nn.AvgPool2D, max pooling ignores the padding and
+    average pooling counts it as zeros.
+    """
+    if mode not in ('max', 'avg'):
+        raise ValueError("mode must be 'max' or 'avg', not %r" % mode)
+    pad_value = 0
+    if mode == 'max':
+        pad_value = (-np.inf if np.issubdtype(X.dtype, np.floating)
+                     else np.iinfo(X.dtype).min)
+    lead, (height, width) = X.shape[:-2], X.shape[-2:]
+    cols, out_shape = _im2col(X.reshape((-1, height, width)), pool_size,
+                              stride, padding, pad_value)
+    Y = cols.max(axis=1) if mode == 'max' else cols.mean(axis=1)
+    return Y.reshape(lead + out_shape)
 
 def linreg(X, w, b):
     """Linear regression."""
     return nd.dot(X, w) + b
 
-class Residual(nn.Block):
+class Residual(nn.HybridBlock):
     """The residual block."""
 
     def __init__(self, num_channels, use_1x1conv=False, strides=1, **kwargs):
@@ -35,23 +156,24 @@ class Residual(nn.Block):
             self.conv3 = None
         self.bn1 = nn.BatchNorm()
         self.bn2 = nn.BatchNorm()
+        _maybe_hybridize(self)
 
-    def forward(self, X):
-        Y = nd.relu(self.bn1(self.conv1(X)))
+    def hybrid_forward(self, F, X):
+        Y = F.relu(self.bn1(self.conv1(X)))
         Y = self.bn2(self.conv2(Y))
         if self.conv3:
             X = self.conv3(X)
-        return nd.relu(Y + X)
+        return F.relu(Y + X)
 
 
 def resnet18(num_classes):
     """The ResNet-18 model."""
-    net = nn.Sequential()
+    net = nn.HybridSequential()
     net.add(nn.Conv2D(64, kernel_size=3, strides=1, padding=1),
             nn.BatchNorm(), nn.Activation('relu'))
 
     def resnet_block(num_channels, num_residuals, first_block=False):
-        blk = nn.Sequential()
+        blk = nn.HybridSequential()
         for i in range(num_residuals):
             if i == 0 and not first_block:
                 blk.add(Residual(num_channels, use_1x1conv=True, strides=2))
@@ -64,10 +186,10 @@ def resnet18(num_classes):
             resnet_block(256, 2),
             resnet_block(512, 2))
     net.add(nn.GlobalAvgPool2D(), nn.Dense(num_classes))
-    return net
+    return _maybe_hybridize(net)
 
 
-class RNNModel(nn.Block):
+class RNNModel(nn.HybridBlock):
     """RNN model."""
 
     def __init__(self, rnn_layer, vocab_size, **kwargs):
@@ -75,22 +197,24 @@ class RNNModel(nn.Block):
         self.rnn = rnn_layer
         self.vocab_size = vocab_size
         self.dense = nn.Dense(vocab_size)
+        _maybe_hybridize(self)
 
-    def forward(self, inputs, state):
-        X = nd.one_hot(inputs.T, self.vocab_size)
+    def hybrid_forward(self, F, inputs, state):
+        X = F.one_hot(F.transpose(inputs), self.vocab_size)
         Y, state = self.rnn(X, state)
-        output = self.dense(Y.reshape((-1, Y.shape[-1])))
+        # (num_steps, batch_size, num_hiddens) -> (num_steps * batch_size, ...)
+        output = self.dense(Y.reshape((-3, 0)))
         return output, state
 
     def begin_state(self, *args, **kwargs):
         return self.rnn.begin_state(*args, **kwargs)
 
-class Encoder(nn.Block):
+class Encoder(nn.HybridBlock):
     """The base encoder interface for the encoder-decoder architecture"""
     def __init__(self, **kwargs):
         super(Encoder, self).__init__(**kwargs)
 
-    def forward(self, X, *args):
+    def hybrid_forward(self, F, X, *args):
         raise NotImplementedError
 
 class Decoder(nn.Block):
@@ -104,6 +228,10 @@ class Decoder(nn.Block):
     def forward(self, X, state):
         raise NotImplementedError
 
+    def reorder_state(self, state, indices):
+        """Return the state of the batch entries indices, in that order."""
+        raise NotImplementedError
+
 class EncoderDecoder(nn.Block):
     """The base class for the encoder-decoder architecture"""
     def __init__(self, encoder, decoder, **kwargs):
@@ -122,39 +250,52 @@ class Seq2SeqEncoder(Encoder):
         super(Seq2SeqEncoder, self).__init__(**kwargs)
         self.embedding = nn.Embedding(vocab_size, embed_size)
         self.rnn = rnn.LSTM(num_hiddens, num_layers, dropout=dropout)
+        _maybe_hybridize(self)
 
-    def forward(self, X, *args):
+    def hybrid_forward(self, F, X, *args):
         X = self.embedding(X)
         X = X.swapaxes(0, 1)
-        state = self.rnn.begin_state(batch_size=X.shape[1], ctx=X.context)
+        if F is nd:
+            state = self.rnn.begin_state(batch_size=X.shape[1],
+                                         ctx=X.context)
+        else:
+            # The batch size is inferred from X
+            state = self.rnn.begin_state(batch_size=0, func=F.zeros)
         out, state = self.rnn(X, state)
         return out, state
 
-def masked_softmax(X, valid_length):
+def masked_softmax(X, valid_length, F=nd):
+    """Softmax over the last axis of X (batch_size, num_queries, num_keys),
+    masking the keys after valid_length, of shape (batch_size,) or
+    (batch_size, num_queries)."""
     if valid_length is None:
-        return X.softmax()
-    else:
-        shape = X.shape
-        if valid_length.ndim == 1:
-            valid_length = valid_length.repeat(shape[1], axis=0)
-        else:
-            valid_length = valid_length.reshape((-1,))
-        X = nd.SequenceMask(X.reshape((-1, shape[-1])), valid_length, True,
-                            axis=1, value=-1e6)
-        return X.softmax().reshape(shape)
+        return F.softmax(X)
+    # (batch_size, 1) or (batch_size, num_queries), then one per query
+    valid_length = F.broadcast_like(valid_length.reshape((0, -1)),
+                                    F.slice_axis(X, axis=2, begin=0, end=1)
+                                    .reshape((0, 0)))
+    # Mask the rows of (batch_size * num_queries, num_keys)
+    masked = F.SequenceMask(X.reshape((-3, 0)), valid_length.reshape((-1,)),
+                            use_sequence_length=True, axis=1, value=-1e6)
+    return F.softmax(masked).reshape_like(X)
 
-class DotProductAttention(nn.Block):
+class DotProductAttention(nn.HybridBlock):
     def __init__(self, dropout, **kwargs):
         super(DotProductAttention, self).__init__(**kwargs)
         self.dropout = nn.Dropout(dropout)
+        _maybe_hybridize(self)
 
-    def forward(self, query, key, value, valid_length=None):
-        d = query.shape[-1]
-        scores = nd.batch_dot(query, key, transpose_b=True) / math.sqrt(d)
-        attention_weights = self.dropout(masked_softmax(scores, valid_length))
-        return nd.batch_dot(attention_weights, value)
+    def hybrid_forward(self, F, query, key, value, valid_length=None):
+        # Scale by sqrt(d), d = query.shape[-1], without reading the shape
+        d = F.ones_like(F.slice_axis(query, axis=1, begin=0, end=1)).sum(
+            axis=2, keepdims=True)
+        scores = F.broadcast_div(F.batch_dot(query, key, transpose_b=True),
+                                 F.sqrt(d))
+        attention_weights = self.dropout(masked_softmax(scores, valid_length,
+                                                        F))
+        return F.batch_dot(attention_weights, value)
 
-class MLPAttention(nn.Block):
+class MLPAttention(nn.HybridBlock):
     def __init__(self, units, dropout, **kwargs):
         super(MLPAttention, self).__init__(**kwargs)
         self.W_k = nn.Dense(units, activation='tanh',
@@ -163,10 +304,144 @@ class MLPAttention(nn.Block):
                             use_bias=False, flatten=False)
         self.v = nn.Dense(1, use_bias=False, flatten=False)
         self.dropout = nn.Dropout(dropout)
+        _maybe_hybridize(self)
 
-    def forward(self, query, key, value, valid_length):
+    def hybrid_forward(self, F, query, key, value, valid_length):
         query, key = self.W_k(query), self.W_q(key)
-        features = query.expand_dims(axis=2) + key.expand_dims(axis=1)
+        features = F.broadcast_add(query.expand_dims(axis=2),
+                                   key.expand_dims(axis=1))
         scores = self.v(features).squeeze(axis=-1)
-        attention_weights = self.dropout(masked_softmax(scores, valid_length))
-        return nd.batch_dot(attention_weights, value)
+        attention_weights = self.dropout(masked_softmax(scores, valid_length,
+                                                        F))
+        return F.batch_dot(attention_weights, value)
+
+def _chunked_attention(score, query, key, value, valid_length, chunk_size,
+                       dropout):
+    """Attention of query over key and value, chunk_size keys at a time.
+
+    score(query, key) returns the (batch_size, num_queries, num_keys) scores
+    of a chunk of keys. The softmax is streamed over the chunks: the running
+    maximum and sum of every query rescale the output accumulated so far, so
+    that only one chunk of scores exists at a time. The keys after
+    valid_length get the score -1e6, as in masked_softmax.
+    """
+    if valid_length is not None:
+        # (batch_size, 1 or num_queries, 1), compared to the key positions
+        valid_length = valid_length.reshape((query.shape[0], -1, 1))
+    run_max = run_sum = out = None
+    for start in range(0, key.shape[1], chunk_size):
+        end = min(start + chunk_size, key.shape[1])
+        scores = score(query, key[:, start:end])
+        if valid_length is not None:
+            positions = nd.arange(start, end, ctx=scores.context).reshape(
+                (1, 1, -1))
+            mask = nd.broadcast_lesser(positions, valid_length)
+            scores = nd.where(mask.broadcast_like(scores), scores,
+                              nd.ones_like(scores) * -1e6)
+        chunk_max = scores.max(axis=2, keepdims=True)
+        new_max = chunk_max if run_max is None else nd.maximum(run_max,
+                                                               chunk_max)
+        weights = nd.exp(nd.broadcast_sub(scores, new_max))
+        chunk_out = nd.batch_dot(dropout(weights), value[:, start:end])
+        if run_max is None:
+            run_sum = weights.sum(axis=2, keepdims=True)
+            out = chunk_out
+        else:
+            scale = nd.exp(run_max - new_max)
+            run_sum = run_sum * scale + weights.sum(axis=2, keepdims=True)
+            out = nd.broadcast_mul(out, scale) + chunk_out
+        run_max = new_max
+    return nd.broadcast_div(out, run_sum)
+
+class ChunkedDotProductAttention(DotProductAttention):
+    """DotProductAttention over chunks of keys, holding at most about
+    memory_budget bytes of scores at a time."""
+    def __init__(self, dropout, memory_budget=2 ** 26, **kwargs):
+        super(ChunkedDotProductAttention, self).__init__(dropout, **kwargs)
+        self.memory_budget = memory_budget
+
+    def forward(self, query, key, value, valid_length=None):
+        d = query.shape[-1]
+        def score(query, key):
+            return nd.batch_dot(query, key, transpose_b=True) / math.sqrt(d)
+        # Scores and weights of a chunk, in float32
+        bytes_per_key = 2 * query.shape[0] * query.shape[1] * 4
+        chunk_size = max(1, int(self.memory_budget // bytes_per_key))
+        return _chunked_attention(score, query, key, value, valid_length,
+                                  chunk_size, self.dropout)
+
+class ChunkedMLPAttention(MLPAttention):
+    """MLPAttention over chunks of keys, holding at most about
+    memory_budget bytes of (batch_size, num_queries, keys, units) features
+    at a time instead of the features of all keys."""
+    def __init__(self, units, dropout, memory_budget=2 ** 26, **kwargs):
+        super(ChunkedMLPAttention, self).__init__(units, dropout, **kwargs)
+        self.memory_budget = memory_budget
+
+    def forward(self, query, key, value, valid_length=None):
+        query, key = self.W_k(query), self.W_q(key)
+        def score(query, key):
+            features = nd.broadcast_add(query.expand_dims(axis=2),
+                                        key.expand_dims(axis=1))
+            return self.v(features).squeeze(axis=-1)
+        bytes_per_key = query.shape[0] * query.shape[1] * query.shape[2] * 4
+        chunk_size = max(1, int(self.memory_budget // bytes_per_key))
+        return _chunked_attention(score, query, key, value, valid_length,
+                                  chunk_size, self.dropout)
+
+class Seq2SeqDecoder(Decoder):
+    def __init__(self, vocab_size, embed_size, num_hiddens, num_layers,
+                 dropout=0, **kwargs):
+        super(Seq2SeqDecoder, self).__init__(**kwargs)
+        self.embedding = nn.Embedding(vocab_size, embed_size)
+        self.rnn = rnn.LSTM(num_hiddens, num_layers, dropout=dropout)
+        self.dense = nn.Dense(vocab_size, flatten=False)
+
+    def init_state(self, enc_outputs, *args):
+        return enc_outputs[1]
+
+    def forward(self, X, state):
+        X = self.embedding(X).swapaxes(0, 1)
+        out, state = self.rnn(X, state)
+        out = self.dense(out).swapaxes(0, 1)
+        return out, state
+
+    def reorder_state(self, state, indices):
+        # The LSTM states are (num_layers, batch_size, num_hiddens)
+        return [s.take(indices, axis=1) for s in state]
+
+class Seq2SeqAttentionDecoder(Decoder):
+    def __init__(self, vocab_size, embed_size, num_hiddens, num_layers,
+                 dropout=0, **kwargs):
+        super(Seq2SeqAttentionDecoder, self).__init__(**kwargs)
+        self.attention_cell = MLPAttention(num_hiddens, dropout)
+        self.embedding = nn.Embedding(vocab_size, embed_size)
+        self.rnn = rnn.LSTM(num_hiddens, num_layers, dropout=dropout)
+        self.dense = nn.Dense(vocab_size, flatten=False)
+
+    def init_state(self, enc_outputs, enc_valid_length, *args):
+        outputs, hidden_state = enc_outputs
+        # Transpose outputs to (batch_size, seq_len, num_hiddens)
+        return (outputs.swapaxes(0, 1), hidden_state, enc_valid_length)
+
+    def forward(self, X, state):
+        enc_outputs, hidden_state, enc_valid_length = state
+        X = self.embedding(X).swapaxes(0, 1)
+        outputs = []
+        for x in X:
+            # query shape: (batch_size, 1, num_hiddens)
+            query = hidden_state[0][-1].expand_dims(axis=1)
+            context = self.attention_cell(query, enc_outputs, enc_outputs,
+                                          enc_valid_length)
+            x = nd.concat(context, x.expand_dims(axis=1), dim=-1)
+            out, hidden_state = self.rnn(x.swapaxes(0, 1), hidden_state)
+            outputs.append(out)
+        outputs = self.dense(nd.concat(*outputs, dim=0))
+        return outputs.swapaxes(0, 1), [enc_outputs, hidden_state,
+                                        enc_valid_length]
+
+    def reorder_state(self, state, indices):
+        enc_outputs, hidden_state, enc_valid_length = state
+        return [enc_outputs.take(indices, axis=0),
+                [s.take(indices, axis=1) for s in hidden_state],
+                enc_valid_length.take(indices, axis=0)]
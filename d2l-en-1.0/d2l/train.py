@@ -6,15 +6,15 @@ import time
 import mxnet as mx
 from mxnet import autograd, gluon, init, nd
 from mxnet.gluon import data as gdata, loss as gloss, nn, utils as gutils
-from .data import data_iter_consecutive, data_iter_random
+from .data import seq_iter_consecutive, seq_iter_random
 from .base import try_gpu
-from .figure import set_figsize, plt
 from .model import linreg
 
-__all__ = ['evaluate_accuracy', 'squared_loss', 'grad_clipping', 'grad_clipping_gluon', 'sgd', 'train',
+__all__ = ['Accumulator', 'evaluate_accuracy', 'squared_loss', 'grad_clipping', 'grad_clipping_gluon', 'sgd', 'sgd_fused', 'train',
            'train_2d', 'train_and_predict_rnn', 'train_and_predict_rnn_gluon',
            'train_ch3', 'train_ch5', 'train_ch9', 'train_gluon_ch9',
-           'predict_sentiment', 'train_ch7', 'translate_ch7']
+           'predict_sentiment', 'train_ch7', 'translate_ch7',
+           'translate_beam_ch7', 'predict_rnn_batch', 'predict_rnn_gluon_batch']
 
 def _get_batch(batch, ctx):
     """Return features and labels on ctx."""
@@ -24,19 +24,60 @@ def _get_batch(batch, ctx):
     return (gutils.split_and_load(features, ctx),
             gutils.split_and_load(labels, ctx), features.shape[0])
 
+class Accumulator(object):
+    """Running sums of n metrics.
+
+    NDArray values are summed on their own device and only copied to the
+    host when the sums are read, so that adding them does not wait for the
+    computation behind them. Python numbers are summed on the host.
+    """
+    def __init__(self, n):
+        self.n = n
+        self.reset()
+
+    def reset(self):
+        self._host = [0.0] * self.n
+        self._device = {}
+
+    def add(self, *values):
+        for i, value in enumerate(values):
+            if isinstance(value, nd.NDArray):
+                if value.size != 1:
+                    value = value.sum()
+                key = (i, value.context)
+                if key in self._device:
+                    self._device[key] += value.reshape((1,))
+                else:
+                    self._device[key] = value.reshape((1,)).copy()
+            else:
+                self._host[i] += value
+
+    def result(self):
+        """Return the n sums as Python floats."""
+        sums = list(self._host)
+        if self._device:
+            keys = list(self._device)
+            device = nd.concat(*[self._device[k].as_in_context(mx.cpu())
+                                 for k in keys], dim=0).asnumpy()
+            for (i, _), value in zip(keys, device):
+                sums[i] += float(value)
+        return sums
+
+    def __getitem__(self, i):
+        return self.result()[i]
+
 def evaluate_accuracy(data_iter, net, ctx=[mx.cpu()]):
     """Evaluate accuracy of a model on the given data set."""
     if isinstance(ctx, mx.Context):
         ctx = [ctx]
-    acc_sum, n = nd.array([0]), 0
+    metric = Accumulator(2)  # correct predictions, number of examples
     for batch in data_iter:
         features, labels, _ = _get_batch(batch, ctx)
         for X, y in zip(features, labels):
             y = y.astype('float32')
-            acc_sum += (net(X).argmax(axis=1) == y).sum().copyto(mx.cpu())
-            n += y.size
-        acc_sum.wait_to_read()
-    return acc_sum.asscalar() / n
+            metric.add((net(X).argmax(axis=1) == y).sum(), y.size)
+    acc_sum, n = metric.result()
+    return acc_sum / n
 
 def squared_loss(y_hat, y):
     """Squared loss."""
@@ -44,13 +85,15 @@ def squared_loss(y_hat, y):
 
 def grad_clipping(params, theta, ctx):
     """Clip the gradient."""
-    norm = nd.array([0], ctx)
+    # The norm and the clip factor stay on the device, so that clipping
+    # does not wait for the backward pass
+    norm = nd.add_n(*[(param.grad ** 2).sum() for param in params]).sqrt()
+    # theta / norm if norm > theta else 1, in float64 as a Python scalar is
+    factor = (theta / nd.maximum(norm.astype('float64'), theta)).astype(
+        norm.dtype)
     for param in params:
-        norm += (param.grad ** 2).sum()
-    norm = norm.sqrt().asscalar()
-    if norm > theta:
-        for param in params:
-            param.grad[:] *= theta / norm
+        nd.broadcast_mul(param.grad, factor.reshape((1,) * param.ndim),
+                         out=param.grad)
 
 def grad_clipping_gluon(model, theta, ctx):
     """Clip the gradient for a Gluon model."""
@@ -62,13 +105,42 @@ def sgd(params, lr, batch_size):
     for param in params:
         param[:] = param - lr * param.grad / batch_size
 
+# The multi-tensor update kernels take at most 60 weights per call
+_MULTI_TENSOR_SIZE = 60
+
+def sgd_fused(params, lr, batch_size):
+    """Mini-batch stochastic gradient descent, updating the parameters in
+    place with fused update kernels.
+
+    Gives the same results as sgd when batch_size is a power of two,
+    otherwise they can differ in the last bit since the gradient is
+    multiplied by 1 / batch_size instead of divided by batch_size.
+    """
+    if params[0].context.device_type != 'gpu':
+        # On CPU the multi-tensor kernel visits every weight for every index
+        # of the largest one, one kernel per weight is faster
+        for param in params:
+            nd.sgd_update(param, param.grad, lr=lr, wd=0,
+                          rescale_grad=1. / batch_size, out=param)
+        return
+    for i in range(0, len(params), _MULTI_TENSOR_SIZE):
+        chunk = params[i:i + _MULTI_TENSOR_SIZE]
+        args = [a for param in chunk for a in (param, param.grad)]
+        nd.multi_sgd_update(*args, lrs=(lr,) * len(chunk),
+                            wds=(0.,) * len(chunk),
+                            rescale_grad=1. / batch_size,
+                            num_weights=len(chunk), out=chunk)
+
 def train(train_iter, test_iter, net, loss, trainer, ctx, num_epochs):
     """Train and evaluate a model."""
     print('training on', ctx)
     if isinstance(ctx, mx.Context):
         ctx = [ctx]
+    # loss sum, correct predictions, number of losses, number of examples
+    metric = Accumulator(4)
     for epoch in range(num_epochs):
-        train_l_sum, train_acc_sum, n, m, start = 0.0, 0.0, 0, 0, time.time()
+        metric.reset()
+        start = time.time()
         for i, batch in enumerate(train_iter):
             Xs, ys, batch_size = _get_batch(batch, ctx)
             ls = []
@@ -78,11 +150,10 @@ def train(train_iter, test_iter, net, loss, trainer, ctx, num_epochs):
             for l in ls:
                 l.backward()
             trainer.step(batch_size)
-            train_l_sum += sum([l.sum().asscalar() for l in ls])
-            n += sum([l.size for l in ls])
-            train_acc_sum += sum([(y_hat.argmax(axis=1) == y).sum().asscalar()
-                                  for y_hat, y in zip(y_hats, ys)])
-            m += sum([y.size for y in ys])
+            for l, y_hat, y in zip(ls, y_hats, ys):
+                metric.add(l.sum(), (y_hat.argmax(axis=1) == y).sum(),
+                           l.size, y.size)
+        train_l_sum, train_acc_sum, n, m = metric.result()
         test_acc = evaluate_accuracy(test_iter, net, ctx)
         print('epoch %d, loss %.4f, train acc %.3f, test acc %.3f, '
               'time %.1f sec'
@@ -107,9 +178,9 @@ def train_and_predict_rnn(rnn, get_params, init_rnn_state, num_hiddens,
                           batch_size, prefixes):
     """Train an RNN model and predict the next item in the sequence."""
     if is_random_iter:
-        data_iter_fn = data_iter_random
+        data_iter_fn = seq_iter_random
     else:
-        data_iter_fn = data_iter_consecutive
+        data_iter_fn = seq_iter_consecutive
     params = get_params()
     loss = gloss.SoftmaxCrossEntropyLoss()
     start = time.time()
@@ -146,7 +217,7 @@ def train_and_predict_rnn(rnn, get_params, init_rnn_state, num_hiddens,
                 l = loss(outputs, y).mean()
             l.backward()
             grad_clipping(params, clipping_theta, ctx)  # Clip the gradient
-            sgd(params, lr, 1)
+            sgd_fused(params, lr, 1)
             # Since the error is the mean, no need to average gradients here
             l_sum += l.asscalar() * y.size
             n += y.size
@@ -155,10 +226,10 @@ def train_and_predict_rnn(rnn, get_params, init_rnn_state, num_hiddens,
                 epoch, math.exp(l_sum / n), time.time() - start))
             start = time.time()
         if epoch % (num_epochs // 2) == 0:
-            for prefix in prefixes:
-                print(' -',  predict_rnn(prefix, 50, rnn, params,
-                                         init_rnn_state, num_hiddens,
-                                         vocab, ctx))
+            for output in predict_rnn_batch(prefixes, 50, rnn, params,
+                                            init_rnn_state, num_hiddens,
+                                            vocab, ctx):
+                print(' -', output)
 
 
 def train_and_predict_rnn_gluon(model, num_hiddens, corpus_indices, vocab,
@@ -172,7 +243,7 @@ def train_and_predict_rnn_gluon(model, num_hiddens, corpus_indices, vocab,
     start = time.time()
     for epoch in range(1, num_epochs+1):
         l_sum, n = 0.0, 0
-        data_iter = data_iter_consecutive(
+        data_iter = seq_iter_consecutive(
             corpus_indices, batch_size, num_steps, ctx)
         state = model.begin_state(batch_size=batch_size, ctx=ctx)
         for X, Y in data_iter:
@@ -196,15 +267,17 @@ def train_and_predict_rnn_gluon(model, num_hiddens, corpus_indices, vocab,
                 epoch, math.exp(l_sum / n), time.time() - start))
             start = time.time()
         if epoch % (num_epochs // 2) == 0:
-            for prefix in prefixes:
-                print(' -', predict_rnn_gluon(prefix, 50, model, vocab, ctx))
+            for output in predict_rnn_gluon_batch(prefixes, 50, model, vocab,
+                                                  ctx):
+                print(' -', output)
 
 
 def train_ch3(net, train_iter, test_iter, loss, num_epochs, batch_size,
               params=None, lr=None, trainer=None):
     """Train and evaluate a model with CPU."""
+    metric = Accumulator(3)  # loss sum, correct predictions, examples
     for epoch in range(num_epochs):
-        train_l_sum, train_acc_sum, n = 0.0, 0.0, 0
+        metric.reset()
         for X, y in train_iter:
             with autograd.record():
                 y_hat = net(X)
@@ -215,9 +288,8 @@ def train_ch3(net, train_iter, test_iter, loss, num_epochs, batch_size,
             else:
                 trainer.step(batch_size)
             y = y.astype('float32')
-            train_l_sum += l.asscalar()
-            train_acc_sum += (y_hat.argmax(axis=1) == y).sum().asscalar()
-            n += y.size
+            metric.add(l, (y_hat.argmax(axis=1) == y).sum(), y.size)
+        train_l_sum, train_acc_sum, n = metric.result()
         test_acc = evaluate_accuracy(test_iter, net)
         print('epoch %d, loss %.4f, train acc %.3f, test acc %.3f'
               % (epoch + 1, train_l_sum / n, train_acc_sum / n, test_acc))
@@ -228,8 +300,10 @@ def train_ch5(net, train_iter, test_iter, batch_size, trainer, ctx,
     """Train and evaluate a model with CPU or GPU."""
     print('training on', ctx)
     loss = gloss.SoftmaxCrossEntropyLoss()
+    metric = Accumulator(3)  # loss sum, correct predictions, examples
     for epoch in range(num_epochs):
-        train_l_sum, train_acc_sum, n, start = 0.0, 0.0, 0, time.time()
+        metric.reset()
+        start = time.time()
         for X, y in train_iter:
             X, y = X.as_in_context(ctx), y.as_in_context(ctx)
             with autograd.record():
@@ -238,9 +312,8 @@ def train_ch5(net, train_iter, test_iter, batch_size, trainer, ctx,
             l.backward()
             trainer.step(batch_size)
             y = y.astype('float32')
-            train_l_sum += l.asscalar()
-            train_acc_sum += (y_hat.argmax(axis=1) == y).sum().asscalar()
-            n += y.size
+            metric.add(l, (y_hat.argmax(axis=1) == y).sum(), y.size)
+        train_l_sum, train_acc_sum, n = metric.result()
         test_acc = evaluate_accuracy(test_iter, net, ctx)
         print('epoch %d, loss %.4f, train acc %.3f, test acc %.3f, '
               'time %.1f sec'
@@ -248,6 +321,14 @@ def train_ch5(net, train_iter, test_iter, batch_size, trainer, ctx,
                  time.time() - start))
 
 
+def _plot_loss(ls, num_epochs):
+    # matplotlib is only imported when something is plotted
+    from .figure import set_figsize, plt
+    set_figsize()
+    plt.plot(np.linspace(0, num_epochs, len(ls)), ls)
+    plt.xlabel('epoch')
+    plt.ylabel('loss')
+
 def train_ch9(trainer_fn, states, hyperparams, features, labels, batch_size=10,
               num_epochs=2):
     """Train a linear regression model."""
@@ -273,10 +354,7 @@ def train_ch9(trainer_fn, states, hyperparams, features, labels, batch_size=10,
             if (batch_i + 1) * batch_size % 100 == 0:
                 ls.append(eval_loss())
     print('loss: %f, %f sec per epoch' % (ls[-1], time.time() - start))
-    set_figsize()
-    plt.plot(np.linspace(0, num_epochs, len(ls)), ls)
-    plt.xlabel('epoch')
-    plt.ylabel('loss')
+    _plot_loss(ls, num_epochs)
 
 
 def train_gluon_ch9(trainer_name, trainer_hyperparams, features, labels,
@@ -305,10 +383,7 @@ def train_gluon_ch9(trainer_name, trainer_hyperparams, features, labels,
             if (batch_i + 1) * batch_size % 100 == 0:
                 ls.append(eval_loss())
     print('loss: %f, %f sec per epoch' % (ls[-1], time.time() - start))
-    set_figsize()
-    plt.plot(np.linspace(0, num_epochs, len(ls)), ls)
-    plt.xlabel('epoch')
-    plt.ylabel('loss')
+    _plot_loss(ls, num_epochs)
 
 def to_onehot(X, size):
     return [nd.one_hot(x, size) for x in X.T]
@@ -351,6 +426,113 @@ def predict_rnn_gluon(prefix, num_chars, model, vocab, ctx):
             output.append(int(Y.argmax(axis=1).asscalar()))
     return ''.join([vocab.idx_to_token[i] for i in output])
 
+def _per_stream(value, n, ctx):
+    """A scalar or per-stream sampling parameter as a (n,) array on ctx."""
+    return nd.array(np.broadcast_to(np.asarray(value, dtype=np.float32),
+                                    (n,)), ctx=ctx)
+
+def _sample_tokens(Y, temperature, top_k, top_p):
+    """Draw the next token of every stream from the logits Y (n, vocab),
+    greedily where temperature is 0, on the device."""
+    greedy = Y.argmax(axis=1)
+    logits = nd.broadcast_div(Y, nd.maximum(temperature, 1e-6).reshape(
+        (-1, 1)))
+    sorted_logits = nd.sort(logits, axis=1, is_ascend=False)
+    # Top-k: drop all but the k best, then nucleus: keep the best tokens
+    # until their probability reaches top_p
+    positions = nd.arange(Y.shape[1], ctx=Y.context).reshape((1, -1))
+    in_top_k = nd.broadcast_lesser(positions, top_k.reshape((-1, 1)))
+    probs = nd.softmax(nd.where(in_top_k, sorted_logits,
+                                nd.ones_like(sorted_logits) * -1e9))
+    mass_before = nd.cumsum(probs, axis=1) - probs
+    in_nucleus = nd.broadcast_lesser(mass_before, top_p.reshape((-1, 1)))
+    num_kept = nd.where(top_p >= 1, top_k, (in_top_k * in_nucleus).sum(
+        axis=1))
+    threshold = sorted_logits.pick(num_kept - 1, axis=1, keepdims=True)
+    logits = nd.where(nd.broadcast_greater_equal(logits, threshold), logits,
+                      nd.ones_like(logits) * -1e9)
+    sampled = nd.random.multinomial(nd.softmax(logits)).astype('float32')
+    return nd.where(temperature > 0, sampled, greedy)
+
+def _generate(forward, state, batch_axis, prefixes, num_chars, vocab, ctx,
+              temperature, top_k, top_p, copy_every):
+    """Generate num_chars tokens after every prefix, all streams at once.
+
+    forward(X, state) runs the model on the (n, num_steps) tokens X and
+    returns the logits of the last step and the new state, whose arrays
+    have the batch on batch_axis.
+    """
+    n, vocab_size = len(prefixes), len(vocab)
+    temperature = _per_stream(temperature, n, ctx)
+    top_k = _per_stream(top_k, n, ctx)
+    top_k = nd.where(top_k > 0, top_k, nd.ones_like(top_k) * vocab_size)
+    top_p = _per_stream(top_p, n, ctx)
+
+    prefix_tokens = [[vocab[c] for c in prefix] for prefix in prefixes]
+    lengths = [len(t) for t in prefix_tokens]
+    num_steps = max(lengths)
+    X = nd.array([t + [0] * (num_steps - len(t)) for t in prefix_tokens],
+                 ctx=ctx)
+    if min(lengths) == num_steps:
+        Y, state = forward(X, state)
+    else:
+        # A stream's state and logits stop changing after its prefix ends
+        valid = nd.array(lengths, ctx=ctx)
+        shape = [1] * state[0].ndim
+        shape[batch_axis] = n
+        for t in range(num_steps):
+            Y_t, state_t = forward(X[:, t:t + 1], state)
+            mask = (valid > t)
+            Y = Y_t if t == 0 else nd.where(mask, Y_t, Y)
+            state = [nd.where(mask.reshape(shape).broadcast_like(new), new,
+                              old) for new, old in zip(state_t, state)]
+
+    chunks, tokens = [], []
+    for t in range(num_chars):
+        token = _sample_tokens(Y, temperature, top_k, top_p)
+        tokens.append(token)
+        if len(tokens) == copy_every or t == num_chars - 1:
+            chunks.append(nd.stack(*tokens, axis=1).asnumpy())
+            tokens = []
+        if t < num_chars - 1:
+            Y, state = forward(token.reshape((-1, 1)), state)
+    outputs = np.concatenate(chunks, axis=1).astype(np.int64)
+    return [''.join([vocab.idx_to_token[i] for i in prefix + row.tolist()])
+            for prefix, row in zip(prefix_tokens, outputs)]
+
+def predict_rnn_batch(prefixes, num_chars, rnn, params, init_rnn_state,
+                      num_hiddens, vocab, ctx, temperature=0, top_k=0,
+                      top_p=1.0, copy_every=10):
+    """Predict next chars after several prefixes at once with a RNN model
+
+    The prefixes may have different lengths. temperature, top_k and top_p
+    may be given per prefix: a temperature of 0 picks the most likely char
+    as predict_rnn does, otherwise the char is sampled from the softmax of
+    the outputs divided by temperature, restricted to the top_k most likely
+    chars (0 for all) and to the most likely chars of cumulated probability
+    top_p. The chars are copied to the host every copy_every steps.
+    """
+    def forward(X, state):
+        outputs, state = rnn(to_onehot(X, len(vocab)), state, params)
+        return outputs[-1], state
+    state = init_rnn_state(len(prefixes), num_hiddens, ctx)
+    return _generate(forward, state, 0, prefixes, num_chars, vocab, ctx,
+                     temperature, top_k, top_p, copy_every)
+
+def predict_rnn_gluon_batch(prefixes, num_chars, model, vocab, ctx,
+                            temperature=0, top_k=0, top_p=1.0,
+                            copy_every=10):
+    """Predict next chars after several prefixes at once with a Gluon RNN
+    model, see predict_rnn_batch"""
+    def forward(X, state):
+        Y, state = model(X, state)
+        # Y is (num_steps * batch_size, vocab_size), keep the last step
+        return Y[-X.shape[0]:], state
+    state = model.begin_state(batch_size=len(prefixes), ctx=ctx)
+    # The states of Gluon RNN layers are (num_layers, batch_size, ...)
+    return _generate(forward, state, 1, prefixes, num_chars, vocab, ctx,
+                     temperature, top_k, top_p, copy_every)
+
 def predict_sentiment(net, vocab, sentence):
     """Predict the sentiment of a given sentence."""
     sentence = nd.array(vocab[sentence.split()], ctx=try_gpu())
@@ -358,7 +540,11 @@ def predict_sentiment(net, vocab, sentence):
     return 'positive' if label.asscalar() == 1 else 'negative'
 
 def train_ch7(model, data_iter, lr, num_epochs, ctx):
-    """Train an encoder-encoder model"""
+    """Train an encoder-encoder model
+
+    data_iter may give batches of any length, e.g. the trimmed batches of
+    load_data_nmt_bucketed; the loss is averaged over the valid tokens.
+    """
     model.initialize(init.Xavier(), force_reinit=True, ctx=ctx)
     trainer = gluon.Trainer(model.collect_params(),
                             'adam', {'learning_rate': lr})
@@ -379,8 +565,9 @@ def train_ch7(model, data_iter, lr, num_epochs, ctx):
             l_sum += l.sum().asscalar()
             num_tokens_sum += num_tokens
         if epoch % (num_epochs // 4) == 0:
-            print("epoch %d, loss %.3f, time %.1f sec" % (
-                epoch, l_sum/num_tokens_sum, time.time()-tic))
+            elapsed = time.time() - tic
+            print("epoch %d, loss %.3f, %.0f tokens/sec, time %.1f sec" % (
+                epoch, l_sum/num_tokens_sum, num_tokens_sum/elapsed, elapsed))
             tic = time.time()
 
 def translate_ch7(model, src_sentence, src_vocab, tgt_vocab, max_len, ctx):
@@ -404,8 +591,84 @@ def translate_ch7(model, src_sentence, src_vocab, tgt_vocab, max_len, ctx):
         predict_tokens.append(py)
     return ' '.join(tgt_vocab.to_tokens(predict_tokens))
 
+def translate_beam_ch7(model, src_sentences, src_vocab, tgt_vocab, max_len,
+                       ctx, beam_size=4, length_penalty=0.6):
+    """Translate a batch of sentences with beam search
+
+    The beam_size hypotheses of every sentence are decoded together, as one
+    batch of len(src_sentences) * beam_size whose decoder states are
+    reordered with model.decoder.reorder_state after every step. A
+    hypothesis ending with <eos> is finished: it keeps its score and only
+    grows by <eos>. Hypotheses are ranked by their log-likelihood divided
+    by ((5 + length) / 6) ** length_penalty. All the work stays on ctx and
+    the translations are copied to the host once at the end.
+    """
+    batch_size, vocab_size = len(src_sentences), len(tgt_vocab)
+    src_tokens = [src_vocab[s.lower().split(' ')] for s in src_sentences]
+    src_len = max(max(len(t) for t in src_tokens), max_len)
+    enc_X = nd.array([t + [src_vocab.pad] * (src_len - len(t))
+                      for t in src_tokens], ctx=ctx)
+    enc_valid_length = nd.array([len(t) for t in src_tokens], ctx=ctx)
+    enc_outputs = model.encoder(enc_X, enc_valid_length)
+    dec_state = model.decoder.init_state(enc_outputs, enc_valid_length)
+    # Entry b * beam_size + k of the batch is hypothesis k of sentence b
+    dec_state = model.decoder.reorder_state(
+        dec_state, nd.arange(batch_size, repeat=beam_size, ctx=ctx))
+
+    # Only the first hypothesis of every sentence is alive at the start
+    scores = nd.full((batch_size, beam_size), -1e9, ctx=ctx)
+    scores[:, 0] = 0
+    lengths = nd.zeros((batch_size, beam_size), ctx=ctx)
+    finished = nd.zeros((batch_size * beam_size,), ctx=ctx)
+    tokens = nd.full((batch_size * beam_size, 1), tgt_vocab.bos, ctx=ctx)
+    # Log-probabilities of a finished hypothesis: only <eos> again, for free
+    eos_only = nd.one_hot(nd.array([tgt_vocab.eos], ctx=ctx), vocab_size,
+                          on_value=0, off_value=-1e9)
+    # Candidate indices go up to batch_size * beam_size * vocab_size, past
+    # the integers float32 holds exactly, so index arithmetic is in int64
+    offsets = nd.arange(batch_size, ctx=ctx, dtype='int64').reshape(
+        (-1, 1)) * beam_size
+    for _ in range(max_len):
+        Y, dec_state = model.decoder(tokens[:, -1:], dec_state)
+        log_probs = Y[:, 0].log_softmax()
+        log_probs = nd.where(finished, nd.broadcast_like(eos_only, log_probs),
+                             log_probs)
+        cand_scores = (scores.reshape((-1, 1)) + log_probs).reshape(
+            (batch_size, -1))
+        cand_lengths = (lengths.reshape((-1, 1)) + 1 - finished.reshape(
+            (-1, 1))).broadcast_to((batch_size * beam_size, vocab_size))
+        penalty = ((5 + cand_lengths.reshape((batch_size, -1))) / 6) ** \
+            length_penalty
+        best = nd.topk(cand_scores / penalty, axis=1, k=beam_size,
+                       dtype='int64')
+        # Integer division, the indices are not negative
+        beam = best / vocab_size
+        token = (best - beam * vocab_size).astype('float32')
+        src = (beam + offsets).reshape((-1,))
+        flat = (best + offsets * vocab_size).reshape((-1,))
+        scores = cand_scores.reshape((-1,)).take(flat).reshape(
+            (batch_size, beam_size))
+        lengths = cand_lengths.reshape((-1,)).take(flat).reshape(
+            (batch_size, beam_size))
+        tokens = nd.concat(tokens.take(src), token.reshape((-1, 1)), dim=1)
+        finished = finished.take(src)
+        finished = nd.maximum(finished, token.reshape((-1,)) == tgt_vocab.eos)
+        dec_state = model.decoder.reorder_state(dec_state, src)
+
+    # topk keeps the hypotheses sorted, the best one is the first
+    best = tokens.reshape((batch_size, beam_size, -1))[:, 0, 1:]
+    # Drop the <eos> of the finished ones
+    best_lengths = lengths[:, 0:1] - finished.reshape((batch_size, -1))[:, 0:1]
+    out = nd.concat(best_lengths, best, dim=1).asnumpy().astype('int64')
+    return [' '.join(tgt_vocab.to_tokens(row[1:1 + row[0]].tolist()))
+            for row in out]
+
 class MaskedSoftmaxCELoss(gloss.SoftmaxCELoss):
+    """Softmax cross-entropy loss summed over the first valid_length steps
+    of every sequence, whatever the padded length of the batch."""
     def forward(self, pred, label, valid_length):
         weights = nd.ones_like(label).expand_dims(axis=-1)
         weights = nd.SequenceMask(weights, valid_length, True, axis=1)
-        return super(MaskedSoftmaxCELoss, self).forward(pred, label, weights)
+        # SoftmaxCELoss averages over the steps, padding included
+        l = super(MaskedSoftmaxCELoss, self).forward(pred, label, weights)
+        return l * label.shape[1]
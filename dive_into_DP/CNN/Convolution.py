@@ -1,13 +1,8 @@
 from mxnet import autograd,nd
 from mxnet.gluon import nn
 
-def corr2d(x,k):
-    h,w = k.shape
-    y = nd.zeros((x.shape[0]-h+1,x.shape[1]-w+1))
-    for i in range(y.shape[0]):
-        for j in range(y.shape[1]):
-            y[i,j] = (x[i:i+h,j:j+w]*k).sum()
-    return y
+#逐像素循环的版本每个输出都要切片再sum，改用Tools里im2col的一次矩阵乘法
+from Tools import corr2d
 
 #和x=[[0,1,2],[3,4,5],[6,7,8]]有一个存储的功能
 x = nd.array([[0,1,2],[3,4,5],[6,7,8]])
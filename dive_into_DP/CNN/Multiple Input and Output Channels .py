@@ -1,8 +1,8 @@
 from mxnet import nd
 import Tools
 
-def corr2d_multi_in(X,K):
-    return nd.add_n(*[Tools.corr2d(x,k) for x,k in zip(X,K)])
+#所有输入通道的窗口拼成一个矩阵，一次矩阵乘法同时完成相关和通道求和
+corr2d_multi_in = Tools.corr2d_multi_in
 
 X = nd.array([[[0, 1, 2], [3, 4, 5], [6, 7, 8]],[[1, 2, 3], [4, 5, 6], [7, 8, 9]]])
     
@@ -10,8 +10,7 @@ K = nd.array([[[0, 1], [2, 3]], [[1, 2], [3, 4]]])
 
 corr2d_multi_in(X, K)
 
-def corr2d_multi_in_out(X,K):
-    return nd.stack(*[corr2d_multi_in(X,k) for k in K])
+corr2d_multi_in_out = Tools.corr2d_multi_in_out
 
 K = nd.stack(K,K+1,K+2)
 
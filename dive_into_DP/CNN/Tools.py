@@ -1,4 +1,5 @@
 import mxnet as mx
+import numpy as np
 from mxnet import nd
 from mxnet.gluon import data as gdata,loss as gloss
 from mxnet import autograd,nd
@@ -45,13 +46,48 @@ def try_gpu():
         ctx = mx.cpu()
     return ctx
 
-def corr2d(x,k):
-    h,w = k.shape
-    y = nd.zeros((x.shape[0]-h+1,x.shape[1]-w+1))
-    for i in range(y.shape[0]):
-        for j in range(y.shape[1]):
-            y[i,j] = (x[i:i+h,j:j+w]*k).sum()
-    return y
+def _pair(x):
+    return (x,x) if isinstance(x,int) else tuple(x)
+
+def im2col(X,kernel_size,stride=1,padding=0,pad_value=0):
+    #把(n,h,w)输入的所有窗口一次取出，得到(n,k_h*k_w,out_h*out_w)，不用逐像素循环
+    (k_h,k_w),(s_h,s_w),(p_h,p_w) = _pair(kernel_size),_pair(stride),_pair(padding)
+    n,h,w = X.shape
+    out_h,out_w = (h+2*p_h-k_h)//s_h+1,(w+2*p_w-k_w)//s_w+1
+    rows = np.arange(k_h)[:,None,None,None]+s_h*np.arange(out_h)[:,None]-p_h
+    cols = np.arange(k_w)[:,None,None]+s_w*np.arange(out_w)-p_w
+    index = rows*w+cols
+    #落在填充上的位置指向最后补的那一列pad_value
+    outside = (rows<0)|(rows>=h)|(cols<0)|(cols>=w)
+    index = np.where(outside,h*w,index).reshape((k_h*k_w,out_h*out_w))
+    if isinstance(X,np.ndarray):
+        X = np.concatenate([X.reshape((n,h*w)),np.full((n,1),pad_value,X.dtype)],axis=1)
+        return X[:,index],(out_h,out_w)
+    X = nd.concat(X.reshape((n,h*w)),nd.full((n,1),pad_value,ctx=X.context,dtype=X.dtype),dim=1)
+    return nd.take(X,nd.array(index,ctx=X.context),axis=1),(out_h,out_w)
+
+def _dot(a,b):
+    return np.dot(a,b) if isinstance(a,np.ndarray) else nd.dot(a,b)
+
+def corr2d_multi_in_out(X,K,stride=1,padding=0):
+    #X:(c_i,h,w),K:(c_o,c_i,k_h,k_w)，一次矩阵乘法
+    c_o,c_i,k_h,k_w = K.shape
+    cols,(out_h,out_w) = im2col(X,(k_h,k_w),stride,padding)
+    Y = _dot(K.reshape((c_o,-1)),cols.reshape((c_i*k_h*k_w,-1)))
+    return Y.reshape((c_o,out_h,out_w))
+
+def corr2d_multi_in(X,K,stride=1,padding=0):
+    return corr2d_multi_in_out(X,K.reshape((1,)+K.shape),stride,padding)[0]
+
+def corr2d(x,k,stride=1,padding=0):
+    return corr2d_multi_in(x.reshape((1,)+x.shape),k.reshape((1,)+k.shape),stride,padding)
+
+def pool2d(X,pool_size,mode='max',stride=1,padding=0):
+    #最大池化忽略填充，平均池化把填充当作0，和nn.MaxPool2D/nn.AvgPool2D一致
+    pad_value = -np.inf if mode == 'max' else 0
+    cols,out_shape = im2col(X.reshape((-1,)+X.shape[-2:]),pool_size,stride,padding,pad_value)
+    Y = cols.max(axis=1) if mode == 'max' else cols.mean(axis=1)
+    return Y.reshape(X.shape[:-2]+out_shape)
 
 def load_data_fashion_mnist(batch_size, resize=None, root=os.path.join(
         '~', '.mxnet', 'datasets', 'fashion-mnist')):